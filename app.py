@@ -1,9 +1,5 @@
 import streamlit as st
-import requests
-import re
-import html
 import json
-from datetime import datetime
 
 from components.sidebar import render_sidebar
 from components.document_viewer import render_document_viewer
@@ -11,163 +7,52 @@ from components.clinician_prompts import render_clinician_prompts
 from components.note_generator import render_note_generator
 from components.patient_context import render_patient_context
 from data.sample_data import get_sample_patient
+from utils.fhir_client import get_fhir_client
+from utils.patient_model import fhir_patient_id, patient_from_fhir
+from utils.lab_store import get_lab_store
 
-# Helper function to sanitize text values
-def sanitize_text(text):
-    """Thoroughly sanitize any text by removing HTML tags and escaping content"""
-    if text is None:
-        return ""
-    # Convert to string if not already
-    text_str = str(text)
-    # Remove all HTML tags aggressively
-    stripped = re.sub(r'</?[^>]+/?>', '', text_str, flags=re.IGNORECASE)
-    # Remove any remaining HTML entities
-    stripped = re.sub(r'&[a-zA-Z0-9#]+;', '', stripped)
-    # Trim whitespace
-    stripped = stripped.strip()
-    # Escape any remaining special characters
-    return html.escape(stripped)
-
-# Function to extract patient name
-def get_patient_name(patient_data):
-    if not patient_data or 'name' not in patient_data:
-        return "Unknown Patient"
-    
-    # Start with a default value
-    result = "Unknown Patient"
-    
-    try:
-        # Safely extract the name
-        names = patient_data.get('name', [])
-        
-        # Check if it's a list with elements
-        if isinstance(names, list) and names:
-            name = names[0]
-        else:
-            name = names  # If it's not a list, use it directly
-            
-        # Try different ways to get the name, but sanitize at each step
-        if isinstance(name, dict):
-            if 'text' in name and name['text']:
-                result = sanitize_text(name['text'])
-            else:
-                given = []
-                if 'given' in name and name['given']:
-                    if isinstance(name['given'], list):
-                        given = [sanitize_text(g) for g in name['given']]
-                    else:
-                        given = [sanitize_text(name['given'])]
-                
-                family = sanitize_text(name.get('family', ''))
-                
-                if given and family:
-                    result = f"{' '.join(given)} {family}"
-                elif family:
-                    result = family
-                elif given:
-                    result = ' '.join(given)
-        elif isinstance(name, str):
-            # If the name is a string directly
-            result = sanitize_text(name)
-        
-        # Final sanitization
-        result = sanitize_text(result)
-        print(f"Processed patient name: {result}")
-    except Exception as e:
-        print(f"Error processing patient name: {e}")
-        result = "Unknown Patient"
-    
-    return result
-
-# Function to create the patient object
-def create_patient_object(fhir_patient):
-    try:
-        patient_obj = {
-            'name': get_patient_name(fhir_patient),
-            'age': sanitize_text(get_patient_age(fhir_patient)),
-            'diagnosis': sanitize_text(get_patient_diagnosis(fhir_patient)),
-            'recentLabs': get_patient_labs(fhir_patient)
-        }
-        
-        # Log the patient object for debugging
-        print(f"Created patient object: {patient_obj}")
-        
-        return patient_obj
-    except Exception as e:
-        print(f"Error creating patient object: {e}")
-        return {
-            'name': 'Error loading patient',
-            'age': '',
-            'diagnosis': '',
-            'recentLabs': {}
-        }
-
-def get_patient_age(patient_data):
-    if not patient_data or 'birthDate' not in patient_data:
-        return "Unknown"
-    
-    try:
-        birth_date = datetime.strptime(patient_data['birthDate'], '%Y-%m-%d')
-        today = datetime.now()
-        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-        return f"{age}"
-    except Exception as e:
-        return "Unknown"
-
-def get_patient_diagnosis(patient_data):
-    if not patient_data:
-        return ""
-    
-    diagnosis = ""
-    if 'extension' in patient_data:
-        for ext in patient_data.get('extension', []):
-            if 'url' in ext and 'diagnosis' in ext['url']:
-                diagnosis = ext.get('valueString', '')
-                print(f"Extracted diagnosis from FHIR data: {diagnosis}")
-                return sanitize_text(diagnosis)
-    
-    print(f"No diagnosis found in FHIR data. Defaulting to: {diagnosis}")
-    return diagnosis
-
-def get_patient_labs(patient_data):
-    if not patient_data:
-        return {}
+# Function to fetch patient data from Express server
+def fetch_patient_data(refresh=False, patient_id=None):
+    """
+    Current FHIR patient, or the patient with patient_id (picked from the
+    worklist), from the shared client.
     
-    if 'extension' in patient_data:
-        for ext in patient_data.get('extension', []):
-            if 'url' in ext and 'recentLabs' in ext['url']:
-                labs = {}
-                for lab_ext in ext.get('extension', []):
-                    if 'valueCoding' in lab_ext:
-                        key = sanitize_text(lab_ext['valueCoding']['display'])
-                        value = sanitize_text(lab_ext['valueCoding']['code'])
-                        labs[key] = value
-                if labs:
-                    return labs
+    The cached copy is returned at once and revalidated in the background;
+    only the first fetch in the process (or a refresh) waits for the server,
+    and never longer than MEDGUIDE_FHIR_TIMEOUT.
+    """
+    fhir_client = get_fhir_client()
+    raw_data = fhir_client.refresh_patient(patient_id) if refresh else fhir_client.get_patient(patient_id)
+    if raw_data is None:
+        st.warning(f"⚠️ Failed to retrieve patient data from server: {fhir_client.last_error}")
+    return raw_data
+
+# Function to build the session's patient from FHIR data
+def project_patient(fhir_patient, refresh=False):
+    """
+    Project the FHIR patient with trends from the lab history held so far.
     
-    return {}
-
-# Function to fetch patient data from Express server
-def fetch_patient_data():
-    try:
-        response = requests.get('http://localhost:8080/api/patient')
-        if response.status_code == 200:
-            raw_data = response.json()
-            print(f"Raw FHIR patient data: {raw_data}")
-            return raw_data
+    A stale history is synced in the background rather than before the page
+    renders (on refresh, synced now); later reruns re-project the patient and
+    pick up the trends once the sync lands.
+    """
+    patient_id = fhir_patient_id(fhir_patient)
+    lab_trends = None
+    if patient_id:
+        lab_store = get_lab_store()
+        if refresh:
+            lab_store.sync(patient_id, force=True)
         else:
-            st.warning(f"⚠️ Failed to retrieve patient data from server: {response.status_code}")
-            return None
-    except Exception as e:
-        st.warning(f"⚠️ Error connecting to server: {str(e)}")
-        return None
+            lab_store.sync_in_background(patient_id)
+        lab_trends = lab_store.trend_lines(patient_id, sync=False)
+    return patient_from_fhir(fhir_patient, lab_trends=lab_trends)
 
 # Function to refresh patient data
 def refresh_patient_data():
     with st.spinner("Refreshing patient data..."):
-        fhir_patient = fetch_patient_data()
+        fhir_patient = fetch_patient_data(refresh=True, patient_id=st.session_state.get('selected_patient_id'))
         if fhir_patient:
-            st.session_state.current_patient = create_patient_object(fhir_patient)
+            st.session_state.current_patient = project_patient(fhir_patient, refresh=True)
             st.session_state.fhir_patient = fhir_patient
             st.success("✅ Patient data refreshed successfully!")
             st.rerun()
@@ -191,13 +76,21 @@ if 'current_patient' not in st.session_state:
     # Try to fetch patient from Express server first
     fhir_patient = fetch_patient_data()
     if fhir_patient:
-        st.session_state.current_patient = create_patient_object(fhir_patient)
+        st.session_state.current_patient = project_patient(fhir_patient)
         st.session_state.fhir_patient = fhir_patient
+        st.session_state.selected_patient_id = None
     else:
         # Fallback to sample data if server fetch fails
         print("Falling back to sample patient data due to server fetch failure.")
         st.session_state.current_patient = get_sample_patient('diabetes')
         st.session_state.fhir_patient = None
+elif st.session_state.get('fhir_patient'):
+    # Re-read through the client, which serves its cached copy and revalidates it in
+    # the background, so a newer version or lab trends from a finished background sync
+    # show up on the next run; cheap otherwise, as the projection is shared per version
+    fhir_patient = fetch_patient_data(patient_id=st.session_state.get('selected_patient_id')) or st.session_state.fhir_patient
+    st.session_state.current_patient = project_patient(fhir_patient)
+    st.session_state.fhir_patient = fhir_patient
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'search_results' not in st.session_state:
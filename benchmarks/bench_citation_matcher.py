@@ -0,0 +1,91 @@
+# =====================================
+# benchmarks/bench_citation_matcher.py
+# =====================================
+"""
+Source attribution cost as answers and the source registry grow.
+
+Compares the old per-quote keyword chain (split the paragraph into words
+again for every quote, substring tests for each source) with the compiled
+CitationMatcher on synthetic answers of increasing length, with a registry
+of --sources guideline titles.
+
+    python benchmarks/bench_citation_matcher.py --sources 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.citation_matcher import CitationMatcher, first_page_ref
+
+WORDS = ("patients", "therapy", "should", "consider", "dose", "monitor", "renal", "function", "target", "risk", "canada", "evidence")
+
+
+def keyword_chain(paragraph, quotes):
+    """The attribution previously done in _parse_claude_response, once per quote"""
+    results = []
+    for _ in range(quotes):
+        lower_text = paragraph.lower()
+        page_match = None
+        if "page" in lower_text:
+            for word in lower_text.split():
+                if word.startswith("page"):
+                    page_match = word.split("page")[1].strip(".,: ")
+                    break
+        if "ada" in lower_text:
+            source = "ADA Standards of Medical Care in Diabetes"
+        elif "jnc" in lower_text:
+            source = "JNC Guidelines"
+        elif "nccn" in lower_text:
+            source = "NCCN Guidelines for Breast Cancer"
+        else:
+            source = "Clinical Guidelines"
+        results.append((source, page_match))
+    return results
+
+
+def make_answer(words, quotes, titles):
+    """A paragraph of words with quotes spread through it and a citation near the end"""
+    rng = random.Random(words)
+    tokens = [rng.choice(WORDS) for _ in range(words)]
+    for i in range(quotes):
+        tokens[(i * words) // quotes] = '"intensify therapy"'
+    tokens[-3:] = ["per", rng.choice(titles), "page 42."]
+    return " ".join(tokens)
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", type=int, default=500, help="guideline titles registered")
+    args = parser.parse_args()
+
+    titles = [f"Guideline {i} - Society {i} Consensus" for i in range(args.sources)]
+    matcher = CitationMatcher()
+    started = time.perf_counter()
+    for title in titles:
+        matcher.register_guideline({"title": title})
+    matcher.match_source("warm up")
+    print(f"{len(matcher)} sources registered and compiled in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(f"{'words':>8} {'quotes':>7} {'keyword chain':>15} {'matcher':>10}")
+
+    for words in (1000, 4000, 16000, 32000):
+        quotes = words // 50
+        answer = make_answer(words, quotes, titles)
+        chain_ms = timed(lambda: keyword_chain(answer, quotes))
+        matcher_ms = timed(lambda: (matcher.match_source(answer, "Clinical Guidelines"), first_page_ref(answer)))
+        print(f"{words:>8} {quotes:>7} {chain_ms:>12.2f} ms {matcher_ms:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+# =====================================
+# benchmarks/bench_fhir_bundle.py
+# =====================================
+"""
+Parse time and peak memory of reading a large patient Bundle.
+
+Writes a synthetic Patient/$everything Bundle of about --mb megabytes (the
+stub FHIR server's chart: observations, conditions, medication requests and
+encounters, each with narrative text) and reduces it to the chart MedGuide
+uses two ways: json.load of the whole document followed by the same
+reduction, and the streaming reader in utils/fhir_bundle.py fed 64 KB
+chunks. Times are measured without tracemalloc, peaks with it.
+
+    python benchmarks/bench_fhir_bundle.py --mb 50
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from devtools.stub_fhir import StubState, iter_everything_bundle
+from utils.fhir_bundle import BUNDLE_CHUNK_SIZE, ChartReducer, read_patient_chart
+
+
+def write_bundle(path, megabytes):
+    """Write a bundle of about megabytes MB and return its observation count"""
+    patient = StubState().patient()
+    sample = sum(len(text) for text in iter_everything_bundle(patient, 1000))
+    observations = int(1000 * megabytes * 1024 * 1024 / sample)
+    with open(path, "w", encoding="utf-8") as f:
+        for text in iter_everything_bundle(patient, observations):
+            f.write(text)
+    return observations
+
+
+def load_whole(path):
+    """The json.load baseline: materialize the document, then reduce it"""
+    with open(path, "rb") as f:
+        bundle = json.load(f)
+    reducer = ChartReducer()
+    for entry in bundle["entry"]:
+        reducer.add(entry)
+    bundle["entry"] = reducer.entries()
+    return bundle
+
+
+def load_streaming(path):
+    with open(path, "rb") as f:
+        return read_patient_chart(iter(lambda: f.read(BUNDLE_CHUNK_SIZE), b""))
+
+
+def measure(fn, path):
+    started = time.perf_counter()
+    result = fn(path)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=50, help="approximate bundle size in MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "everything.json")
+        observations = write_bundle(path, args.mb)
+        size = os.path.getsize(path)
+        print(f"Bundle: {size / (1024 * 1024):.1f} MB, {observations} observations")
+        print(f"{'reader':>12} {'parse time':>11} {'peak memory':>12} {'entries kept':>13}")
+
+        results = []
+        for name, fn in (("json.load", load_whole), ("streaming", load_streaming)):
+            chart, seconds, peak = measure(fn, path)
+            results.append(chart)
+            print(f"{name:>12} {seconds:>9.2f} s {peak / (1024 * 1024):>9.1f} MB {len(chart['entry']):>13}")
+        print("same chart from both readers" if results[0] == results[1] else "readers DISAGREE")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,126 @@
+# =====================================
+# benchmarks/bench_http_pool.py
+# =====================================
+"""
+Per-request latency with and without connection reuse.
+
+Starts a local keep-alive HTTPS server (plain HTTP if openssl is not
+available or --plain is given) and sends the same small JSON POST through
+a bare requests.post per call and through the shared PooledHttpClient.
+
+    python benchmarks/bench_http_pool.py --requests 200
+"""
+import argparse
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.http_client import PooledHttpClient
+
+RESPONSE_BODY = json.dumps({"content": [{"text": "ok"}], "usage": {"input_tokens": 10, "output_tokens": 1}}).encode("utf-8")
+
+
+class MessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Without TCP_NODELAY, delayed ACKs add ~40 ms to every reused connection
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_certificate(directory):
+    """Create a self-signed localhost certificate, or return None without openssl"""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    try:
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+                "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"
+            ],
+            check=True, capture_output=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return cert, key
+
+
+def start_server(certificate):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MessagesHandler)
+    scheme = "http"
+    if certificate:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://localhost:{server.server_address[1]}"
+
+
+def measure(send, count):
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = send()
+        response.raise_for_status()
+        response.json()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(timings):7.2f} ms   median {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--plain", action="store_true", help="use plain HTTP instead of TLS")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        certificate = None if args.plain else make_certificate(directory)
+        server, base_url = start_server(certificate)
+        verify = certificate[0] if certificate else True
+        payload = {"model": "benchmark", "max_tokens": 1, "messages": [{"role": "user", "content": "ping"}]}
+        print(f"{args.requests} POST requests to {base_url}/messages")
+
+        bare = measure(lambda: requests.post(f"{base_url}/messages", json=payload, verify=verify, timeout=30), args.requests)
+
+        client = PooledHttpClient(base_url)
+        client.post("/messages", json=payload, verify=verify)  # open the connection once
+        pooled = measure(lambda: client.post("/messages", json=payload, verify=verify), args.requests)
+
+        bare_mean = summarize("new connection", bare)
+        pooled_mean = summarize("pooled keep-alive", pooled)
+        print(f"saved {bare_mean - pooled_mean:.2f} ms per request ({1 - pooled_mean / bare_mean:.0%})")
+
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -5,7 +5,15 @@ import streamlit as st
 import json
 import time
 import re
-from utils.claude_api import ClaudeAPI
+import html
+from utils.claude_api import get_claude_api
+from utils.perplexity_api import get_perplexity_api
+from utils.pdf_utils import open_pdf_document
+from utils.query_orchestrator import QueryOrchestrator
+from components.streaming import stream_recommendations_to_placeholder
+
+# Most recent uploaded documents asked alongside each question
+MAX_DOCUMENT_LOOKUPS = 3
 
 def render_clinician_prompts():
     # Initialize chat history if not exists
@@ -18,7 +26,7 @@ def render_clinician_prompts():
         ]
     
     # Initialize Claude API
-    claude_api = ClaudeAPI(st.session_state.get('claude_api_key', 'demo_key'))
+    claude_api = get_claude_api(st.session_state.get('claude_api_key', 'demo_key'))
     
     # Current patient context
     patient = st.session_state.current_patient
@@ -44,6 +52,10 @@ def render_clinician_prompts():
         is_note = message.get("is_note", False)
         note = message.get("note", None)
         source = message.get("source", None)
+        time_to_first_token = message.get("time_to_first_token")
+        web_results = message.get("web_results", [])
+        document_answers = message.get("document_answers", [])
+        timings = message.get("timings")
         
         if role == "user":
             st.markdown(f"""
@@ -96,6 +108,27 @@ def render_clinician_prompts():
                     </div>
                     """, unsafe_allow_html=True)
                 
+                # Answers from the clinician's uploaded documents
+                if document_answers:
+                    st.markdown("**From your uploaded documents**")
+                    for answer in document_answers:
+                        page = f", page {answer['page']}" if answer.get('page') and answer['page'] != 'N/A' else ""
+                        st.markdown(f"- *{answer['title']}*{page}: {answer['text']}")
+                
+                # Supporting evidence from the web search
+                if web_results:
+                    st.markdown("**Web evidence**")
+                    for result in web_results:
+                        st.markdown(f"- [{result.get('title', '')}]({result.get('url', '')}) — {result.get('source', '')}")
+                
+                if time_to_first_token is not None:
+                    st.caption(f"First token after {time_to_first_token:.2f}s")
+                if timings:
+                    st.caption(
+                        f"Answered in {timings['total']:.2f}s · "
+                        + " · ".join(f"{name} {seconds:.2f}s" for name, seconds in timings['calls'].items())
+                    )
+                
                 # Close the assistant message div
                 st.markdown("</div>", unsafe_allow_html=True)
 
@@ -178,6 +211,14 @@ def get_condition_specific_prompts(condition):
         "What are the most common side effects to monitor?"
     ]
 
+def render_streaming_answer(placeholder, rec):
+    """Draw the first recommendation of a streaming answer, complete or still being written"""
+    text = f'<p>"{html.escape(rec["text"])}" ▌</p>' if rec.get("text") else "<p>▌</p>"
+    placeholder.markdown(
+        f'<div class="chat-message assistant-message"><p>{html.escape(rec.get("explanation", ""))}</p>{text}</div>',
+        unsafe_allow_html=True
+    )
+
 def handle_user_input(user_input, claude_api, patient, condition="general"):
     # Add user message to chat history
     st.session_state.chat_history.append({
@@ -185,32 +226,102 @@ def handle_user_input(user_input, claude_api, patient, condition="general"):
         "content": user_input
     })
     
-    # Show thinking indicator
-    with st.spinner("AI is thinking..."):
-        # Get response from Claude API with the condition context
-        response = claude_api.query_guidelines(user_input, patient, condition)
-        recommendations = response.get("recommendations", [])
-        
-        if recommendations:
-            rec = recommendations[0]  # Get first recommendation
-            
-            explanation = rec.get('explanation', '')
-            text = rec.get('text', '')
-            source_text = f"{rec.get('source', '')}, page {rec.get('page', '')}"
-            
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": f"{explanation}\n\n\"{text}\"",
-                "source": source_text
-            })
+    # Show the answer as it streams in; the structured message replaces it on rerun
+    placeholder = st.empty()
+    placeholder.markdown(
+        '<div class="chat-message assistant-message"><p>AI is thinking...</p></div>',
+        unsafe_allow_html=True
+    )
+    
+    # Web evidence and uploaded-document lookups run in the background while the guideline answer streams
+    orchestrator = QueryOrchestrator()
+    perplexity_api = get_perplexity_api(st.session_state.get('perplexity_api_key', 'demo_key'))
+    orchestrator.submit("web", perplexity_api.search_web, user_input, patient)
+    for document in get_lookup_documents():
+        pdf = open_pdf_document(document['pdf_digest'])
+        if pdf is not None:
+            orchestrator.submit(
+                f"document:{document['id']}",
+                lookup_uploaded_document, claude_api, pdf, document['title'], user_input, patient, condition
+            )
+    
+    # Stream the answer from Claude API with the condition context
+    stream = claude_api.stream_guidelines(user_input, patient, condition)
+    # The first recommendation is shown as it is written, or the raw text if Claude answers in prose
+    stream_recommendations_to_placeholder(
+        stream,
+        placeholder,
+        render=lambda recommendations, partial: render_streaming_answer(
+            placeholder, (recommendations[0] if recommendations else partial)
+        ),
+        render_text=lambda text: placeholder.markdown(
+            f'<div class="chat-message assistant-message"><p>{html.escape(text)} ▌</p></div>',
+            unsafe_allow_html=True
+        )
+    )
+    recommendations = stream.result.get("recommendations", [])
+    timings = {"total": 0.0, "calls": {"guideline": time.perf_counter() - stream.started}}
+    
+    # Merge the background results in the order they finish
+    web_results = []
+    document_answers = []
+    for outcome in orchestrator.as_completed():
+        if outcome.name == "web":
+            timings["calls"]["web"] = outcome.elapsed
         else:
-            # Provide a more condition-specific fallback message
-            fallback_message = f"I couldn't find specific guideline recommendations for your query about {condition}. Please try asking a different question or provide more context."
-            
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": fallback_message
-            })
+            timings["calls"]["documents"] = max(outcome.elapsed, timings["calls"].get("documents", 0.0))
+        if not outcome.ok or not outcome.result:
+            continue
+        if outcome.name == "web":
+            web_results = outcome.result
+        else:
+            document_answers.append(outcome.result)
+    timings["total"] = orchestrator.elapsed
+    
+    if recommendations:
+        rec = recommendations[0]  # Get first recommendation
+        
+        explanation = rec.get('explanation', '')
+        text = rec.get('text', '')
+        source_text = f"{rec.get('source', '')}, page {rec.get('page', '')}"
+        
+        st.session_state.chat_history.append({
+            "role": "assistant",
+            "content": f"{explanation}\n\n\"{text}\"",
+            "source": source_text,
+            "time_to_first_token": stream.time_to_first_token,
+            "web_results": web_results,
+            "document_answers": document_answers,
+            "timings": timings
+        })
+    else:
+        # Provide a more condition-specific fallback message
+        fallback_message = f"I couldn't find specific guideline recommendations for your query about {condition}. Please try asking a different question or provide more context."
+        
+        st.session_state.chat_history.append({
+            "role": "assistant",
+            "content": fallback_message,
+            "web_results": web_results,
+            "document_answers": document_answers,
+            "timings": timings
+        })
     
     # Rerun to update the UI
-    st.rerun()
\ No newline at end of file
+    st.rerun()
+
+def get_lookup_documents():
+    """Uploaded documents in this session that are fully indexed, most recent first"""
+    documents = [
+        document for document in st.session_state.get('uploaded_documents', {}).values()
+        if document.get('complete')
+    ]
+    return documents[::-1][:MAX_DOCUMENT_LOOKUPS]
+
+def lookup_uploaded_document(claude_api, pdf, title, question, patient, condition):
+    """Ask one uploaded document the question; runs on the orchestrator's thread pool"""
+    response = claude_api.query_guidelines(question, patient, condition, document_pages=pdf.text_by_page())
+    recommendations = response.get("recommendations", [])
+    if not recommendations or recommendations[0].get("source") == "Error":
+        return None
+    rec = recommendations[0]
+    return {"title": title, "text": rec.get("text", ""), "page": rec.get("page", "")}
\ No newline at end of file
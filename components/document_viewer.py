@@ -4,9 +4,11 @@
 import streamlit as st
 import io
 import os
-from utils.claude_api import ClaudeAPI
-from utils.pdf_utils import display_pdf, display_pdf_page
+from utils.claude_api import get_claude_api
+from utils.precompute_store import INITIAL_RECOMMENDATION_QUERY, get_precompute_store
+from utils.pdf_utils import published_page_url, open_pdf_document
 from data.sample_data import get_guideline_content
+from components.streaming import format_recommendation, render_recommendation_cards, stream_recommendations_to_placeholder
 
 def render_document_viewer(guideline, patient):
     col1, col2 = st.columns([3, 1])
@@ -15,53 +17,72 @@ def render_document_viewer(guideline, patient):
         st.markdown(f"## {guideline['title']}")
         st.markdown(f"<p style='color: #64748b;'>{guideline['source']} • Last updated: {guideline['lastUpdated']}</p>", unsafe_allow_html=True)
         
-        # Mock document content (in a real app, this would be a PDF viewer)
-        content = get_guideline_content(guideline['id'])
+        # Text of an uploaded PDF if there is one, otherwise mock document content
+        document = open_pdf_document(guideline['pdf_digest']) if guideline.get('pdf_digest') else None
+        if document is not None:
+            content = None
+            content_pages = document.text_by_page()
+        else:
+            content = get_guideline_content(guideline['id'])
+            content_pages = None
         
-        # Page navigation
+        # Page navigation (uploaded PDFs have real pages, curated content is a single mock page)
+        page_count = guideline.get('page_count')
+        page_key = f"viewer_page_{guideline['id']}"
+        current_page = st.session_state.get(page_key, 1)
         page_col1, page_col2, page_col3 = st.columns([1, 1, 5])
         with page_col1:
-            if st.button("◀ Previous"):
-                # Navigate to previous page
-                pass
+            if st.button("◀ Previous") and page_count:
+                current_page = max(1, current_page - 1)
         with page_col2:
-            if st.button("Next ▶"):
-                # Navigate to next page
-                pass
+            if st.button("Next ▶") and page_count:
+                current_page = min(page_count, current_page + 1)
+        st.session_state[page_key] = current_page
         with page_col3:
-            st.markdown(f"<p style='text-align: right;'>Page 42 of 128</p>", unsafe_allow_html=True)
+            if page_count:
+                st.markdown(f"<p style='text-align: right;'>Page {current_page} of {page_count}</p>", unsafe_allow_html=True)
+            else:
+                st.markdown(f"<p style='text-align: right;'>Page 42 of 128</p>", unsafe_allow_html=True)
         
         # Document content
-        st.markdown("""
-        <div class="document-viewer">
-            <div style="max-width: 600px; margin: 0 auto;">
-                <div style="margin-bottom: 1.5rem;">
-                    <h3 style="font-size: 1.25rem; font-weight: bold; text-align: center; margin-bottom: 0.5rem;">Glycemic Targets and Management Guidelines</h3>
-                    <h4 style="font-size: 1.125rem; font-weight: 500; text-align: center; color: #64748b; margin-bottom: 1rem;">American Diabetes Association, 2024</h4>
-                </div>
+        if guideline.get('pdf_digest'):
+            # Serve the page from the static directory by URL rather than inlining it
+            page_url = published_page_url(guideline['pdf_digest'], current_page)
+            if page_url:
+                st.markdown(f'<iframe src="{page_url}" width="100%" height="800" type="application/pdf"></iframe>', unsafe_allow_html=True)
+            else:
+                st.warning("This document is no longer available. Please upload it again.")
+        else:
+            st.markdown("""
+            <div class="document-viewer">
+                <div style="max-width: 600px; margin: 0 auto;">
+                    <div style="margin-bottom: 1.5rem;">
+                        <h3 style="font-size: 1.25rem; font-weight: bold; text-align: center; margin-bottom: 0.5rem;">Glycemic Targets and Management Guidelines</h3>
+                        <h4 style="font-size: 1.125rem; font-weight: 500; text-align: center; color: #64748b; margin-bottom: 1rem;">American Diabetes Association, 2024</h4>
+                    </div>
                 
-                <div style="font-size: 0.875rem; line-height: 1.5;">
-                    <p style="text-align: justify; margin-bottom: 1rem;">Regular monitoring of glycemia in patients with diabetes is crucial to assess treatment efficacy and reduce risk of hypoglycemia and hyperglycemia. The advent of continuous glucose monitoring (CGM) technology has revolutionized this aspect of diabetes care.</p>
+                    <div style="font-size: 0.875rem; line-height: 1.5;">
+                        <p style="text-align: justify; margin-bottom: 1rem;">Regular monitoring of glycemia in patients with diabetes is crucial to assess treatment efficacy and reduce risk of hypoglycemia and hyperglycemia. The advent of continuous glucose monitoring (CGM) technology has revolutionized this aspect of diabetes care.</p>
                     
-                    <h4 style="font-weight: bold; margin-top: 1rem; margin-bottom: 0.5rem;">Recommendations</h4>
+                        <h4 style="font-weight: bold; margin-top: 1rem; margin-bottom: 0.5rem;">Recommendations</h4>
                     
-                    <div style="padding: 0.75rem; background-color: #fef9c3; border-left: 4px solid #facc15; margin-bottom: 1rem;">
-                        <p><strong>8.1</strong> Most patients with diabetes should be assessed using glycated hemoglobin (HbA1c) testing at least twice per year. <em>(Grade A)</em></p>
-                    </div>
+                        <div style="padding: 0.75rem; background-color: #fef9c3; border-left: 4px solid #facc15; margin-bottom: 1rem;">
+                            <p><strong>8.1</strong> Most patients with diabetes should be assessed using glycated hemoglobin (HbA1c) testing at least twice per year. <em>(Grade A)</em></p>
+                        </div>
                     
-                    <div style="padding: 0.75rem; background-color: #dbeafe; border-left: 4px solid #60a5fa; margin-bottom: 1rem;">
-                        <p><strong>8.2</strong> When glycemic targets are not being met, quarterly assessments using HbA1c testing are recommended. <em>(Grade B)</em></p>
-                    </div>
+                        <div style="padding: 0.75rem; background-color: #dbeafe; border-left: 4px solid #60a5fa; margin-bottom: 1rem;">
+                            <p><strong>8.2</strong> When glycemic targets are not being met, quarterly assessments using HbA1c testing are recommended. <em>(Grade B)</em></p>
+                        </div>
                     
-                    <p style="text-align: justify; margin-bottom: 1rem;">All adult patients with diabetes should have an individualized glycemic target based on their duration of diabetes, age/life expectancy, comorbid conditions, known cardiovascular disease or advanced microvascular complications, hypoglycemia unawareness, and individual patient considerations.</p>
+                        <p style="text-align: justify; margin-bottom: 1rem;">All adult patients with diabetes should have an individualized glycemic target based on their duration of diabetes, age/life expectancy, comorbid conditions, known cardiovascular disease or advanced microvascular complications, hypoglycemia unawareness, and individual patient considerations.</p>
                     
-                    <div style="padding: 0.75rem; background-color: #fef9c3; border-left: 4px solid #facc15; margin-bottom: 1rem;">
-                        <p><strong>8.5</strong> For patients with Type 2 diabetes with HbA1c levels <strong>&gt; 8.0%</strong>, clinicians should consider intensifying pharmacologic therapy, adding additional agents, or referral to a specialist. <em>(Grade A)</em></p>
+                        <div style="padding: 0.75rem; background-color: #fef9c3; border-left: 4px solid #facc15; margin-bottom: 1rem;">
+                            <p><strong>8.5</strong> For patients with Type 2 diabetes with HbA1c levels <strong>&gt; 8.0%</strong>, clinicians should consider intensifying pharmacologic therapy, adding additional agents, or referral to a specialist. <em>(Grade A)</em></p>
+                        </div>
                     </div>
                 </div>
             </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
     
     with col2:
         st.markdown("### AI Assistant")
@@ -84,13 +105,16 @@ def render_document_viewer(guideline, patient):
         
         # Patient-specific recommendations - only add to history if not already there
         if not any(msg.get("content", "").startswith("Based on this guideline") for msg in st.session_state.messages if msg.get("role") == "assistant"):
-            # Get recommendations from Claude API
-            claude_api = ClaudeAPI(st.session_state.get('claude_api_key', 'demo_key'))
-            recommendations = claude_api.query_guidelines(
-                query="best medication regimen and relevant recommendations for this patient",
-                patient_context=patient,
-                document_ids=[guideline['id']]
-            ).get('recommendations', [])
+            # Use the answer precomputed before the visit if there is one, otherwise ask Claude now
+            precomputed = get_precompute_store().get_recommendations(patient, guideline['id'])
+            if precomputed is None:
+                claude_api = get_claude_api(st.session_state.get('claude_api_key', 'demo_key'))
+                precomputed = claude_api.query_guidelines(
+                    query=INITIAL_RECOMMENDATION_QUERY,
+                    patient_context=patient,
+                    document_ids=[guideline['id']]
+                )
+            recommendations = precomputed.get('recommendations', [])
             
             # Format recommendations as a single message
             if recommendations:
@@ -126,45 +150,38 @@ def render_document_viewer(guideline, patient):
             with st.chat_message("user"):
                 st.markdown(prompt)
             
-            # Get Claude response
+            # Stream Claude's response into the message as it is written
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    # Create message placeholder
-                    message_placeholder = st.empty()
-                    
-                    # Query Claude
-                    claude_api = ClaudeAPI(st.session_state.get('claude_api_key', 'demo_key'))
-                    response = claude_api.query_guidelines(
-                        query=prompt,
-                        patient_context=patient,
-                        document_text=content
-                    )
-                    
-                    # Format the response
-                    recommendations = response.get('recommendations', [])
-                    full_response = ""
-                    
-                    if recommendations:
-                        for rec in recommendations:
-                            if rec.get('explanation'):
-                                full_response += f"{rec.get('explanation')}\n\n"
-                            
-                            if rec.get('text'):
-                                full_response += f"\"{rec.get('text')}\"\n\n"
-                                
-                            if rec.get('source') or rec.get('page'):
-                                source_info = f"Source: {rec.get('source', '')}"
-                                if rec.get('page') and rec.get('page') != 'N/A':
-                                    source_info += f", Page {rec.get('page')}"
-                                full_response += f"*{source_info}*\n\n"
-                    else:
-                        full_response = "I couldn't find specific information about that in the guidelines. Is there anything else you'd like to know?"
-                    
-                    # Display response
+                # Create message placeholder
+                message_placeholder = st.empty()
+                message_placeholder.markdown("*Thinking...*")
+                
+                # Query Claude
+                claude_api = get_claude_api(st.session_state.get('claude_api_key', 'demo_key'))
+                stream = claude_api.stream_guidelines(
+                    query=prompt,
+                    patient_context=patient,
+                    document_text=content,
+                    document_pages=content_pages
+                )
+                stream_recommendations_to_placeholder(stream, message_placeholder)
+                response = stream.result
+                
+                # Format the response
+                recommendations = response.get('recommendations', [])
+                
+                # Replace the streamed cards with the final recommendations
+                if recommendations:
+                    full_response = "\n\n".join(format_recommendation(rec) for rec in recommendations)
+                    render_recommendation_cards(message_placeholder, recommendations)
+                else:
+                    full_response = "I couldn't find specific information about that in the guidelines. Is there anything else you'd like to know?"
                     message_placeholder.markdown(full_response)
-                    
-                    # Add response to message history
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
+                if stream.time_to_first_token is not None:
+                    st.caption(f"First token after {stream.time_to_first_token:.2f}s")
+                
+                # Add response to message history
+                st.session_state.messages.append({"role": "assistant", "content": full_response})
         
         # Related guidelines (kept from original)
         st.markdown("#### Related Guidelines")
@@ -5,11 +5,12 @@ import streamlit as st
 import streamlit.components.v1 as components  # Import for st.components.v1.html
 import json
 import time
-from utils.claude_api import ClaudeAPI
+from utils.claude_api import get_claude_api
+from utils.precompute_store import get_precompute_store
 
 def render_note_generator():
     # Initialize Claude API
-    claude_api = ClaudeAPI(st.session_state.get('claude_api_key', 'demo_key'))
+    claude_api = get_claude_api(st.session_state.get('claude_api_key', 'demo_key'))
     
     # Current patient context and condition
     patient = st.session_state.current_patient
@@ -92,10 +93,12 @@ def render_note_generator():
     
     # Generate note if it doesn't exist in session state or condition has changed
     if 'current_note' not in st.session_state or st.session_state.get('current_note_type') != condition_type:
-        with st.spinner("Generating clinical note..."):
-            response = claude_api.generate_clinical_note(patient, condition_type)
-            st.session_state.current_note = response.get("content", "Error generating note")
-            st.session_state.current_note_type = condition_type
+        response = get_precompute_store().get_note(patient, condition_type)
+        if response is None:
+            with st.spinner("Generating clinical note..."):
+                response = claude_api.generate_clinical_note(patient, condition_type)
+        st.session_state.current_note = response.get("content", "Error generating note")
+        st.session_state.current_note_type = condition_type
     
     # Display note content
     note_container = st.container()
@@ -2,7 +2,229 @@
 # components/sidebar.py
 # =====================================
 import streamlit as st
-from data.sample_data import get_sample_guidelines, get_sample_uploaded_docs
+import html
+import re
+import time
+from datetime import datetime
+from data.sample_data import get_sample_guidelines, get_sample_uploaded_docs, get_guideline_content
+from utils.pdf_cache import get_pdf_cache
+from utils.pdf_utils import get_pdf_document, open_pdf_document, publish_pdf
+from utils.search_index import GuidelineSearchIndex, highlight_snippet
+from utils.token_budget import get_token_usage_log
+from utils.response_cache import get_response_cache
+from utils.retrieval import document_fingerprint, get_document_index
+from utils.perplexity_api import get_web_search_stats
+from utils.rate_limiter import get_llm_rate_limiter
+from utils.citation_matcher import get_citation_matcher
+from utils.fhir_client import get_fhir_client
+from utils.lab_store import get_lab_store
+from utils.worklist import get_worklist
+
+# Number of characters of the first page shown while the rest of an upload is indexed
+UPLOAD_PREVIEW_CHARS = 1200
+
+# Pages of an upload added to the search index at a time while it is being read
+UPLOAD_INDEX_BATCH_PAGES = 10
+
+# Guidelines per condition whose retrieval index is built while a worklist is prefetched
+WARM_GUIDELINES_PER_CONDITION = 2
+
+@st.cache_resource(show_spinner=False)
+def get_guideline_search_index():
+    """
+    Process-wide full-text index, seeded with the curated and sample uploaded guidelines.
+    
+    The same guidelines are registered as citation sources so free-text
+    answers can be attributed to them.
+    """
+    index = GuidelineSearchIndex()
+    citation_matcher = get_citation_matcher()
+    for guideline in get_sample_guidelines() + get_sample_uploaded_docs():
+        index.add_document(guideline['id'], {1: get_guideline_content(guideline['id'])}, guideline)
+        citation_matcher.register_guideline(guideline)
+    return index
+
+def run_guideline_search(query):
+    """Search all guidelines and store the results in session state"""
+    search = get_guideline_search_index().search(query)
+    st.session_state.search_results = search['results']
+    st.session_state.search_summary = f"{search['total']} matching pages in {search['elapsed_ms']:.1f} ms"
+
+def make_guideline_warmer(search_index):
+    """
+    Worklist warm-up: build the retrieval index of the best matching guidelines
+    for each of a patient's conditions, so their first question skips it.
+    """
+    def warm(patient):
+        guidelines = {}
+        conditions = [c.strip() for c in re.split(r"[,;]", patient.diagnosis) if c.strip()] + patient.conditions
+        for condition in conditions:
+            results = search_index.search(condition)['results']
+            if not results:
+                # Match longer terms one at a time when the whole condition name matches nothing
+                for term in condition.split():
+                    if len(term) >= 5:
+                        results += search_index.search(term)['results']
+            matched = {}
+            for result in results:
+                key = result.get('id') or result.get('pdf_digest')
+                if key and len(matched) < WARM_GUIDELINES_PER_CONDITION:
+                    matched.setdefault(key, result)
+            guidelines.update(matched)
+        for guideline in guidelines.values():
+            if guideline.get('pdf_digest'):
+                document = open_pdf_document(guideline['pdf_digest'])
+                if document is not None:
+                    get_document_index(None, document.text_by_page())
+            else:
+                get_document_index(get_guideline_content(guideline['id']))
+    return warm
+
+def switch_worklist_patient(worklist):
+    """Selectbox callback: make the chosen worklist patient current from the prefetched caches"""
+    patient_id = st.session_state.get('worklist_choice')
+    if not patient_id:
+        return
+    started = time.perf_counter()
+    patient, fhir_patient = worklist.switch_to(patient_id)
+    if patient is None:
+        st.session_state.worklist_error = f"Could not load patient {patient_id}"
+        return
+    st.session_state.current_patient = patient
+    st.session_state.fhir_patient = fhir_patient
+    st.session_state.selected_patient_id = patient_id
+    st.session_state.chat_history = []
+    st.session_state.worklist_error = None
+    st.session_state.worklist_switch_ms = (time.perf_counter() - started) * 1000
+
+def render_worklist(worklist):
+    st.markdown("### Worklist")
+    statuses = {entry['patient_id']: entry for entry in worklist.status()}
+    
+    def label(patient_id):
+        entry = statuses[patient_id]
+        return entry['name'] if entry['status'] == 'ready' else f"{entry['name']} ({entry['status']})"
+    
+    st.selectbox(
+        "Switch patient",
+        list(statuses),
+        index=None,
+        format_func=label,
+        placeholder="Choose a scheduled patient",
+        key='worklist_choice',
+        on_change=switch_worklist_patient,
+        args=(worklist,)
+    )
+    stats = worklist.stats()
+    summary = f"{stats['ready']} of {stats['patients']} patients prefetched"
+    if stats['prefetch_seconds'] is not None:
+        summary += f" in {stats['prefetch_seconds']:.1f}s"
+    if stats['failed']:
+        summary += f", {stats['failed']} failed"
+    if st.session_state.get('worklist_switch_ms') is not None:
+        summary += f" • last switch {st.session_state.worklist_switch_ms:.1f} ms"
+    st.caption(summary)
+    if st.session_state.get('worklist_error'):
+        st.error(st.session_state.worklist_error)
+
+def ingest_uploaded_pdf(uploaded_file):
+    """
+    Stream the pages of an uploaded PDF into session state.
+
+    The first page is previewed and indexed as soon as it is decoded, and
+    later pages are added to the shared search index in batches of
+    UPLOAD_INDEX_BATCH_PAGES, so pages already read can be searched (from
+    other sessions, or here after an interrupted run) before extraction has
+    finished. Only bookkeeping is kept in session state; the page text lives
+    once, in the document. The time to the first page is reported with the
+    result.
+
+    Re-uploading a guideline (same content, or same file name with new
+    content) drops every cached Claude answer derived from the earlier copy.
+
+    Streamlit calls this on every rerun while the file sits in the uploader,
+    so the content hash is remembered per upload (file_id) and a file that
+    is already indexed is neither copied nor hashed again.
+    """
+    if 'uploaded_documents' not in st.session_state:
+        st.session_state.uploaded_documents = {}
+    if 'upload_digests' not in st.session_state:
+        st.session_state.upload_digests = {}
+    
+    digest = st.session_state.upload_digests.get(uploaded_file.file_id)
+    record = st.session_state.uploaded_documents.get(digest)
+    if record is None or not record['complete']:
+        document = (open_pdf_document(digest) if digest else None) or get_pdf_document(uploaded_file)
+        st.session_state.upload_digests[uploaded_file.file_id] = document.digest
+        record = st.session_state.uploaded_documents.get(document.digest)
+    if record and record['complete']:
+        st.caption(f"{record['title']} • {record['page_count']} pages indexed")
+        return record
+    
+    upload_date = datetime.now().strftime("%b %d, %Y")
+    record = {
+        "id": f"upload_{document.digest[:12]}",
+        "title": uploaded_file.name,
+        "source": "Uploaded Document",
+        "uploadedBy": "You",
+        "uploadDate": upload_date,
+        "lastUpdated": upload_date,
+        "pdf_digest": document.digest,
+        "pdf_url": publish_pdf(document),
+        "page_count": document.page_count,
+        "pages_indexed": 0,
+        "complete": False
+    }
+    st.session_state.uploaded_documents[document.digest] = record
+    
+    progress = st.progress(0.0, text="Reading document...")
+    preview = st.empty()
+    started = time.perf_counter()
+    search_index = get_guideline_search_index()
+    search_info = {key: record[key] for key in ('title', 'source', 'uploadedBy', 'uploadDate', 'lastUpdated', 'pdf_digest', 'page_count')}
+    batch = {}
+    
+    for page_num, page_text in document.iter_pages():
+        record['pages_indexed'] += 1
+        batch[page_num] = page_text
+        if record['pages_indexed'] == 1:
+            # Replaces what an interrupted earlier run of this upload indexed
+            search_index.add_document(record['id'], batch, search_info, replace=True)
+            get_citation_matcher().register_guideline(record)
+            batch = {}
+            record['time_to_first_page'] = time.perf_counter() - started
+            with preview.container():
+                st.caption(f"First page ready in {record['time_to_first_page'] * 1000:.0f} ms")
+                with st.expander(f"Preview: page {page_num}"):
+                    st.text(page_text[:UPLOAD_PREVIEW_CHARS])
+        elif len(batch) >= UPLOAD_INDEX_BATCH_PAGES:
+            search_index.add_pages(record['id'], batch)
+            batch = {}
+        progress.progress(page_num / record['page_count'], text=f"Indexed {page_num} of {record['page_count']} pages")
+    
+    if batch:
+        search_index.add_pages(record['id'], batch)
+    record['extraction_seconds'] = time.perf_counter() - started
+    record['complete'] = True
+    record['content_fingerprint'] = document_fingerprint(None, document.text_by_page())
+    progress.empty()
+    
+    # Answers cached for an earlier copy of this guideline are no longer trusted
+    response_cache = get_response_cache()
+    stale = {record['content_fingerprint']}
+    stale.update(
+        previous['content_fingerprint'] for previous in st.session_state.uploaded_documents.values()
+        if previous is not record and previous['title'] == record['title'] and previous.get('content_fingerprint')
+    )
+    invalidated = sum(response_cache.invalidate_tag(fingerprint) for fingerprint in stale)
+    if invalidated:
+        print(f"Dropped {invalidated} cached answers for re-uploaded {record['title']}")
+    
+    print(f"Indexed {record['title']}: {record['page_count']} pages, first page in "
+          f"{record.get('time_to_first_page', 0) * 1000:.0f} ms, total {record['extraction_seconds']:.2f} s")
+    st.success(f"File uploaded successfully! {record['page_count']} pages indexed "
+               f"(first page in {record.get('time_to_first_page', 0) * 1000:.0f} ms).")
+    return record
 
 def render_sidebar():
     with st.sidebar:
@@ -19,6 +241,11 @@ def render_sidebar():
             st.session_state.current_page = 'prompts'
             st.rerun()
         
+        # Scheduled patients, when a worklist is configured
+        worklist = get_worklist(warm=make_guideline_warmer(get_guideline_search_index()))
+        if worklist is not None:
+            render_worklist(worklist)
+        
         # Note Generator with Custom Condition
         st.markdown("### Generate Note")
         
@@ -85,11 +312,10 @@ def render_sidebar():
             # Upload new document
             uploaded_file = st.file_uploader("Upload a guideline PDF", type="pdf")
             if uploaded_file:
-                st.success("File uploaded successfully!")
-                # In a real app, process and store the file
+                ingest_uploaded_pdf(uploaded_file)
             
-            # Existing uploaded docs
-            uploaded_docs = get_sample_uploaded_docs()
+            # Documents uploaded in this session, followed by existing uploaded docs
+            uploaded_docs = list(st.session_state.get('uploaded_documents', {}).values()) + get_sample_uploaded_docs()
             for doc in uploaded_docs:
                 doc_container = st.container()
                 with doc_container:
@@ -114,17 +340,10 @@ def render_sidebar():
         with tab3:
             st.markdown("#### Search Medical Guidelines")
             
-            search_query = st.text_input("Search guidelines", placeholder="Enter search terms...")
+            search_query = st.text_input("Search guidelines", placeholder='Terms, "exact phrase" or prefix*')
             if st.button("Search", use_container_width=True):
                 if search_query:
-                    st.session_state.search_results = [
-                        {
-                            "title": "Search Results for Medical Guidelines",
-                            "snippet": f"Results for: {search_query}",
-                            "url": "#",
-                            "source": "Search Engine"
-                        }
-                    ]
+                    run_guideline_search(search_query)
                     
                     # Try to infer condition from search query
                     if "diabetes" in search_query.lower():
@@ -136,6 +355,24 @@ def render_sidebar():
                     elif "heart" in search_query.lower() or "cardiovascular" in search_query.lower():
                         st.session_state.selected_condition = "cardiovascular disease"
             
+            # Search results with a jump to the matching page
+            if st.session_state.get('search_results'):
+                st.caption(st.session_state.get('search_summary', ''))
+                for i, result in enumerate(st.session_state.search_results):
+                    st.markdown(f"**{html.escape(result['title'])}** • Page {result['page']}")
+                    st.markdown(
+                        f"<div style='font-size: 0.75rem; color: #475569;'>{highlight_snippet(result['snippet'], result['highlights'])}</div>",
+                        unsafe_allow_html=True
+                    )
+                    if st.button(f"Open page {result['page']}", key=f"search_result_{i}", use_container_width=True):
+                        guideline = {key: value for key, value in result.items() if key not in ('page', 'score', 'snippet', 'highlights')}
+                        st.session_state.selected_guideline = guideline
+                        st.session_state[f"viewer_page_{guideline['id']}"] = result['page']
+                        st.session_state.current_page = 'home'
+                        st.rerun()
+            elif st.session_state.get('search_summary'):
+                st.caption(st.session_state.search_summary)
+            
             # Recent searches
             st.markdown("#### Recent Searches")
             recent_searches = [
@@ -146,6 +383,7 @@ def render_sidebar():
             
             for search in recent_searches:
                 if st.button(f"🕒 {search}", key=f"search_{search}", use_container_width=True):
+                    run_guideline_search(search)
                     # Set condition based on search content
                     if "diabetes" in search.lower():
                         st.session_state.selected_condition = "diabetes"
@@ -175,6 +413,55 @@ def render_sidebar():
                 st.session_state.claude_api_key = claude_api_key
                 st.session_state.perplexity_api_key = perplexity_api_key
                 st.success("API keys saved successfully!")
+            
+            st.markdown("### Cache Statistics")
+            pdf_cache_stats = get_pdf_cache().stats()
+            st.caption(
+                f"PDF text cache: {pdf_cache_stats['hits']} hits, {pdf_cache_stats['misses']} misses, "
+                f"{pdf_cache_stats['bytes'] / (1024 * 1024):.1f} MB on disk"
+            )
+            response_stats = get_response_cache().stats()
+            st.caption(
+                f"Answer cache: {response_stats['hits']} hits, {response_stats['misses']} misses "
+                f"({response_stats['hit_rate']:.0%} hit rate), {response_stats['entries']} answers, "
+                f"{response_stats['bytes'] / 1024:.0f} KB"
+            )
+            web_stats = get_web_search_stats()
+            st.caption(
+                f"Web search: {web_stats['cache_hits']} cache hits, {web_stats['coalesced']} coalesced, "
+                f"{web_stats['outbound']} outbound requests"
+            )
+            fhir_stats = get_fhir_client().stats()
+            st.caption(
+                f"FHIR patient: {fhir_stats['hits']} cached reads, {fhir_stats['not_modified']} revalidated unchanged, "
+                f"{fhir_stats['updated']} fetched, {fhir_stats['errors']} errors"
+            )
+            lab_stats = get_lab_store().stats()
+            st.caption(
+                f"Lab history: {lab_stats['results']} results in {lab_stats['series']} series for "
+                f"{lab_stats['patients']} patients, {lab_stats['syncs']} syncs read {lab_stats['results_read']}"
+            )
+            token_stats = get_token_usage_log().stats()
+            if token_stats['estimate_ratio'] is not None:
+                st.caption(
+                    f"Claude tokens: {token_stats['input_tokens']} in / {token_stats['output_tokens']} out over "
+                    f"{token_stats['calls']} calls, estimates at {token_stats['estimate_ratio']:.0%} of actual, "
+                    f"{token_stats['mean_latency']:.1f}s mean latency"
+                    + (f", first token after {token_stats['mean_time_to_first_token']:.2f}s" if token_stats['mean_time_to_first_token'] is not None else "")
+                )
+                if token_stats['cache_write_tokens'] or token_stats['cache_read_tokens']:
+                    st.caption(
+                        f"Prompt cache: {token_stats['cache_read_tokens']} tokens read, "
+                        f"{token_stats['cache_write_tokens']} tokens written"
+                    )
+            # Shown even before any call has reported usage, e.g. when every call was throttled
+            limiter_stats = get_llm_rate_limiter().stats()
+            st.caption(
+                f"Claude rate limiter: {limiter_stats['queue_depth']} queued (max {limiter_stats['max_queue_depth']}), "
+                f"{limiter_stats['mean_wait']:.2f}s mean / {limiter_stats['max_wait']:.1f}s max wait, "
+                f"{limiter_stats['throttled']} throttled, {limiter_stats['rejected']} rejected, "
+                f"concurrency limit {limiter_stats['concurrency_limit']}"
+            )
         
         with st.expander("Help"):
             st.markdown("""
@@ -0,0 +1,78 @@
+# =====================================
+# components/streaming.py
+# =====================================
+import time
+import streamlit as st
+
+# Minimum seconds between placeholder redraws while text is streaming
+STREAM_REDRAW_INTERVAL = 0.05
+
+
+def format_recommendation(rec):
+    """Markdown for one recommendation: explanation, quoted guideline text and source"""
+    parts = []
+    if rec.get('explanation'):
+        parts.append(rec.get('explanation'))
+    if rec.get('text'):
+        parts.append(f"\"{rec.get('text')}\"")
+    if rec.get('source') or rec.get('page'):
+        source_info = f"Source: {rec.get('source', '')}"
+        if rec.get('page') and rec.get('page') != 'N/A':
+            source_info += f", Page {rec.get('page')}"
+        parts.append(f"*{source_info}*")
+    return "\n\n".join(parts)
+
+
+def render_recommendation_cards(placeholder, recommendations, streaming=False, partial=None):
+    """
+    Draw each recommendation as a bordered card in placeholder. While still
+    streaming, the fields written so far of the next one (partial) are drawn
+    as a last card ending in a cursor.
+    """
+    with placeholder.container():
+        for rec in recommendations:
+            with st.container(border=True):
+                st.markdown(format_recommendation(rec))
+        if partial:
+            with st.container(border=True):
+                st.markdown(format_recommendation(partial) + " ▌")
+        elif streaming:
+            st.markdown("▌")
+
+
+def stream_recommendations_to_placeholder(stream, placeholder, render=None, render_text=None):
+    """
+    Consume a GuidelineStream, drawing the answer as it is written.
+
+    render(recommendations, partial) draws the complete recommendations and
+    the fields streamed so far of the next one (None between objects); by
+    default as cards. If Claude answers in prose rather than JSON,
+    render_text(text) draws the raw text instead; by default as markdown with
+    a cursor. Redraws are throttled to STREAM_REDRAW_INTERVAL so a fast
+    stream doesn't flood the browser, except that a newly completed
+    recommendation is drawn at once. Returns the full streamed text.
+    """
+    if render is None:
+        render = lambda recommendations, partial: render_recommendation_cards(
+            placeholder, recommendations, streaming=True, partial=partial
+        )
+    if render_text is None:
+        render_text = lambda text: placeholder.markdown(text + " ▌")
+
+    text = ""
+    drawn = 0
+    last_draw = 0.0
+    for delta in stream:
+        text += delta
+        now = time.perf_counter()
+        if len(stream.recommendations) == drawn and now - last_draw < STREAM_REDRAW_INTERVAL:
+            continue
+        if stream.free_text:
+            render_text(text)
+        else:
+            partial = stream.partial()
+            if stream.recommendations or partial:
+                render(stream.recommendations, partial)
+        drawn = len(stream.recommendations)
+        last_draw = now
+    return text
\ No newline at end of file
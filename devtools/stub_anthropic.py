@@ -0,0 +1,383 @@
+# =====================================
+# devtools/stub_anthropic.py
+# =====================================
+"""
+Local stand-in for the Anthropic Messages API.
+
+Answers POST /v1/messages (plain and streamed) with a canned response,
+implements the Message Batches endpoints (create, retrieve, results) and
+simulates prompt caching: the prompt prefix up to the last cache_control
+breakpoint is remembered for five minutes, and usage reports
+cache_creation_input_tokens on the first request and cache_read_input_tokens
+on later ones, like the real API. Prefill time is simulated from the
+uncached input tokens so the latency effect of caching is visible. With
+--rpm, requests over that many per minute get a 429 with retry-after.
+
+Run it and point the app at it:
+
+    python devtools/stub_anthropic.py --port 8089
+    CLAUDE_API_BASE_URL=http://localhost:8089/v1 CLAUDE_API_KEY=stub streamlit run app.py
+
+Or check the prompt-caching round trip end to end:
+
+    python devtools/stub_anthropic.py --check
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.token_budget import estimate_tokens
+
+# Same lifetime and minimum prefix size as Anthropic's ephemeral cache
+CACHE_TTL = 300
+MIN_CACHEABLE_TOKENS = 1024
+
+_PAGE_RE = re.compile(r"\[Page (\d+)\]")
+_BATCH_PATH_RE = re.compile(r"^/v1/messages/batches/([\w-]+)(/results)?$")
+
+
+class StubState:
+    """Prompt cache and latency settings shared by all handler threads"""
+
+    def __init__(self, latency: float = 0.05, prefill_ms_per_1k: float = 40.0, rpm: int = 0):
+        self.latency = latency
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.rpm = rpm
+        self.prompt_cache = {}
+        self.batches = {}
+        self.recent = []
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until another request is allowed under --rpm, or 0 to admit it now"""
+        if not self.rpm:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            self.recent = [t for t in self.recent if t > now - 60]
+            if len(self.recent) >= self.rpm:
+                self.throttled += 1
+                return max(1, int(self.recent[0] + 60 - now + 0.999))
+            self.recent.append(now)
+            return 0
+
+    def usage_for(self, body):
+        """Return (input, cache_creation, cache_read) token counts for a request"""
+        blocks = []
+        system = body.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        blocks.extend(system)
+        for message in body.get("messages", []):
+            content = message.get("content", "")
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            blocks.extend(content)
+
+        tokens = [estimate_tokens(block.get("text", "")) for block in blocks]
+        total = sum(tokens) + 8
+        breakpoints = [i for i, block in enumerate(blocks) if block.get("cache_control")]
+        if not breakpoints:
+            return total, 0, 0
+
+        last = breakpoints[-1]
+        prefix_tokens = sum(tokens[:last + 1])
+        if prefix_tokens < MIN_CACHEABLE_TOKENS:
+            return total, 0, 0
+
+        key = hashlib.sha256(json.dumps([body.get("model"), blocks[:last + 1]], sort_keys=True).encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self.lock:
+            hit = self.prompt_cache.get(key, 0) > now
+            self.prompt_cache[key] = now + CACHE_TTL
+        if hit:
+            return total - prefix_tokens, 0, prefix_tokens
+        return total - prefix_tokens, prefix_tokens, 0
+
+    def create_message(self, body):
+        """Answer one Messages API request body, sleeping for the simulated latency"""
+        with self.lock:
+            self.requests += 1
+        input_tokens, cache_write, cache_read = self.usage_for(body)
+        time.sleep(self.latency + (input_tokens + cache_write) / 1000 * self.prefill_ms_per_1k / 1000)
+
+        text = make_answer(body)
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {
+                "input_tokens": input_tokens,
+                "cache_creation_input_tokens": cache_write,
+                "cache_read_input_tokens": cache_read,
+                "output_tokens": estimate_tokens(text)
+            }
+        }
+
+    def create_batch(self, batch_requests, results_base):
+        """Queue a message batch and process it in the background like the real API"""
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "in_progress",
+            "request_counts": {"processing": len(batch_requests), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "ended_at": None,
+            "results_url": None
+        }
+        with self.lock:
+            self.batches[batch_id] = {"batch": batch, "results": []}
+        threading.Thread(target=self._process_batch, args=(batch_id, batch_requests, results_base), daemon=True).start()
+        return dict(batch)
+
+    def _process_batch(self, batch_id, batch_requests, results_base):
+        entry = self.batches[batch_id]
+        for request in batch_requests:
+            params = request.get("params") or {}
+            if not params.get("messages"):
+                result = {"type": "errored", "error": {"type": "invalid_request_error", "message": "messages: field required"}}
+                outcome = "errored"
+            else:
+                result = {"type": "succeeded", "message": self.create_message(params)}
+                outcome = "succeeded"
+            with self.lock:
+                entry["results"].append({"custom_id": request.get("custom_id"), "result": result})
+                entry["batch"]["request_counts"]["processing"] -= 1
+                entry["batch"]["request_counts"][outcome] += 1
+        with self.lock:
+            entry["batch"]["processing_status"] = "ended"
+            entry["batch"]["ended_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            entry["batch"]["results_url"] = f"{results_base}/{batch_id}/results"
+
+    def get_batch(self, batch_id):
+        with self.lock:
+            entry = self.batches.get(batch_id)
+            return dict(entry["batch"]) if entry else None
+
+    def batch_results(self, batch_id):
+        with self.lock:
+            entry = self.batches.get(batch_id)
+            if entry is None or entry["batch"]["processing_status"] != "ended":
+                return None
+            return list(entry["results"])
+
+
+def _message_text(message):
+    content = message.get("content", "")
+    if isinstance(content, list):
+        content = " ".join(block.get("text", "") for block in content)
+    return content
+
+
+def make_answer(body):
+    """
+    A canned answer in the shape the app's response parser understands.
+
+    A prefilled assistant turn is continued: a JSON recommendations answer
+    when it opens the JSON object, free text otherwise.
+    """
+    prompt = json.dumps(body)
+    pages = _PAGE_RE.findall(prompt)
+    page = pages[0] if pages else "1"
+    messages = body.get("messages", [{}])
+    prefill = _message_text(messages[-1]) if messages[-1].get("role") == "assistant" else ""
+    user_messages = [_message_text(message) for message in messages if message.get("role") == "user"]
+    last_message = user_messages[-1] if user_messages else ""
+    question = last_message.strip().splitlines()[-1][:120] if last_message.strip() else ""
+    if prefill.lstrip().startswith("{"):
+        recommendations = [
+            {
+                "text": f"Follow the recommendation on page {page} for this patient.",
+                "explanation": f"Stub answer to: {question}",
+                "source": "Stub guideline",
+                "page": page
+            },
+            {
+                "text": "Reassess at the next visit.",
+                "explanation": "Stub follow-up recommendation.",
+                "source": "Stub guideline",
+                "page": page
+            }
+        ]
+        return ", ".join(json.dumps(rec) for rec in recommendations) + "]}"
+    return (
+        f'Based on the guideline, "Follow the recommendation on page {page} for this patient." '
+        f"(stub answer to: {question})"
+    )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+
+    def _not_found(self):
+        self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def _authorized(self):
+        if self.headers.get("x-api-key"):
+            return True
+        self._send_json(401, {"type": "error", "error": {"type": "authentication_error", "message": "missing x-api-key"}})
+        return False
+
+    def do_POST(self):
+        body = self._read_body()
+        if not self._authorized():
+            return
+        path = self.path.rstrip("/")
+        if path == "/v1/messages/batches":
+            results_base = f"http://{self.headers.get('host', '127.0.0.1')}/v1/messages/batches"
+            self._send_json(200, self.state.create_batch(body.get("requests", []), results_base))
+            return
+        if path != "/v1/messages":
+            self._not_found()
+            return
+        retry_after = self.state.retry_after()
+        if retry_after:
+            data = json.dumps({"type": "error", "error": {"type": "rate_limit_error", "message": "requests per minute exceeded"}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("content-type", "application/json")
+            self.send_header("retry-after", str(retry_after))
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        message = self.state.create_message(body)
+        if body.get("stream"):
+            self._stream(message)
+        else:
+            self._send_json(200, message)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        match = _BATCH_PATH_RE.match(self.path.rstrip("/"))
+        if not match:
+            self._not_found()
+            return
+        batch_id, results = match.groups()
+        if results:
+            lines = self.state.batch_results(batch_id)
+            if lines is None:
+                self._not_found()
+                return
+            data = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+            self.send_response(200)
+            self.send_header("content-type", "application/binary")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        batch = self.state.get_batch(batch_id)
+        if batch is None:
+            self._not_found()
+        else:
+            self._send_json(200, batch)
+
+    def _stream(self, message):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+        def event(name, payload):
+            chunk = f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.flush()
+
+        usage = message["usage"]
+        start = dict(message, content=[], usage=dict(usage, output_tokens=1))
+        event("message_start", {"type": "message_start", "message": start})
+        event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        for word in re.findall(r"\S+\s*", message["content"][0]["text"]):
+            event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}})
+            time.sleep(0.005)
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(port: int = 0, state: StubState = None) -> ThreadingHTTPServer:
+    handler = type("Handler", (StubHandler,), {"state": state or StubState()})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def run_check():
+    """Ask two questions about the same long guideline and show the cache write, then the read"""
+    server = make_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["CLAUDE_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    from utils.claude_api import ClaudeAPI
+    from utils.token_budget import get_token_usage_log
+
+    api = ClaudeAPI("stub-key")
+    pages = {
+        page: f"Section {page}. Patients with type 2 diabetes and HbA1c above target should have therapy intensified. " * 20
+        for page in range(1, 21)
+    }
+    patient = {"name": "Test Patient", "age": 60, "diagnosis": "Type 2 Diabetes"}
+    for question in ("What HbA1c target applies?", "When should therapy be intensified?"):
+        api.query_guidelines(question, patient, "diabetes", document_pages=pages)
+    records = list(get_token_usage_log().records)[-2:]
+    print()
+    for record in records:
+        print(f"{record['call']}: cache write {record['cache_write_tokens']}, cache read {record['cache_read_tokens']}, {record['latency'] * 1000:.0f} ms")
+    server.shutdown()
+    ok = records[0]["cache_write_tokens"] > 0 and records[1]["cache_read_tokens"] == records[0]["cache_write_tokens"]
+    print("prompt cache prefix reused" if ok else "prompt cache prefix NOT reused")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="fixed seconds added to every response")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0, help="simulated ms per 1k uncached input tokens")
+    parser.add_argument("--rpm", type=int, default=0, help="answer requests over this many per minute with 429 (0 = unlimited)")
+    parser.add_argument("--check", action="store_true", help="run the prompt caching round trip and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(run_check())
+
+    server = make_server(args.port, StubState(args.latency, args.prefill_ms_per_1k, args.rpm))
+    print(f"Stub Anthropic API on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,429 @@
+# =====================================
+# devtools/stub_fhir.py
+# =====================================
+"""
+Local stand-in for the EHR's FHIR patient endpoint.
+
+Serves GET /api/patient (the current patient) and /api/Patient/<id> (any
+patient of a small clinic panel; GET /api/Patient lists them) as FHIR Patient
+resources
+with meta.versionId and a matching weak ETag, and answers If-None-Match
+with 304 Not Modified while the version is unchanged. POST /api/patient
+bumps the version (a new lab result arrives), as does --update-every.
+GET /api/Observation searches two years of the patient's lab results, with
+_lastUpdated=gt<instant> or ge<instant> delta queries and _count paging; every version
+bump files a new HbA1c result. GET /api/Patient/<id>/$everything streams a synthetic chart Bundle with
+--observations lab and vital-sign results plus conditions, medication
+requests and encounters. --latency delays every response to simulate a
+slow EHR.
+
+Run it in place of the Express server:
+
+    python devtools/stub_fhir.py --port 8080 --latency 0.5
+    streamlit run app.py
+
+Worklist mode prefetches the panel:
+
+    MEDGUIDE_WORKLIST_SEARCH=Patient streamlit run app.py
+
+Or check the cached, conditionally refreshed fetch end to end:
+
+    python devtools/stub_fhir.py --check
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PATIENT_ID = "example-patient"
+
+# (id, given, family, gender, birth date, diagnosis) of the clinic panel; the first is the EHR's current patient
+PANEL = [
+    (PATIENT_ID, "Maria", "Garcia", "female", "1962-04-18", "Type 2 Diabetes"),
+    ("panel-2", "James", "Wilson", "male", "1971-09-02", "Type 2 Diabetes, Hypertension"),
+    ("panel-3", "Sarah", "Johnson", "female", "1978-01-23", "Breast Cancer"),
+    ("panel-4", "Robert", "Chen", "male", "1958-06-11", "Hyperlipidemia"),
+    ("panel-5", "Linda", "Okafor", "female", "1966-12-30", "Hypertension")
+]
+_PANEL_BY_ID = {row[0]: row for row in PANEL}
+
+# (LOINC code, display, unit, low, high) of the synthetic chart's observations
+CHART_OBSERVATIONS = [
+    ("4548-4", "HbA1c", "%", 6.0, 10.0),
+    ("2345-7", "Glucose", "mg/dL", 80, 240),
+    ("13457-7", "LDL", "mg/dL", 70, 190),
+    ("2085-9", "HDL", "mg/dL", 30, 70),
+    ("33914-3", "eGFR", "mL/min/1.73m2", 40, 100),
+    ("8867-4", "Heart rate", "/min", 55, 100),
+    ("29463-7", "Body weight", "kg", 70, 95),
+    ("39156-5", "BMI", "kg/m2", 24, 34)
+]
+CHART_CONDITIONS = ["Type 2 diabetes mellitus", "Essential hypertension", "Hyperlipidemia"]
+CHART_MEDICATIONS = [("Metformin 1000 mg tablet", "1 tablet twice daily"), ("Lisinopril 10 mg tablet", "1 tablet daily")]
+
+
+def iter_everything_bundle(patient, observations: int = 1000, seed: int = 0):
+    """
+    JSON text of a Patient/$everything Bundle, yielded entry by entry so
+    bundles of any size can be streamed or written without building them.
+    Every resource carries a narrative div and identifiers like real EHR
+    exports, which is most of the bytes.
+    """
+    rng = random.Random(seed)
+    narrative = "<div xmlns=\"http://www.w3.org/1999/xhtml\">" + "Result reviewed and filed to chart. " * 20 + "</div>"
+
+    def entry(resource):
+        resource.setdefault("text", {"status": "generated", "div": narrative})
+        resource.setdefault("subject", {"reference": f"Patient/{patient['id']}"})
+        resource.setdefault("identifier", [{"system": "urn:oid:2.16.840.1.113883.19.5", "value": f"{rng.getrandbits(64):x}"}])
+        return json.dumps({"fullUrl": f"urn:uuid:{rng.getrandbits(128):032x}", "resource": resource, "search": {"mode": "match"}})
+
+    yield '{"resourceType": "Bundle", "id": "everything", "type": "searchset", "total": %d, "entry": [' % (observations + 8)
+    yield json.dumps({"fullUrl": f"Patient/{patient['id']}", "resource": patient, "search": {"mode": "match"}})
+    for condition in CHART_CONDITIONS:
+        yield "," + entry({
+            "resourceType": "Condition",
+            "clinicalStatus": {"coding": [{"system": "http://terminology.hl7.org/CodeSystem/condition-clinical", "code": "active"}]},
+            "code": {"text": condition}
+        })
+    for medication, dosage in CHART_MEDICATIONS:
+        yield "," + entry({
+            "resourceType": "MedicationRequest",
+            "status": "active",
+            "intent": "order",
+            "medicationCodeableConcept": {"text": medication},
+            "dosageInstruction": [{"text": dosage}]
+        })
+    for day in range(observations):
+        if day % 50 == 0:
+            yield "," + entry({"resourceType": "Encounter", "status": "finished", "class": {"code": "AMB"}})
+        code, display, unit, low, high = CHART_OBSERVATIONS[day % len(CHART_OBSERVATIONS)]
+        effective = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1_500_000_000 + day * 3600))
+        yield "," + entry({
+            "resourceType": "Observation",
+            "status": "final",
+            "category": [{"coding": [{"system": "http://terminology.hl7.org/CodeSystem/observation-category", "code": "laboratory"}]}],
+            "code": {"coding": [{"system": "http://loinc.org", "code": code, "display": display}], "text": display},
+            "effectiveDateTime": effective,
+            "valueQuantity": {"value": round(rng.uniform(low, high), 1), "unit": unit, "system": "http://unitsofmeasure.org"}
+        })
+    yield "]}"
+
+
+class StubState:
+    """The patient record, its version and request counters"""
+
+    def __init__(self, latency: float = 0.0, observations: int = 1000):
+        self.latency = latency
+        self.observations = observations
+        self.version = 1
+        self.full_responses = 0
+        self.not_modified = 0
+        self.observation_searches = 0
+        self._lock = threading.Lock()
+        self._updates = 0
+        self.lab_history = self._initial_lab_history()
+
+    def _last_updated(self):
+        """Strictly increasing meta.lastUpdated instants"""
+        self._updates += 1
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - 86400 + self._updates)) + "Z"
+
+    def _observation(self, code, display, unit, value, effective, components=None):
+        resource = {
+            "resourceType": "Observation",
+            "id": f"obs-{len(self.lab_history) if hasattr(self, 'lab_history') else 0}-{self._updates}",
+            "meta": {"lastUpdated": self._last_updated()},
+            "status": "final",
+            "subject": {"reference": f"Patient/{PATIENT_ID}"},
+            "code": {"coding": [{"system": "http://loinc.org", "code": code, "display": display}], "text": display},
+            "effectiveDateTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(effective))
+        }
+        if components:
+            resource["component"] = [
+                {"code": {"coding": [{"system": "http://loinc.org", "code": c}], "text": d}, "valueQuantity": {"value": v, "unit": unit}}
+                for c, d, v in components
+            ]
+        else:
+            resource["valueQuantity"] = {"value": value, "unit": unit}
+        return resource
+
+    def _initial_lab_history(self):
+        """Monthly HbA1c and blood pressure and quarterly LDL over the last two years, improving slowly"""
+        history = []
+        start = time.time() - 730 * 86400
+        for month in range(24):
+            effective = start + month * 30.4 * 86400
+            history.append(self._observation("4548-4", "HbA1c", "%", round(9.2 - month * 0.06, 1), effective))
+            history.append(self._observation("85354-9", "Blood pressure", "mm[Hg]", None, effective, [
+                ("8480-6", "Systolic blood pressure", 150 - month),
+                ("8462-4", "Diastolic blood pressure", 92 - month // 2)
+            ]))
+            if month % 3 == 0:
+                history.append(self._observation("13457-7", "LDL", "mg/dL", 160 - month * 2, effective))
+        return history
+
+    def bump(self):
+        """A new version of the patient, with a new HbA1c result filed"""
+        with self._lock:
+            self.version += 1
+            self.lab_history.append(self._observation("4548-4", "HbA1c", "%", round(7.0 + self.version / 10, 1), time.time()))
+            return self.version
+
+    def search_observations(self, query, base_url):
+        """A searchset page of lab results matching patient, _lastUpdated=gt.../ge... and _count/_offset"""
+        patient = query.get("patient", [PATIENT_ID])[0]
+        since = query.get("_lastUpdated", [""])[0]
+        count = int(query.get("_count", [50])[0])
+        offset = int(query.get("_offset", [0])[0])
+        with self._lock:
+            self.observation_searches += 1
+            matches = [
+                resource for resource in self.lab_history
+                if patient == PATIENT_ID and (
+                    since[:2] not in ("gt", "ge")
+                    or resource["meta"]["lastUpdated"] > since[2:]
+                    or (since[:2] == "ge" and resource["meta"]["lastUpdated"] == since[2:])
+                )
+            ]
+        matches.sort(key=lambda resource: resource["meta"]["lastUpdated"])
+        bundle = {
+            "resourceType": "Bundle",
+            "type": "searchset",
+            "total": len(matches),
+            "link": [],
+            "entry": [{"resource": resource, "search": {"mode": "match"}} for resource in matches[offset:offset + count]]
+        }
+        if offset + count < len(matches):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query["_offset"] = offset + count
+            bundle["link"].append({"relation": "next", "url": f"{base_url}/api/Observation?{urlencode(next_query)}"})
+        return bundle
+
+    def etag(self):
+        return f'W/"{self.version}"'
+
+    def patient(self, patient_id: str = PATIENT_ID):
+        """A panel patient as a FHIR Patient in the shape app.py parses; the HbA1c changes with every version"""
+        patient_id, given, family, gender, birth_date, diagnosis = _PANEL_BY_ID[patient_id]
+        with self._lock:
+            version = self.version
+        return {
+            "resourceType": "Patient",
+            "id": patient_id,
+            "meta": {"versionId": str(version), "lastUpdated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+            "name": [{"given": [given], "family": family}],
+            "gender": gender,
+            "birthDate": birth_date,
+            "extension": [
+                {"url": "http://example.org/fhir/StructureDefinition/diagnosis", "valueString": diagnosis},
+                {
+                    "url": "http://example.org/fhir/StructureDefinition/recentLabs",
+                    "extension": [
+                        {"url": "lab", "valueCoding": {"display": "HbA1c", "code": f"{7.0 + version / 10:.1f}%"}},
+                        {"url": "lab", "valueCoding": {"display": "eGFR", "code": "72 mL/min"}}
+                    ]
+                }
+            ]
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _stream_everything(self):
+        self.send_response(200)
+        self.send_header("content-type", "application/fhir+json")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        for text in iter_everything_bundle(self.state.patient(), self.state.observations):
+            chunk = text.encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _patient_id(self):
+        """The panel patient a /api/patient or /api/Patient/<id> path refers to, or None"""
+        path = self.path.rstrip("/")
+        if path == "/api/patient":
+            return PATIENT_ID
+        if path.startswith("/api/Patient/") and path[len("/api/Patient/"):] in _PANEL_BY_ID:
+            return path[len("/api/Patient/"):]
+        return None
+
+    def _send(self, status, payload=None, etag=None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("content-type", "application/fhir+json")
+        if etag:
+            self.send_header("etag", etag)
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.state.latency)
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") == "/api/Observation":
+            base_url = f"http://{self.headers.get('host', '127.0.0.1')}"
+            self._send(200, self.state.search_observations(parse_qs(url.query), base_url))
+            return
+        if url.path.rstrip("/") == "/api/Patient":
+            entries = [{"resource": self.state.patient(row[0]), "search": {"mode": "match"}} for row in PANEL]
+            self._send(200, {"resourceType": "Bundle", "type": "searchset", "total": len(entries), "entry": entries})
+            return
+        if self.path.rstrip("/") == f"/api/Patient/{PATIENT_ID}/$everything":
+            self._stream_everything()
+            return
+        patient_id = self._patient_id()
+        if patient_id is None:
+            self._send(404, {"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "not-found"}]})
+            return
+        etag = self.state.etag()
+        if self.headers.get("if-none-match") == etag:
+            self.state.not_modified += 1
+            self._send(304, etag=etag)
+            return
+        self.state.full_responses += 1
+        self._send(200, self.state.patient(patient_id), etag=etag)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        if self._patient_id() is None:
+            self._send(404, {"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "not-found"}]})
+            return
+        self.state.bump()
+        self._send(200, self.state.patient(self._patient_id()), etag=self.state.etag())
+
+
+def make_server(port: int = 0, state: StubState = None) -> ThreadingHTTPServer:
+    handler = type("Handler", (StubHandler,), {"state": state or StubState()})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def run_check():
+    """Cold fetch, cached reads, a 304 revalidation, a picked-up update and a timed-out slow EHR"""
+    from utils.fhir_client import FhirClient
+
+    state = StubState(latency=0.2)
+    server = make_server(state=state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = FhirClient(f"http://127.0.0.1:{server.server_address[1]}/api", timeout=1.0, max_age=0.5)
+    ok = True
+
+    def timed_read():
+        started = time.perf_counter()
+        patient = client.get_patient()
+        return patient, (time.perf_counter() - started) * 1000
+
+    def wait_for_revalidation():
+        deadline = time.monotonic() + 5
+        while client._revalidating and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    patient, ms = timed_read()
+    print(f"cold fetch: version {patient['meta']['versionId']} in {ms:.0f} ms")
+    patient, ms = timed_read()
+    print(f"cached read: version {patient['meta']['versionId']} in {ms:.1f} ms")
+    ok &= ms < 50
+
+    time.sleep(0.6)
+    patient, ms = timed_read()
+    wait_for_revalidation()
+    print(f"stale read: served in {ms:.1f} ms, background revalidation got {state.not_modified} x 304")
+    ok &= ms < 50 and state.not_modified == 1
+
+    state.bump()
+    time.sleep(0.6)
+    client.get_patient()
+    wait_for_revalidation()
+    patient, _ = timed_read()
+    print(f"after an update: version {patient['meta']['versionId']}, HbA1c {patient['extension'][1]['extension'][0]['valueCoding']['code']}")
+    ok &= patient["meta"]["versionId"] == str(state.version)
+
+    state.latency = 3.0
+    started = time.perf_counter()
+    patient = client.refresh_patient()
+    ms = (time.perf_counter() - started) * 1000
+    print(f"slow EHR: refresh gave up after {ms:.0f} ms and kept version {patient['meta']['versionId']}")
+    ok &= ms < 1500 and patient is not None
+    state.latency = 0.0
+
+    from utils.lab_store import LabStore
+    lab_store = LabStore(client, max_age=0)
+    read = lab_store.sync(PATIENT_ID)
+    print(f"lab history: first sync read {read} results ({state.observation_searches} search requests)")
+    results = len(lab_store.series(PATIENT_ID, "4548-4"))
+    state.bump()
+    read = lab_store.sync(PATIENT_ID)
+    added = len(lab_store.series(PATIENT_ID, "4548-4")) - results
+    print(f"lab history: delta sync read {read} result(s), {added} new (the watermark result is deduplicated)")
+    ok &= read == 2 and added == 1
+    for line in lab_store.trend_lines(PATIENT_ID, sync=False):
+        print(f"  {line}")
+
+    chart = client.get_patient_everything(PATIENT_ID)
+    observations = sum(1 for e in chart["entry"] if e["resource"]["resourceType"] == "Observation")
+    print(f"$everything of {state.observations} observations reduced to {len(chart['entry'])} entries ({observations} latest observations)")
+    ok &= observations == len(CHART_OBSERVATIONS)
+
+    from utils.worklist import Worklist, search_worklist
+    panel = search_worklist("Patient", client)
+    worklist = Worklist(panel, client, LabStore(client))
+    worklist.prefetch()
+    for patient_id in panel:
+        worklist.switch_to(patient_id)
+    stats = worklist.stats()
+    started = time.perf_counter()
+    patient, _ = worklist.switch_to(panel[-1])
+    ms = (time.perf_counter() - started) * 1000
+    print(f"worklist: {stats['ready']} of {stats['patients']} prefetched in {stats['prefetch_seconds']:.2f}s, switch to {patient.name} in {ms:.2f} ms")
+    ok &= stats["ready"] == len(PANEL) and ms < 50
+
+    print(f"client stats: {client.stats()}")
+    server.shutdown()
+    print("conditional patient fetch OK" if ok else "conditional patient fetch FAILED")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--observations", type=int, default=1000, help="observations in the $everything bundle")
+    parser.add_argument("--update-every", type=float, default=0.0, help="bump the patient version every this many seconds (0 = never)")
+    parser.add_argument("--check", action="store_true", help="run the conditional fetch round trip and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(run_check())
+
+    state = StubState(args.latency, args.observations)
+    if args.update_every > 0:
+        def updater():
+            while True:
+                time.sleep(args.update_every)
+                state.bump()
+        threading.Thread(target=updater, daemon=True).start()
+
+    server = make_server(args.port, state)
+    print(f"Stub FHIR server on http://127.0.0.1:{args.port}/api/patient")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,265 @@
+# =====================================
+# jobs/batch_notes.py
+# =====================================
+"""
+Generate assessment-and-plan notes for a whole clinic panel from the command line.
+
+Reads a cohort file and writes one clinical note per patient and condition
+to a JSONL file, sending the requests through a bounded pool of workers
+(rate limited like the app). The cohort is a JSON array; each entry names
+its patient inline ("patient", either a MedGuide patient dict or a FHIR
+Patient or patient Bundle), as a JSON file relative to the cohort
+("patient_file", same formats), by FHIR id ("fhir_patient_id", read from
+MEDGUIDE_FHIR_BASE_URL with the lab trends the app shows) or as a sample
+patient ("sample_patient": "diabetes"), plus the "condition" or list of
+"conditions" to write notes for:
+
+    [
+      {"fhir_patient_id": "p001", "conditions": ["diabetes", "hypertension"]},
+      {"patient_file": "patients/p002.json", "condition": "breast cancer"},
+      {"sample_patient": "diabetes", "condition": "diabetes"}
+    ]
+
+Each output line holds the note with its patient, condition, token usage
+and latency, and is written as soon as the note is back. A rerun with the
+same output file skips the notes already in it, so an interrupted or
+partly failed run is resumed by running it again; --force starts over.
+
+    python jobs/batch_notes.py cohort.json notes.jsonl --workers 4
+
+To try it locally, run devtools/stub_anthropic.py (and devtools/stub_fhir.py
+for FHIR ids) and set CLAUDE_API_BASE_URL=http://localhost:8089/v1
+CLAUDE_API_KEY=stub.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Any, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.sample_data import get_sample_patient
+from utils.claude_api import ClaudeAPI
+from utils.fhir_client import get_fhir_client
+from utils.lab_store import get_lab_store
+from utils.patient_model import Patient, as_patient, fhir_patient_id, patient_from_fhir
+from utils.token_budget import estimate_request_tokens
+
+
+def load_patient(entry: Dict[str, Any], base_dir: str) -> Patient:
+    """Resolve a cohort entry's patient to a Patient"""
+    if "fhir_patient_id" in entry:
+        patient_id = str(entry["fhir_patient_id"])
+        resource = get_fhir_client().get_patient(patient_id)
+        if resource is None:
+            raise LookupError(f"FHIR patient {patient_id} not found: {get_fhir_client().last_error}")
+        return patient_from_fhir(resource, lab_trends=get_lab_store().trend_lines(patient_id))
+    if "patient" in entry:
+        patient = entry["patient"]
+    elif "patient_file" in entry:
+        with open(os.path.join(base_dir, entry["patient_file"]), "r", encoding="utf-8") as f:
+            patient = json.load(f)
+    else:
+        patient = get_sample_patient(entry.get("sample_patient", entry.get("condition", "diabetes")))
+    if isinstance(patient, dict) and "resourceType" in patient:
+        return patient_from_fhir(patient)
+    return as_patient(patient)
+
+
+def patient_key(entry: Dict[str, Any], patient: Patient, index: int) -> str:
+    """Stable id of a cohort entry's patient, used to name its notes in the output"""
+    if entry.get("id"):
+        return str(entry["id"])
+    if entry.get("fhir_patient_id"):
+        return str(entry["fhir_patient_id"])
+    resource = entry.get("patient")
+    if isinstance(resource, dict) and "resourceType" in resource and fhir_patient_id(resource):
+        return fhir_patient_id(resource)
+    return entry.get("patient_file") or entry.get("sample_patient") or f"entry{index}"
+
+
+def load_cohort(path: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    One task per note to write: {"id", "patient_id", "patient", "condition"},
+    and the number of entries whose patient couldn't be loaded (reported and
+    left out, so they are tried again on the next run).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        cohort = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    tasks = []
+    unloaded = 0
+    for index, entry in enumerate(cohort):
+        try:
+            patient = load_patient(entry, base_dir)
+        except Exception as e:
+            print(f"Cohort entry {index}: could not load patient: {e}")
+            unloaded += 1
+            continue
+        key = patient_key(entry, patient, index)
+        conditions = entry.get("conditions") or [entry.get("condition") or patient.diagnosis or "general"]
+        for condition in conditions:
+            tasks.append({"id": f"{key}:{condition}", "patient_id": key, "patient": patient, "condition": condition})
+    return tasks, unloaded
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids of the notes already in an output file; a line cut short by an interrupted run is ignored"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+class Progress:
+    """Counts finished notes and their token usage, printing a line per note"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.written = 0
+        self.failed = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def notes_per_minute(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.written * 60 / elapsed if elapsed > 0 else 0.0
+
+    def done(self, task: Dict[str, Any], record: Dict[str, Any] = None, error: Exception = None) -> None:
+        with self._lock:
+            if record is not None:
+                self.written += 1
+                self.input_tokens += record["input_tokens"] or 0
+                self.output_tokens += record["output_tokens"] or 0
+                outcome = f"{record['seconds']:.1f}s"
+            else:
+                self.failed += 1
+                outcome = f"FAILED: {error}"
+            print(
+                f"[{self.written + self.failed}/{self.total}] {task['id']} {outcome} "
+                f"({self.notes_per_minute():.1f} notes/min)"
+            )
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        tokens = (
+            f", {self.input_tokens / self.written:.0f} input + {self.output_tokens / self.written:.0f} output tokens/note"
+            if self.written else ""
+        )
+        return (
+            f"Wrote {self.written}/{self.total} notes in {elapsed:.1f}s "
+            f"({self.notes_per_minute():.1f} notes/min{tokens}), {self.failed} failed"
+        )
+
+
+def generate_note(api: ClaudeAPI, task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send one note request and return its output record. Unlike
+    generate_clinical_note, errors are raised so the note is retried on the
+    next run instead of being written as an error note.
+    """
+    params = api.note_request(task["patient"], task["condition"])
+    started = time.perf_counter()
+    response = api.http.post(
+        "/messages",
+        headers=api.headers,
+        json=params,
+        rate_limiter=api.rate_limiter,
+        tokens=estimate_request_tokens(params["system"], params["messages"])
+    )
+    response.raise_for_status()
+    message = response.json()
+    note = api.note_from_message(message, task["condition"])
+    usage = message.get("usage") or {}
+    input_tokens = usage.get("input_tokens")
+    if input_tokens is not None:
+        input_tokens += (usage.get("cache_creation_input_tokens") or 0) + (usage.get("cache_read_input_tokens") or 0)
+    return {
+        "id": task["id"],
+        "patient_id": task["patient_id"],
+        "patient_name": task["patient"].name,
+        "condition": task["condition"],
+        "title": note["title"],
+        "content": note["content"],
+        "model": message.get("model", params["model"]),
+        "input_tokens": input_tokens,
+        "output_tokens": usage.get("output_tokens"),
+        "seconds": round(time.perf_counter() - started, 3),
+        "generated_at": datetime.now().isoformat(timespec="seconds")
+    }
+
+
+def run(api: ClaudeAPI, tasks: List[Dict[str, Any]], output: str, workers: int) -> Progress:
+    """Generate the notes on a bounded worker pool, appending each to output as it completes"""
+    progress = Progress(len(tasks))
+    with open(output, "a+", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="medguide-notes") as executor:
+        # Terminate a line cut short by an interrupted run so the next note starts on its own line
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        futures = {executor.submit(generate_note, api, task): task for task in tasks}
+        try:
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    progress.done(task, error=e)
+                    continue
+                # Written and flushed from this thread only, so each line is whole and kept if the run dies
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                progress.done(task, record)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("Interrupted; rerun the same command to resume")
+            raise
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cohort", help="JSON cohort file")
+    parser.add_argument("output", help="JSONL file the notes are appended to")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent note requests")
+    parser.add_argument("--force", action="store_true", help="discard the notes already in the output file")
+    args = parser.parse_args()
+
+    api = ClaudeAPI()
+    if api.api_key == "demo_key":
+        print("Set CLAUDE_API_KEY (any value works against devtools/stub_anthropic.py)")
+        sys.exit(2)
+
+    if args.force and os.path.exists(args.output):
+        os.remove(args.output)
+    tasks, unloaded = load_cohort(args.cohort)
+    done = completed_ids(args.output)
+    pending = [task for task in tasks if task["id"] not in done]
+    if done:
+        print(f"Resuming: {len(tasks) - len(pending)} of {len(tasks)} notes already in {args.output}")
+    if not pending:
+        print(f"All {len(tasks)} notes are already written")
+        sys.exit(1 if unloaded else 0)
+
+    progress = run(api, pending, args.output, args.workers)
+    print(progress.summary() + (f", {unloaded} patients not loaded" if unloaded else ""))
+    sys.exit(0 if progress.written == len(pending) and not unloaded else 1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,214 @@
+# =====================================
+# jobs/precompute.py
+# =====================================
+"""
+Precompute initial guideline recommendations and draft notes before visits.
+
+Reads an appointment list, loads each patient and asks Claude the question
+the document viewer asks when a guideline is first opened, plus a draft
+clinical note, then writes the answers to the precomputed store
+(MEDGUIDE_PRECOMPUTE_DIR) that the app reads before calling Claude live.
+
+The appointment list is a JSON array; each appointment names its patient
+by FHIR id ("fhir_patient_id", read from MEDGUIDE_FHIR_BASE_URL and
+projected exactly as the app projects it), inline ("patient", a MedGuide
+patient dict or a FHIR Patient or patient Bundle), as a JSON file relative
+to the list ("patient_file", same formats) or as a sample patient
+("sample_patient": "diabetes"), plus the "condition" for the note and the
+"guideline_ids" to precompute (default: all curated):
+
+    [
+      {"time": "09:00", "fhir_patient_id": "p001", "condition": "diabetes", "guideline_ids": ["1", "2"]},
+      {"time": "09:30", "patient_file": "patients/p002.json", "condition": "breast cancer"}
+    ]
+
+Answers for FHIR patients are stored under the patient's id and version,
+so the app finds them until the chart is next updated.
+
+By default all requests go out as one Message Batch (half price, finished
+within 24 hours, so run it the evening before); --mode pool sends them
+through a bounded pool of workers instead. Answers already in the store
+are skipped unless --force is given.
+
+    python jobs/precompute.py appointments.json
+    python jobs/precompute.py appointments.json --mode pool --workers 4
+
+To try it locally, run devtools/stub_anthropic.py and set
+CLAUDE_API_BASE_URL=http://localhost:8089/v1 CLAUDE_API_KEY=stub.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.sample_data import get_sample_guidelines, get_sample_patient
+from utils.claude_api import ClaudeAPI
+from utils.fhir_client import get_fhir_client
+from utils.lab_store import get_lab_store
+from utils.patient_model import Patient, as_patient, patient_from_fhir
+from utils.token_budget import estimate_request_tokens
+from utils.precompute_store import INITIAL_RECOMMENDATION_QUERY, get_precompute_store
+
+
+def load_patient(appointment: Dict[str, Any], base_dir: str) -> Patient:
+    """Resolve an appointment's patient to the Patient the app would show for it"""
+    if "fhir_patient_id" in appointment:
+        patient_id = str(appointment["fhir_patient_id"])
+        resource = get_fhir_client().get_patient(patient_id)
+        if resource is None:
+            raise LookupError(f"FHIR patient {patient_id} not found: {get_fhir_client().last_error}")
+        return patient_from_fhir(resource, lab_trends=get_lab_store().trend_lines(patient_id))
+    if "patient" in appointment:
+        patient = appointment["patient"]
+    elif "patient_file" in appointment:
+        with open(os.path.join(base_dir, appointment["patient_file"]), "r", encoding="utf-8") as f:
+            patient = json.load(f)
+    else:
+        patient = get_sample_patient(appointment.get("sample_patient", appointment.get("condition", "diabetes")))
+    if isinstance(patient, dict) and "resourceType" in patient:
+        return patient_from_fhir(patient)
+    return as_patient(patient)
+
+
+def load_appointments(path: str) -> List[Dict[str, Any]]:
+    """Read the appointment list and resolve each appointment's patient; appointments that fail to load are skipped"""
+    with open(path, "r", encoding="utf-8") as f:
+        appointments = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    loaded = []
+    for index, appointment in enumerate(appointments):
+        try:
+            appointment["patient"] = load_patient(appointment, base_dir)
+        except Exception as e:
+            print(f"Appointment {index}: could not load patient: {e}")
+            continue
+        loaded.append(appointment)
+    return loaded
+
+
+def build_tasks(api: ClaudeAPI, appointments: List[Dict[str, Any]], force: bool = False) -> List[Dict[str, Any]]:
+    """One task per answer to precompute, with the Messages API request for it"""
+    store = get_precompute_store()
+    default_guidelines = [guideline["id"] for guideline in get_sample_guidelines()]
+    tasks = []
+    for index, appointment in enumerate(appointments):
+        patient = appointment["patient"]
+        condition = appointment.get("condition", "diabetes")
+        for guideline_id in appointment.get("guideline_ids", default_guidelines):
+            if force or store.get_recommendations(patient, guideline_id) is None:
+                tasks.append({
+                    "custom_id": f"appt{index}-rec-{guideline_id}",
+                    "kind": "recommendations",
+                    "patient": patient,
+                    "guideline_id": guideline_id,
+                    "params": api.guideline_request(INITIAL_RECOMMENDATION_QUERY, patient, document_ids=[guideline_id])
+                })
+        if force or store.get_note(patient, condition) is None:
+            tasks.append({
+                "custom_id": f"appt{index}-note",
+                "kind": "note",
+                "patient": patient,
+                "condition": condition,
+                "params": api.note_request(patient, condition)
+            })
+    return tasks
+
+
+def store_result(api: ClaudeAPI, task: Dict[str, Any], message: Dict[str, Any]) -> None:
+    store = get_precompute_store()
+    if task["kind"] == "recommendations":
+        store.put_recommendations(task["patient"], task["guideline_id"], api.recommendations_from_message(message, INITIAL_RECOMMENDATION_QUERY))
+    else:
+        store.put_note(task["patient"], task["condition"], api.note_from_message(message, task["condition"]))
+
+
+def run_batch(api: ClaudeAPI, tasks: List[Dict[str, Any]], poll_interval: float) -> int:
+    """Send every task as one Message Batch, wait for it to end and store the results"""
+    batch = api.create_message_batch([{"custom_id": task["custom_id"], "params": task["params"]} for task in tasks])
+    print(f"Submitted batch {batch['id']} with {len(tasks)} requests")
+    while batch["processing_status"] != "ended":
+        time.sleep(poll_interval)
+        batch = api.get_message_batch(batch["id"])
+        print(f"Batch {batch['id']}: {batch['processing_status']}, {batch['request_counts']}")
+
+    by_id = {task["custom_id"]: task for task in tasks}
+    stored = 0
+    for line in api.iter_message_batch_results(batch):
+        task = by_id.get(line["custom_id"])
+        result = line["result"]
+        if task is None:
+            continue
+        if result["type"] != "succeeded":
+            print(f"{line['custom_id']}: {result['type']} {result.get('error', '')}")
+            continue
+        store_result(api, task, result["message"])
+        stored += 1
+    return stored
+
+
+def run_pool(api: ClaudeAPI, tasks: List[Dict[str, Any]], workers: int) -> int:
+    """Send the tasks as individual requests through a bounded worker pool and store the results"""
+    def send(task):
+        params = task["params"]
+        response = api.http.post(
+            "/messages",
+            headers=api.headers,
+            json=params,
+            rate_limiter=api.rate_limiter,
+            tokens=estimate_request_tokens(params["system"], params["messages"])
+        )
+        response.raise_for_status()
+        return response.json()
+
+    stored = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medguide-precompute") as executor:
+        futures = {executor.submit(send, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                store_result(api, task, future.result())
+                stored += 1
+            except Exception as e:
+                print(f"{task['custom_id']}: {e}")
+    return stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("appointments", help="JSON appointment list")
+    parser.add_argument("--mode", choices=("batch", "pool"), default="batch")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests in pool mode")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="seconds between batch status checks")
+    parser.add_argument("--force", action="store_true", help="recompute answers that are already stored")
+    args = parser.parse_args()
+
+    api = ClaudeAPI()
+    if api.api_key == "demo_key":
+        print("Set CLAUDE_API_KEY (any value works against devtools/stub_anthropic.py)")
+        sys.exit(2)
+
+    started = time.perf_counter()
+    appointments = load_appointments(args.appointments)
+    tasks = build_tasks(api, appointments, args.force)
+    if not tasks:
+        print(f"All answers for {len(appointments)} appointments are already precomputed")
+        return
+
+    if args.mode == "batch":
+        stored = run_batch(api, tasks, args.poll_interval)
+    else:
+        stored = run_pool(api, tasks, args.workers)
+    removed = get_precompute_store().purge_expired()
+    print(
+        f"Stored {stored}/{len(tasks)} answers for {len(appointments)} appointments in "
+        f"{time.perf_counter() - started:.1f}s ({removed} expired entries removed)"
+    )
+    sys.exit(0 if stored == len(tasks) else 1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -3,27 +3,99 @@
 # =====================================
 
 # Import the API classes
-from .claude_api import ClaudeAPI
-from .perplexity_api import PerplexityAPI
+from .claude_api import ClaudeAPI, get_claude_api
+from .perplexity_api import PerplexityAPI, get_perplexity_api, get_web_search_stats
+from .http_client import PooledHttpClient, get_http_client
+from .rate_limiter import AdaptiveRateLimiter, RateLimitExceeded, get_llm_rate_limiter
 
 # Import PDF utility functions
 from .pdf_utils import (
+    PdfDocument,
+    get_pdf_document,
+    open_pdf_document,
+    spool_pdf_to_disk,
     extract_text_from_pdf,
+    iter_pdf_pages,
     get_pdf_page_count,
     extract_pdf_metadata,
     pdf_to_base64,
     display_pdf,
-    display_pdf_page
+    display_pdf_page,
+    publish_pdf,
+    publish_pdf_page,
+    published_page_url
 )
+from .pdf_cache import PdfTextCache, get_pdf_cache
+from .search_index import GuidelineSearchIndex, highlight_snippet
+from .token_budget import PromptBuilder, estimate_tokens, get_token_usage_log
+from .query_orchestrator import QueryOrchestrator
+from .response_cache import ResponseCache, SingleFlight, get_response_cache
+from .recommendation_stream import RecommendationStreamParser, parse_recommendations
+from .citation_matcher import CitationMatcher, extract_page_refs, get_citation_matcher
+from .precompute_store import PrecomputeStore, get_precompute_store
+from .fhir_client import FhirClient, get_fhir_client
+from .patient_model import Patient, as_patient, patient_from_fhir
+from .fhir_bundle import ChartReducer, read_fhir_json, read_patient_chart
+from .lab_store import LabSeries, LabStore, get_lab_store
+from .worklist import Worklist, load_worklist, search_worklist, get_worklist
 
 # Define __all__ to control what's imported with "from utils import *"
 __all__ = [
     'ClaudeAPI',
     'PerplexityAPI',
+    'get_claude_api',
+    'get_perplexity_api',
+    'get_web_search_stats',
+    'PooledHttpClient',
+    'get_http_client',
+    'AdaptiveRateLimiter',
+    'RateLimitExceeded',
+    'get_llm_rate_limiter',
+    'PdfDocument',
+    'get_pdf_document',
+    'open_pdf_document',
+    'spool_pdf_to_disk',
     'extract_text_from_pdf',
+    'iter_pdf_pages',
     'get_pdf_page_count',
     'extract_pdf_metadata',
     'pdf_to_base64',
     'display_pdf',
-    'display_pdf_page'
+    'display_pdf_page',
+    'publish_pdf',
+    'publish_pdf_page',
+    'published_page_url',
+    'PdfTextCache',
+    'get_pdf_cache',
+    'GuidelineSearchIndex',
+    'highlight_snippet',
+    'PromptBuilder',
+    'estimate_tokens',
+    'get_token_usage_log',
+    'QueryOrchestrator',
+    'ResponseCache',
+    'SingleFlight',
+    'get_response_cache',
+    'RecommendationStreamParser',
+    'parse_recommendations',
+    'CitationMatcher',
+    'extract_page_refs',
+    'get_citation_matcher',
+    'PrecomputeStore',
+    'get_precompute_store',
+    'FhirClient',
+    'get_fhir_client',
+    'Patient',
+    'as_patient',
+    'patient_from_fhir',
+    'ChartReducer',
+    'read_fhir_json',
+    'read_patient_chart',
+    'LabSeries',
+    'LabStore',
+    'get_lab_store',
+    'Worklist',
+    'load_worklist',
+    'search_worklist',
+    'get_worklist'
 ]
\ No newline at end of file
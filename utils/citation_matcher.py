@@ -0,0 +1,162 @@
+# =====================================
+# utils/citation_matcher.py
+# =====================================
+import re
+import threading
+from typing import Dict, List, Any, Iterable, Optional
+
+# Sources recognised before any guideline is registered
+DEFAULT_SOURCES = [
+    ("ADA Standards of Medical Care in Diabetes", ["ADA", "American Diabetes Association", "Standards of Medical Care in Diabetes"]),
+    ("JNC Guidelines", ["JNC", "JNC 7", "JNC 8", "Joint National Committee"]),
+    ("NCCN Guidelines for Breast Cancer", ["NCCN", "National Comprehensive Cancer Network"]),
+    ("ASCO Guidelines", ["ASCO", "American Society of Clinical Oncology"]),
+    ("Breast Cancer Treatment Guidelines", ["breast cancer"])
+]
+
+# "page 12", "Page: 12", "pages 12-14", "p. 12", "pp. 12", "[Page 12]"
+PAGE_REF_RE = re.compile(r"(?<!\w)(?:pages?|pp?\.)\s*:?\s*(\d+)", re.IGNORECASE)
+
+_SPACE_RE = re.compile(r"\s+")
+_ACRONYM_RE = re.compile(r"\b[A-Z]{3,}\b")
+_TITLE_SEPARATOR_RE = re.compile(r"\s+[-–—:|]\s+")
+_FILE_EXTENSION_RE = re.compile(r"\.(?:pdf|txt|docx?)$", re.IGNORECASE)
+
+
+def _normalize_alias(alias: str) -> str:
+    return _SPACE_RE.sub(" ", alias.strip().lower())
+
+
+def _trie_pattern(aliases: Iterable[str]) -> str:
+    """
+    Regex alternation of aliases built as a prefix trie.
+
+    "nccn|nice|nih" becomes "n(?:ccn|i(?:ce|h))", so at any text position the
+    regex engine walks at most one branch per character instead of trying
+    every alias in turn. Longer aliases are tried before their prefixes.
+    Spaces in aliases match any run of whitespace.
+    """
+    trie: Dict[str, Any] = {}
+    for alias in aliases:
+        node = trie
+        for char in alias:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        terminal = "" in node
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char != ""
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+def extract_page_refs(text: str) -> List[str]:
+    """Every page number referenced in text, in order, from a single scan"""
+    return [match.group(1) for match in PAGE_REF_RE.finditer(text or "")]
+
+
+def first_page_ref(text: str) -> Optional[str]:
+    match = PAGE_REF_RE.search(text or "")
+    return match.group(1) if match else None
+
+
+class CitationMatcher:
+    """
+    Registry of guideline sources matched against answer text in one pass.
+
+    Each source is registered under its name and any number of aliases
+    (titles, title segments, abbreviations). All aliases are compiled into a
+    single case-insensitive, word-bounded pattern shaped as a prefix trie, so
+    finding every cited source takes one linear scan of the text however many
+    sources are registered, and "ada" no longer matches inside "Canada". The
+    pattern is rebuilt lazily after registrations.
+    """
+
+    def __init__(self, sources: Iterable = DEFAULT_SOURCES):
+        self._aliases: Dict[str, str] = {}
+        self._pattern: Optional[re.Pattern] = None
+        self._lock = threading.Lock()
+        for name, aliases in sources:
+            self.register(name, aliases)
+
+    def register(self, name: str, aliases: Iterable[str] = ()) -> None:
+        """Register a source under its name and aliases; re-registering an alias points it at the newer source"""
+        with self._lock:
+            for alias in [name, *aliases]:
+                alias = _normalize_alias(alias)
+                if alias:
+                    self._aliases[alias] = name
+            self._pattern = None
+
+    def register_guideline(self, guideline: Dict[str, Any]) -> None:
+        """
+        Register a curated or uploaded guideline by its title.
+
+        Aliases are the title without a file extension, its segments around
+        " - " separators (e.g. "ADA 2024" in "Diabetes Management - ADA 2024")
+        and the abbreviations of three or more capitals in it. Single-word
+        aliases other than abbreviations are skipped, since words like
+        "protocol" would match almost any answer.
+        """
+        title = guideline.get("title", "").strip()
+        if not title:
+            return
+        stem = _FILE_EXTENSION_RE.sub("", title).replace("_", " ")
+        segments = [stem, *_TITLE_SEPARATOR_RE.split(stem)]
+        aliases = {segment for segment in segments if len(segment.split()) >= 2}
+        aliases.update(_ACRONYM_RE.findall(stem))
+        self.register(title, aliases)
+
+    def _compiled(self) -> Optional[re.Pattern]:
+        with self._lock:
+            if self._pattern is None and self._aliases:
+                self._pattern = re.compile(
+                    r"(?<!\w)" + _trie_pattern(sorted(self._aliases)) + r"(?!\w)",
+                    re.IGNORECASE
+                )
+            return self._pattern
+
+    def find_sources(self, text: str) -> List[str]:
+        """Registered sources cited in text, in order of first mention"""
+        pattern = self._compiled()
+        if pattern is None or not text:
+            return []
+        sources = {}
+        for match in pattern.finditer(text):
+            source = self._aliases.get(_normalize_alias(match.group(0)))
+            if source:
+                sources.setdefault(source, None)
+        return list(sources)
+
+    def match_source(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """The first registered source cited in text, or default"""
+        pattern = self._compiled()
+        match = pattern.search(text) if pattern is not None and text else None
+        if match is None:
+            return default
+        return self._aliases.get(_normalize_alias(match.group(0)), default)
+
+    def __len__(self) -> int:
+        return len(set(self._aliases.values()))
+
+
+_matcher_instance: Optional[CitationMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_citation_matcher() -> CitationMatcher:
+    """Return the process-wide source registry used to attribute recommendations"""
+    global _matcher_instance
+    with _matcher_lock:
+        if _matcher_instance is None:
+            _matcher_instance = CitationMatcher()
+        return _matcher_instance
\ No newline at end of file
@@ -4,21 +4,132 @@
 import requests
 import json
 import os
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Iterator, Callable
 import time
+import streamlit as st
+from .http_client import get_http_client
+from .retrieval import pack_context, document_fingerprint, format_document, CONTEXT_TOKEN_BUDGET, DOCUMENT_SEPARATOR
+from .response_cache import get_response_cache, make_cache_key, normalize_query
+from .token_budget import PromptBuilder, PROMPT_TOKEN_BUDGET, estimate_tokens, estimate_request_tokens, get_token_usage_log
+from .rate_limiter import RateLimitExceeded, get_llm_rate_limiter
+from .citation_matcher import get_citation_matcher, first_page_ref
+from .recommendation_stream import RECOMMENDATION_FORMAT, RECOMMENDATION_PREFILL, RecommendationStreamParser, parse_recommendations
+from .patient_model import Patient
+
+# Guidelines up to this many tokens are sent whole as a cached prompt prefix,
+# when they also fit in the prompt token budget
+CACHED_DOCUMENT_TOKEN_BUDGET = int(os.environ.get("MEDGUIDE_CACHED_DOCUMENT_TOKENS", 24000))
+
+# Shortest prompt prefix Anthropic will cache; a breakpoint on a shorter one is ignored
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+def _mark_cache_breakpoint(system_prompt: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Put a cache_control breakpoint on the last system block if the prefix is long enough to be cached"""
+    if sum(estimate_tokens(block["text"]) for block in system_prompt) >= PROMPT_CACHE_MIN_TOKENS:
+        system_prompt[-1]["cache_control"] = {"type": "ephemeral"}
+    return system_prompt
+
+
+def _iter_sse_events(response: requests.Response) -> Iterator[Dict[str, Any]]:
+    """Yield the JSON payload of each server-sent event in a streamed Messages API response"""
+    data_lines = []
+    for line in response.iter_lines():
+        # Decode ourselves: requests assumes ISO-8859-1 for text/event-stream
+        line = line.decode("utf-8") if isinstance(line, bytes) else line
+        if line.startswith("data:"):
+            data_lines.append(line[5:].strip())
+        elif not line and data_lines:
+            yield json.loads("\n".join(data_lines))
+            data_lines = []
+    if data_lines:
+        yield json.loads("\n".join(data_lines))
+
+
+def _error_response(error: Exception) -> Dict[str, Any]:
+    """Fallback recommendations shown when Claude cannot be reached"""
+    return {
+        "recommendations": [
+            {
+                "text": "Unable to retrieve recommendations at this time.",
+                "explanation": f"There was an error communicating with Claude: {str(error)}",
+                "source": "Error",
+                "page": "N/A"
+            }
+        ]
+    }
+
+
+class GuidelineStream:
+    """
+    A streamed guideline answer.
+
+    Iterating yields text deltas as they arrive. Meanwhile .recommendations
+    fills with each recommendation object as soon as it is complete in the
+    stream, partial() gives the fields of the one still being written and
+    .free_text is set if Claude answered in prose rather than JSON, for
+    progressive rendering. Once iteration finishes, .text holds
+    the whole answer, .result the structured recommendations (same shape as
+    query_guidelines) and .time_to_first_token the seconds until the first
+    delta arrived.
+    """
+
+    def __init__(self, deltas: Iterator[str], finalize: Callable[[str], Dict[str, Any]], prefill: str = RECOMMENDATION_PREFILL):
+        self._deltas = deltas
+        self._finalize = finalize
+        self._parser = RecommendationStreamParser()
+        self._parser.feed(prefill)
+        self.recommendations = self._parser.recommendations
+        self.text = ""
+        self.result: Optional[Dict[str, Any]] = None
+        self.time_to_first_token: Optional[float] = None
+        self.started = time.perf_counter()
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for delta in self._deltas:
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - self.started
+                self.text += delta
+                self._parser.feed(delta)
+                yield delta
+        except Exception as e:
+            print(f"Error streaming from Claude API: {e}")
+            self.result = _error_response(e)
+            return
+        finally:
+            # Abandoning the stream closes the response, freeing its rate limiter slot
+            close = getattr(self._deltas, "close", None)
+            if close is not None:
+                close()
+        self.result = self._finalize(self.text)
+    
+    def partial(self) -> Optional[Dict[str, str]]:
+        """Fields streamed so far of the recommendation still being written, or None"""
+        return self._parser.partial()
+    
+    @property
+    def free_text(self) -> bool:
+        return self._parser.free_text
+
 
 class ClaudeAPI:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.environ.get("CLAUDE_API_KEY", "demo_key")
-        self.base_url = "https://api.anthropic.com/v1"
+        self.base_url = os.environ.get("CLAUDE_API_BASE_URL", "https://api.anthropic.com/v1").rstrip("/")
         self.headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01"
         }
-        self.model = "claude-3-sonnet-20240229"  # Add this line
+        self.model = os.environ.get("CLAUDE_MODEL", "claude-3-sonnet-20240229")
         self.max_tokens = 2048  # Add this line
         self.temperature = 0.7  # Add this line
+        self.context_token_budget = CONTEXT_TOKEN_BUDGET
+        self.prompt_token_budget = PROMPT_TOKEN_BUDGET
+        self.cached_document_token_budget = CACHED_DOCUMENT_TOKEN_BUDGET
+        self.http = get_http_client(self.base_url)
+        self.rate_limiter = get_llm_rate_limiter()
+        self.response_cache = get_response_cache()
     
     def _build_headers(self) -> Dict[str, str]:
             """Build the request headers for Anthropic API."""
@@ -34,17 +145,25 @@ class ClaudeAPI:
         patient_context: Dict[str, Any], 
         condition: str = "general",
         document_ids: List[str] = None,
-        document_text: str = None
+        document_text: str = None,
+        document_pages: Optional[Dict[int, str]] = None
     ) -> Dict[str, Any]:
         """
         Query Claude about medical guidelines with patient context.
         
+        Only the guideline chunks that rank highest for the query (BM25) are
+        sent, packed into self.context_token_budget tokens with their page numbers.
+        The whole request is fitted into self.prompt_token_budget input tokens;
+        long patient context is trimmed before guideline excerpts. Answers are
+        cached (see _guideline_cache_key) so repeated questions skip the API.
+        
         Args:
             query: The specific question or request
             patient_context: Patient data dictionary
             condition: The medical condition context (e.g., "diabetes", "breast cancer")
             document_ids: Optional list of guideline document IDs 
             document_text: Optional full text of the document
+            document_pages: Optional text of the document by page number, preferred over document_text
             
         Returns:
             Dictionary with recommendations and explanations
@@ -53,11 +172,238 @@ class ClaudeAPI:
         if self.api_key == 'demo_key':
             return self._get_mock_response(query, patient_context, condition)
         
+        cache_key, document_hash = self._guideline_cache_key(
+            query, patient_context, condition, document_ids, document_text, document_pages
+        )
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached["result"]
+        
+        body = self.guideline_request(
+            query, patient_context, condition, document_ids, document_text, document_pages
+        )
+        
+        # Call Anthropic API
+        try:
+            started = time.perf_counter()
+            estimated = estimate_request_tokens(body["system"], body["messages"])
+            response = self.http.post(
+                "/messages",
+                headers=self._build_headers(),
+                json=body,
+                rate_limiter=self.rate_limiter,
+                tokens=estimated
+            )
+            
+            response.raise_for_status()
+            result = response.json()
+            get_token_usage_log().record(
+                "query_guidelines",
+                estimated,
+                result.get("usage"),
+                time.perf_counter() - started
+            )
+            
+            # Parse Claude's response into a structured format
+            text = result["content"][0]["text"]
+            parsed = self.recommendations_from_text(text, query)
+            self.response_cache.put(cache_key, {"text": text, "result": parsed}, tags=[document_hash] if document_hash else [])
+            return parsed
+            
+        except Exception as e:
+            print(f"Error calling Claude API: {e}")
+            # Return a fallback response in case of API error
+            return _error_response(e)
+    
+    def guideline_request(
+        self,
+        query: str,
+        patient_context: Dict[str, Any],
+        condition: str = "general",
+        document_ids: List[str] = None,
+        document_text: str = None,
+        document_pages: Optional[Dict[int, str]] = None
+    ) -> Dict[str, Any]:
+        """Messages API request body for a guideline question, as sent by query_guidelines or in a batch"""
+        system_prompt, messages = self._build_guideline_prompt(
+            query, patient_context, condition, document_ids, document_text, document_pages
+        )
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "system": system_prompt,
+            "messages": messages
+        }
+    
+    def recommendations_from_message(self, message: Dict[str, Any], query: str) -> Dict[str, Any]:
+        """Structured recommendations from a Messages API response to guideline_request"""
+        return self.recommendations_from_text(message["content"][0]["text"], query)
+    
+    def recommendations_from_text(self, text: str, query: str) -> Dict[str, Any]:
+        """
+        Structured recommendations from the text of a guideline answer.
+        
+        The answer continues the prefilled JSON object; if it isn't valid
+        JSON the heuristic free-text parser is used instead.
+        """
+        recommendations = parse_recommendations(RECOMMENDATION_PREFILL + text)
+        if recommendations:
+            return {"recommendations": recommendations}
+        return self._parse_claude_response(text, query)
+    
+    def stream_guidelines(
+        self,
+        query: str,
+        patient_context: Dict[str, Any],
+        condition: str = "general",
+        document_ids: List[str] = None,
+        document_text: str = None,
+        document_pages: Optional[Dict[int, str]] = None
+    ) -> GuidelineStream:
+        """
+        Streaming version of query_guidelines.
+        
+        Returns a GuidelineStream that yields text deltas from the Messages API
+        server-sent events as Claude writes them; the structured recommendations
+        are available on .result once the stream has been consumed. Cached
+        answers are replayed at once and completed streams are cached.
+        """
+        if self.api_key == 'demo_key':
+            mock = {}
+            return GuidelineStream(self._iter_mock_deltas(query, patient_context, condition, mock), lambda text: mock)
+        
+        cache_key, document_hash = self._guideline_cache_key(
+            query, patient_context, condition, document_ids, document_text, document_pages
+        )
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return GuidelineStream(iter([cached["text"]]), lambda text: cached["result"])
+        
+        def finalize(text: str) -> Dict[str, Any]:
+            parsed = self.recommendations_from_text(text, query)
+            self.response_cache.put(cache_key, {"text": text, "result": parsed}, tags=[document_hash] if document_hash else [])
+            return parsed
+        
+        system_prompt, messages = self._build_guideline_prompt(
+            query, patient_context, condition, document_ids, document_text, document_pages
+        )
+        return GuidelineStream(self._iter_stream_deltas(system_prompt, messages), finalize)
+    
+    def _iter_stream_deltas(self, system_prompt: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> Iterator[str]:
+        """Send a streaming Messages API request and yield its text deltas"""
+        started = time.perf_counter()
+        first_token = None
+        usage = {}
+        estimated = estimate_request_tokens(system_prompt, messages)
+        response = self.http.post(
+            "/messages",
+            headers=self._build_headers(),
+            json={
+                "model": self.model,
+                "max_tokens": self.max_tokens,
+                "temperature": self.temperature,
+                "system": system_prompt,
+                "messages": messages,
+                "stream": True
+            },
+            stream=True,
+            rate_limiter=self.rate_limiter,
+            tokens=estimated
+        )
+        response.raise_for_status()
+        
+        with response:
+            for event in _iter_sse_events(response):
+                event_type = event.get("type")
+                if event_type == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    yield event["delta"]["text"]
+                elif event_type == "message_start":
+                    usage.update(event["message"].get("usage", {}))
+                elif event_type == "message_delta":
+                    usage.update(event.get("usage", {}))
+                elif event_type == "error":
+                    raise RuntimeError(event.get("error", {}).get("message", "stream error"))
+        
+        get_token_usage_log().record(
+            "stream_guidelines",
+            estimated,
+            usage,
+            time.perf_counter() - started,
+            time_to_first_token=first_token
+        )
+    
+    def _iter_mock_deltas(self, query: str, patient_context: Dict[str, Any], condition: str, mock_response: Dict[str, Any]) -> Iterator[str]:
+        """Stream a mock response as JSON in small chunks so demo mode behaves like the real stream; fills mock_response"""
+        mock_response.update(self._get_mock_response(query, patient_context, condition))
+        text = ", ".join(json.dumps(rec) for rec in mock_response.get("recommendations", [])) + "]}"
+        for start in range(0, len(text), 12):
+            time.sleep(0.01)
+            yield text[start:start + 12]
+    
+    def _guideline_cache_key(
+        self,
+        query: str,
+        patient_context: Dict[str, Any],
+        condition: str = "general",
+        document_ids: List[str] = None,
+        document_text: str = None,
+        document_pages: Optional[Dict[int, str]] = None
+    ):
+        """
+        Return (cache key, document content hash) for a guideline question.
+        
+        The key covers the normalized question, the condition, the content hash
+        of the guideline text and the patient context exactly as
+        _format_patient_context renders it, so patients that produce the same
+        prompt share answers and any change to an emitted field misses. The
+        document hash is the tag used to invalidate answers on re-upload.
+        """
+        document_hash = document_fingerprint(document_text, document_pages) if (document_text or document_pages) else None
+        key = make_cache_key(
+            "query_guidelines",
+            self.model,
+            normalize_query(query),
+            (condition or "general").strip().lower(),
+            sorted(document_ids or []),
+            document_hash,
+            self._format_patient_context(patient_context)
+        )
+        return key, document_hash
+    
+    def _build_guideline_prompt(
+        self,
+        query: str,
+        patient_context: Dict[str, Any],
+        condition: str = "general",
+        document_ids: List[str] = None,
+        document_text: str = None,
+        document_pages: Optional[Dict[int, str]] = None
+    ):
+        """
+        Build the (system blocks, messages) of a guideline question within the token budget.
+        
+        The prompt is ordered as a stable prefix followed by a variable suffix so
+        Anthropic prompt caching can reuse the prefix across follow-up questions:
+        
+        - system: instructions, then the whole guideline, ending in a
+          cache_control breakpoint once the prefix reaches PROMPT_CACHE_MIN_TOKENS
+        - user message: patient context, then the question
+        - assistant message: the start of the JSON answer (RECOMMENDATION_PREFILL)
+        
+        The guideline is sent whole only when it fits in
+        self.cached_document_token_budget and, with the question and the patient
+        context trimmed to its floor, in self.prompt_token_budget. Otherwise it
+        falls back to BM25-ranked excerpts for the question, which go in the
+        user message.
+        """
         # Format patient context for prompt
         patient_info = self._format_patient_context(patient_context)
         
         # Build system prompt with condition context
-        system_prompt = f"""You are a medical AI assistant helping a healthcare provider understand guidelines and make treatment decisions.
+        instructions = f"""You are a medical AI assistant helping a healthcare provider understand guidelines and make treatment decisions.
         
 Your task is to analyze medical guidelines and provide accurate, clinically relevant information that is personalized to the specific patient.
 
@@ -72,68 +418,98 @@ When answering questions:
 6. Be respectful of the provider's expertise while being helpful.
 7. If information isn't in the guidelines, admit this rather than speculate.
 
-PATIENT CONTEXT:
-{patient_info}
+Guidelines should be interpreted in light of the specific patient's clinical context, given with each question, and the primary condition: {condition}.
 
-Guidelines should be interpreted in light of this specific patient's clinical context and the primary condition: {condition}."""
+{RECOMMENDATION_FORMAT}"""
         
-        # Build main prompt
-        if document_text:
-            main_prompt = f"""I have a question about {condition} based on the following medical guideline:
-
-{document_text[:50000]}  # Limit document text to avoid token limits
+        # Fit everything into the input budget; patient context is trimmed before excerpts
+        builder = PromptBuilder(self.prompt_token_budget)
+        builder.add("instructions", instructions, required=True)
+        patient = builder.add("patient", f"PATIENT CONTEXT:{patient_info}", priority=1, min_tokens=150)
+        # What patient context would give up when trimmed to its floor
+        patient_slack = patient.tokens - min(patient.tokens, patient.min_tokens)
+        
+        # The whole guideline becomes part of the cached prefix when it fits
+        guideline = None
+        if document_text or document_pages:
+            guideline = f"MEDICAL GUIDELINE:\n\n{format_document(document_text, document_pages)}"
+            guideline_question = f"""I have a question about {condition} based on the medical guideline above. Each section of it is labelled with the page it comes from.
 
 My question is: {query}
 
-Please analyze this guideline in the context of my patient and answer my question, focusing on {condition}."""
+Please analyze the guideline in the context of my patient and answer my question, focusing on {condition}. Cite the page numbers of the sections you rely on."""
+            guideline_tokens = estimate_tokens(guideline)
+            if (guideline_tokens > self.cached_document_token_budget
+                    or guideline_tokens + estimate_tokens(guideline_question) > builder.remaining() + patient_slack):
+                guideline = None
+        
+        # Build main prompt
+        if guideline:
+            question_head = ""
+            question_tail = guideline_question
+        elif document_text or document_pages:
+            question_head = f"""I have a question about {condition} based on the following excerpts from a medical guideline. Each excerpt is labelled with the page it comes from:"""
+            question_tail = f"""My question is: {query}
+
+Please analyze these excerpts in the context of my patient and answer my question, focusing on {condition}. Cite the page numbers of the excerpts you rely on."""
         elif document_ids:
             # In a real app, you would fetch document content based on IDs
-            main_prompt = f"""I'm reviewing guidelines with IDs: {', '.join(document_ids)} related to {condition}
+            question_head = ""
+            question_tail = f"""I'm reviewing guidelines with IDs: {', '.join(document_ids)} related to {condition}
 
 My question is: {query}
 
 Please provide relevant recommendations from these guidelines for my patient with {condition}."""
         else:
-            main_prompt = f"""With regard to {condition}, {query}"""
+            question_head = ""
+            question_tail = f"""With regard to {condition}, {query}"""
         
-        # Call Anthropic API
-        try:
-            response = requests.post(
-                f"{self.base_url}/messages",
-                headers=self._build_headers(),
-                json={
-                    "model": self.model,
-                    "max_tokens": self.max_tokens,
-                    "temperature": self.temperature,
-                    "system": system_prompt,
-                    "messages": [
-                        {"role": "user", "content": main_prompt}
-                    ]
-                }
+        builder.add("question", f"{question_head}\n\n{question_tail}", required=True)
+        if guideline:
+            builder.add("guideline", guideline, required=True)
+        elif document_text or document_pages:
+            # Excerpts may use whatever patient context would give up when trimmed
+            available = builder.remaining() + patient_slack
+            packed = pack_context(
+                f"{query} {condition}",
+                document_text=document_text,
+                text_by_page=document_pages,
+                token_budget=max(0, min(self.context_token_budget, available))
             )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            # Parse Claude's response into a structured format
-            return self._parse_claude_response(result["content"][0]["text"], query)
-            
-        except Exception as e:
-            print(f"Error calling Claude API: {e}")
-            # Return a fallback response in case of API error
-            return {
-                "recommendations": [
-                    {
-                        "text": "Unable to retrieve recommendations at this time.",
-                        "explanation": f"There was an error communicating with Claude: {str(e)}",
-                        "source": "Error",
-                        "page": "N/A"
-                    }
-                ]
-            }
+            builder.add("excerpts", packed['context'], priority=2, separator=DOCUMENT_SEPARATOR)
+        prompt = builder.build()
+        if prompt['trimmed'] or prompt['dropped']:
+            print(f"Prompt over budget ({self.prompt_token_budget} tokens): trimmed {prompt['trimmed']}, dropped {prompt['dropped']}")
+        
+        sections = prompt['sections']
+        # Stable prefix: instructions, then the guideline, with the cache breakpoint on the last block
+        system_prompt = [{"type": "text", "text": instructions}]
+        if guideline:
+            system_prompt.append({"type": "text", "text": sections['guideline']})
+        _mark_cache_breakpoint(system_prompt)
+        
+        # Variable suffix: patient, then the question
+        if question_head:
+            question = f"{question_head}\n\n{sections['excerpts']}\n\n{question_tail}"
+        else:
+            question = question_tail
+        # Prefill the answer so it is always the JSON object of RECOMMENDATION_FORMAT
+        messages = [
+            {"role": "user", "content": f"{sections['patient']}\n\n{question}"},
+            {"role": "assistant", "content": RECOMMENDATION_PREFILL}
+        ]
+        return system_prompt, messages
     
     def _format_patient_context(self, patient: Dict[str, Any]) -> str:
         """Format patient data in a readable way for the prompt."""
+        if isinstance(patient, Patient):
+            # Projected patients are shared per resource version, so format each once
+            if patient.prompt_context is None:
+                patient.prompt_context = self._render_patient_context(patient)
+            return patient.prompt_context
+        return self._render_patient_context(patient)
+    
+    def _render_patient_context(self, patient: Dict[str, Any]) -> str:
         patient_str = f"""
 Name: {patient.get('name', 'Unknown')}
 Age: {patient.get('age', 'Unknown')}
@@ -163,6 +539,13 @@ Vital Signs:
             for lab, value in labs.items():
                 patient_str += f"- {lab}: {value}\n"
         
+        # Add lab trends if available
+        lab_trends = patient.get('labTrends', [])
+        if lab_trends:
+            patient_str += "\nLab Trends:\n"
+            for trend in lab_trends:
+                patient_str += f"- {trend}\n"
+        
         # Add conditions if available
         conditions = patient.get('conditions', [])
         if conditions:
@@ -183,13 +566,11 @@ Vital Signs:
         """
         Parse Claude's response into a structured format with recommendations.
         
-        This implementation uses a heuristic approach to extract recommendations
-        from Claude's free-text response.
+        Fallback for answers that aren't the requested JSON: a heuristic
+        approach to extract recommendations from Claude's free-text response.
         """
-        # For complex parsing, you might want to use a better prompt structure
-        # or have Claude return a more structured response format like JSON
-        
         recommendations = []
+        citation_matcher = get_citation_matcher()
         
         # Split the response into paragraphs
         paragraphs = response_text.split('\n\n')
@@ -204,38 +585,15 @@ Vital Signs:
                 # Try to extract quotes
                 parts = paragraph.split('"')
                 if len(parts) >= 3:  # At least one complete quote
+                    # Source and page are attributed per paragraph, in one scan each
+                    source_match = citation_matcher.match_source(paragraph, "Clinical Guidelines")
+                    page_match = first_page_ref(paragraph)
+                    
                     for j in range(1, len(parts), 2):
                         if parts[j].strip():
                             # Found a recommendation inside quotes
                             explanation = parts[j-1].strip() if j-1 >= 0 else ""
                             
-                            # Look for source/page in the text
-                            source_match = None
-                            page_match = None
-                            
-                            # Simple regex-free search for page and source indicators
-                            lower_text = paragraph.lower()
-                            if "page" in lower_text:
-                                # Extract page number - simplified approach
-                                for word in lower_text.split():
-                                    if word.startswith("page"):
-                                        page_match = word.split("page")[1].strip(".,: ")
-                                        break
-                            
-                            # Look for common guideline sources
-                            if "ada" in lower_text:
-                                source_match = "ADA Standards of Medical Care in Diabetes"
-                            elif "jnc" in lower_text:
-                                source_match = "JNC Guidelines"
-                            elif "nccn" in lower_text:
-                                source_match = "NCCN Guidelines for Breast Cancer"
-                            elif "asco" in lower_text:
-                                source_match = "ASCO Guidelines"
-                            elif "breast" in lower_text and "cancer" in lower_text:
-                                source_match = "Breast Cancer Treatment Guidelines"
-                            else:
-                                source_match = "Clinical Guidelines"
-                            
                             # Create recommendation object
                             recommendations.append({
                                 "text": parts[j].strip(),
@@ -276,59 +634,111 @@ Vital Signs:
         if self.api_key == "demo_key":
             return self._get_mock_note_response(condition, patient_data)
                 
-        # Prepare prompt
-        prompt = f"""
-        Generate a succinct assessment and plan for a clinical note based on the following:
-
-        Patient Context:
-        {json.dumps(patient_data, indent=2)}
-
-        Condition: {condition}
-
-        Requirements:
-        1. Create a structured assessment summarizing patient's current status
-        2. Provide a plan organized by problem
-        3. Include specific guideline references with page numbers
-        4. Keep it concise and formatted for direct inclusion in EHR
-        
-        Format the note with clear sections for ASSESSMENT and PLAN.
-        The note should be ready to copy and paste into an EHR system.
-        """
+        body = self.note_request(patient_data, condition)
         
         # Make API call to Claude
         try:
-            response = requests.post(
-                f"{self.base_url}/messages",
+            started = time.perf_counter()
+            estimated = estimate_request_tokens(body["system"], body["messages"])
+            response = self.http.post(
+                "/messages",
                 headers=self.headers,
-                json={
-                    "model": "claude-3-sonnet-20240229",
-                    "max_tokens": 2048,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                },
-                timeout=30
+                json=body,
+                rate_limiter=self.rate_limiter,
+                tokens=estimated
             )
             response.raise_for_status()
             result = response.json()
+            get_token_usage_log().record(
+                "generate_clinical_note",
+                estimated,
+                result.get("usage"),
+                time.perf_counter() - started
+            )
             
-            # Extract content
-            content = result["content"][0]["text"]
-            
-            return {
-                "title": f"Assessment & Plan for {condition.upper()}",
-                "content": content.strip()
-            }
+            return self.note_from_message(result, condition)
                 
-        except requests.RequestException as e:
+        except (requests.RequestException, RateLimitExceeded) as e:
             print(f"API request error: {e}")
             return {
                 "title": "Error Generating Note",
                 "content": "Unable to generate a clinical note at this time."
             }
+    
+    def note_request(self, patient_data: Dict[str, Any], condition: str) -> Dict[str, Any]:
+        """Messages API request body for a clinical note, as sent by generate_clinical_note or in a batch"""
+        # Stable instructions go first, in a cacheable system block
+        instructions = """
+        Generate a succinct assessment and plan for a clinical note based on the patient context and condition below.
+
+        Requirements:
+        1. Create a structured assessment summarizing patient's current status
+        2. Provide a plan organized by problem
+        3. Include specific guideline references with page numbers
+        4. Keep it concise and formatted for direct inclusion in EHR
+        
+        Format the note with clear sections for ASSESSMENT and PLAN.
+        The note should be ready to copy and paste into an EHR system.
+        """
+        system_prompt = _mark_cache_breakpoint([{"type": "text", "text": instructions}])
+        
+        # Fit the patient data into the input budget alongside the instructions
+        builder = PromptBuilder(self.prompt_token_budget)
+        builder.add("instructions", instructions, required=True)
+        patient_json = json.dumps(patient_data.to_dict() if isinstance(patient_data, Patient) else patient_data, indent=2)
+        builder.add("patient", patient_json, priority=1, min_tokens=500)
+        prompt = f"""Patient Context:
+{builder.build()['sections']['patient']}
+
+Condition: {condition}"""
+        
+        messages = [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        
+        return {
+            "model": self.model,
+            "max_tokens": 2048,
+            "system": system_prompt,
+            "messages": messages
+        }
+    
+    def note_from_message(self, message: Dict[str, Any], condition: str) -> Dict[str, Any]:
+        """Clinical note from a Messages API response to note_request"""
+        return {
+            "title": f"Assessment & Plan for {condition.upper()}",
+            "content": message["content"][0]["text"].strip()
+        }
+    
+    def create_message_batch(self, batch_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Submit Messages API requests as one asynchronous batch.
+        
+        Each request is {"custom_id": ..., "params": <request body>}. Batches
+        are processed within 24 hours at a lower price than individual calls;
+        poll get_message_batch until processing_status is "ended".
+        """
+        response = self.http.post("/messages/batches", headers=self._build_headers(), json={"requests": batch_requests})
+        response.raise_for_status()
+        return response.json()
+    
+    def get_message_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Current status of a message batch"""
+        response = self.http.get(f"/messages/batches/{batch_id}", headers=self._build_headers())
+        response.raise_for_status()
+        return response.json()
+    
+    def iter_message_batch_results(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Yield {"custom_id", "result"} for each request of an ended batch"""
+        response = self.http.get(batch["results_url"], headers=self._build_headers(), stream=True)
+        response.raise_for_status()
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
 
 
     def _get_mock_note_response(self, condition: str, patient_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -630,4 +1040,10 @@ Vital Signs:
                             "page": "35"
                         }
                     ]
-                }
\ No newline at end of file
+                }
+
+
+@st.cache_resource(show_spinner=False)
+def get_claude_api(api_key: Optional[str] = None) -> ClaudeAPI:
+    """Return a ClaudeAPI client shared across reruns and sessions for this API key"""
+    return ClaudeAPI(api_key)
\ No newline at end of file
@@ -0,0 +1,279 @@
+# =====================================
+# utils/fhir_bundle.py
+# =====================================
+import codecs
+import json
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Callable, Union
+
+# Resource types MedGuide reads from a patient's chart; other entries are dropped as they stream past
+CHART_RESOURCE_TYPES = ("Patient", "Observation", "MedicationRequest", "Condition")
+
+# Bytes requested from the response per read
+BUNDLE_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _ChunkReader:
+    """
+    Text buffer over an iterable of byte (or str) chunks.
+
+    Only the unconsumed tail of the input is held: every refill drops the
+    text before pos, so memory stays at one value plus one chunk however
+    large the document is.
+    """
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def fill(self, at_least: int = 1) -> bool:
+        """Append at least at_least more characters, unless the input ends; False at end of input"""
+        if self.eof:
+            return False
+        parts = [self.text[self.pos:]]
+        pending = len(parts[0])
+        added = 0
+        while added < at_least:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                parts.append(self._utf8.decode(b"", final=True))
+                self.eof = True
+                break
+            if isinstance(chunk, bytes):
+                self.bytes_read += len(chunk)
+                chunk = self._utf8.decode(chunk)
+            parts.append(chunk)
+            added += len(chunk)
+        self.text = "".join(parts)
+        self.pos = 0
+        return len(self.text) > pending
+
+    def peek(self) -> str:
+        """Next non-whitespace character, without consuming it; "" at end of input"""
+        while True:
+            text, pos = self.text, self.pos
+            while pos < len(text) and text[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(text):
+                return text[pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in FHIR JSON, found {found or 'end of input'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next JSON value, reading more input until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete value; read at least as much again so retries stay linear
+                if not self.fill(max(len(self.text) - self.pos, BUNDLE_CHUNK_SIZE)):
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.text) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_fhir_entries(reader: _ChunkReader) -> Iterator[Dict[str, Any]]:
+    """Entries of a Bundle's entry array, decoded one at a time; the reader must be just inside the '['"""
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' between Bundle entries, found {separator or 'end of input'!r}")
+
+
+def read_fhir_json(
+    chunks: Iterable[Union[bytes, str]],
+    entry_filter: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+) -> Dict[str, Any]:
+    """
+    Read a FHIR JSON resource from a stream of chunks.
+
+    Top-level fields are decoded as usual. If the resource has an entry
+    array (a Bundle), each entry is decoded on its own as it streams in and
+    passed through entry_filter, which returns the (reduced) entry to keep
+    or None to drop it, so a bundle of thousands of resources never exists
+    in memory at once. Without a filter every entry is kept.
+    """
+    reader = _ChunkReader(chunks)
+    reader.expect("{")
+    resource: Dict[str, Any] = {}
+    if reader.peek() == "}":
+        return resource
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "entry" and reader.peek() == "[":
+            reader.pos += 1
+            entries = []
+            for entry in iter_fhir_entries(reader):
+                if entry_filter is not None:
+                    entry = entry_filter(entry)
+                if entry is not None:
+                    entries.append(entry)
+            resource["entry"] = entries
+        else:
+            resource[key] = reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return resource
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' in FHIR JSON, found {separator or 'end of input'!r}")
+
+
+def _concept(concept: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """A CodeableConcept reduced to its text and first coding"""
+    if not concept:
+        return {}
+    reduced = {"text": concept["text"]} if concept.get("text") else {}
+    coding = (concept.get("coding") or [{}])[0]
+    codings = {k: coding[k] for k in ("system", "code", "display") if coding.get(k)}
+    if codings:
+        reduced["coding"] = [codings]
+    return reduced
+
+
+def _observation_value(resource: Dict[str, Any]) -> Dict[str, Any]:
+    reduced = {}
+    if "valueQuantity" in resource:
+        reduced["valueQuantity"] = {k: v for k, v in resource["valueQuantity"].items() if k in ("value", "unit")}
+    elif "valueString" in resource:
+        reduced["valueString"] = resource["valueString"]
+    elif "valueCodeableConcept" in resource:
+        reduced["valueCodeableConcept"] = _concept(resource["valueCodeableConcept"])
+    return reduced
+
+
+def compact_chart_entry(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Reduce a Bundle entry to the fields MedGuide reads, or None to drop it.
+
+    Keeps the Patient, final observations (code, value, components, date),
+    and active conditions and medication requests; narrative text,
+    references, identifiers and every other resource type are discarded.
+    """
+    resource = entry.get("resource") or {}
+    resource_type = resource.get("resourceType")
+    if resource_type not in CHART_RESOURCE_TYPES:
+        return None
+    if resource_type == "Patient":
+        resource.pop("text", None)
+        return {"resource": resource}
+
+    if resource_type == "Observation":
+        if resource.get("status") in ("entered-in-error", "cancelled"):
+            return None
+        reduced = {"resourceType": "Observation", "code": _concept(resource.get("code"))}
+        reduced.update(_observation_value(resource))
+        if resource.get("category"):
+            reduced["category"] = [_concept(category) for category in resource["category"]]
+        if resource.get("component"):
+            reduced["component"] = [
+                dict(code=_concept(component.get("code")), **_observation_value(component))
+                for component in resource["component"]
+            ]
+        effective = resource.get("effectiveDateTime") or resource.get("issued")
+        if effective:
+            reduced["effectiveDateTime"] = effective
+        return {"resource": reduced}
+
+    if resource_type == "Condition":
+        status = ((resource.get("clinicalStatus") or {}).get("coding") or [{}])[0].get("code")
+        if status not in (None, "active", "recurrence", "relapse"):
+            return None
+        reduced = {"resourceType": "Condition", "code": _concept(resource.get("code"))}
+        if resource.get("onsetDateTime"):
+            reduced["onsetDateTime"] = resource["onsetDateTime"]
+        return {"resource": reduced}
+
+    # MedicationRequest
+    if resource.get("status") not in (None, "active"):
+        return None
+    reduced = {
+        "resourceType": "MedicationRequest",
+        "medicationCodeableConcept": _concept(resource.get("medicationCodeableConcept"))
+    }
+    dosage = (resource.get("dosageInstruction") or [{}])[0].get("text")
+    if dosage:
+        reduced["dosageInstruction"] = [{"text": dosage}]
+    if resource.get("authoredOn"):
+        reduced["authoredOn"] = resource["authoredOn"]
+    return {"resource": reduced}
+
+
+class ChartReducer:
+    """
+    Reduces a patient Bundle's entries to the chart MedGuide uses.
+
+    Entries are compacted by compact_chart_entry as they are added, and
+    only the most recent observation per code is held, so the kept chart
+    stays small however many results the bundle carries.
+    """
+
+    def __init__(self):
+        self._entries: List[Dict[str, Any]] = []
+        self._observations: Dict[Any, Dict[str, Any]] = {}
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        entry = compact_chart_entry(entry)
+        if entry is None:
+            return
+        resource = entry["resource"]
+        if resource.get("resourceType") != "Observation":
+            self._entries.append(entry)
+            return
+        code = resource.get("code") or {}
+        key = ((code.get("coding") or [{}])[0].get("code")) or code.get("text")
+        previous = self._observations.get(key)
+        if previous is None or resource.get("effectiveDateTime", "") >= previous["resource"].get("effectiveDateTime", ""):
+            self._observations[key] = entry
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Kept entries: the patient, conditions and medications, then the latest observations"""
+        return self._entries + list(self._observations.values())
+
+
+def read_patient_chart(chunks: Iterable[Union[bytes, str]]) -> Dict[str, Any]:
+    """
+    Read a Patient or a patient Bundle (e.g. Patient/$everything) from chunks.
+
+    A Bundle is reduced while it streams to a small Bundle of the Patient,
+    the latest observation per code, and active conditions and medication
+    requests, in the FHIR shape utils/patient_model.py projects from. Any
+    other resource is returned whole.
+    """
+    reducer = ChartReducer()
+
+    def reduce_entry(entry):
+        reducer.add(entry)
+        return None
+
+    resource = read_fhir_json(chunks, entry_filter=reduce_entry)
+    if "entry" in resource:
+        resource["entry"] = reducer.entries()
+    return resource
\ No newline at end of file
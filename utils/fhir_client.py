@@ -0,0 +1,181 @@
+# =====================================
+# utils/fhir_client.py
+# =====================================
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Callable
+import requests
+from .http_client import PooledHttpClient
+from .query_orchestrator import get_query_executor
+from .fhir_bundle import BUNDLE_CHUNK_SIZE, read_fhir_json, read_patient_chart
+
+# EHR endpoint serving the current FHIR Patient resource
+FHIR_BASE_URL = os.environ.get("MEDGUIDE_FHIR_BASE_URL", "http://localhost:8080/api")
+# Connect and read timeout for every EHR request; a slow EHR must not hang the app
+FHIR_TIMEOUT = float(os.environ.get("MEDGUIDE_FHIR_TIMEOUT", 2))
+# Seconds a cached patient is served before it is revalidated in the background
+FHIR_MAX_AGE = float(os.environ.get("MEDGUIDE_FHIR_MAX_AGE", 30))
+
+
+def resource_etag(resource: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """The ETag of a FHIR resource: the response header, else the weak ETag of meta.versionId"""
+    etag = (headers or {}).get("ETag")
+    if etag:
+        return etag
+    version_id = (resource.get("meta") or {}).get("versionId")
+    return f'W/"{version_id}"' if version_id else None
+
+
+class _CachedResource:
+    __slots__ = ("resource", "etag", "validated")
+
+    def __init__(self, resource: Dict[str, Any], etag: Optional[str]):
+        self.resource = resource
+        self.etag = etag
+        self.validated = time.monotonic()
+
+
+class FhirClient:
+    """
+    Cached, conditionally refreshed reads from the EHR's FHIR API.
+
+    The first read of a resource waits for the EHR, bounded by a strict
+    timeout. After that the cached copy is returned immediately
+    (stale-while-revalidate): once it is older than max_age a single
+    background request revalidates it with If-None-Match, so an unchanged
+    resource costs a 304 with no body and a changed one replaces the cache
+    for the next read. If the EHR is down or slow the last good copy keeps
+    being served.
+    """
+
+    def __init__(self, base_url: str = FHIR_BASE_URL, timeout: float = FHIR_TIMEOUT, max_age: float = FHIR_MAX_AGE):
+        self.base_url = base_url.rstrip("/")
+        self.max_age = max_age
+        # No retries: a retry would stretch the timeout the caller is relying on
+        self.http = PooledHttpClient(self.base_url, pool_size=2, connect_timeout=timeout, read_timeout=timeout, max_retries=0)
+        self.hits = 0
+        self.not_modified = 0
+        self.updated = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._entries: Dict[str, _CachedResource] = {}
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def read(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the resource at path: the cached copy if there is one
+        (revalidated in the background when stale), otherwise a fresh fetch.
+        Returns None if there is no cached copy and the EHR can't be reached.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self.hits += 1
+                stale = time.monotonic() - entry.validated >= self.max_age
+                if stale and path not in self._revalidating:
+                    self._revalidating.add(path)
+                    get_query_executor().submit(self._revalidate_in_background, path)
+                return entry.resource
+        return self.refresh(path)
+
+    def refresh(self, path: str) -> Optional[Dict[str, Any]]:
+        """Revalidate path now (conditionally, if cached) and return the current copy"""
+        with self._lock:
+            entry = self._entries.get(path)
+        headers = {"Accept": "application/fhir+json"}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        try:
+            # Streamed, so a large patient Bundle is reduced as it arrives instead of loaded whole
+            with self.http.get(path, headers=headers, stream=True) as response:
+                if response.status_code == 304 and entry is not None:
+                    with self._lock:
+                        entry.validated = time.monotonic()
+                        self.not_modified += 1
+                    return entry.resource
+                response.raise_for_status()
+                resource = read_patient_chart(response.iter_content(BUNDLE_CHUNK_SIZE))
+        except (requests.RequestException, ValueError) as e:
+            with self._lock:
+                self.errors += 1
+                self.last_error = str(e)
+            print(f"FHIR request error for {path}: {e}")
+            return entry.resource if entry is not None else None
+
+        with self._lock:
+            self._entries[path] = _CachedResource(resource, resource_etag(resource, response.headers))
+            self.updated += 1
+            self.last_error = None
+        return resource
+
+    def _revalidate_in_background(self, path: str) -> None:
+        try:
+            self.refresh(path)
+        finally:
+            with self._lock:
+                self._revalidating.discard(path)
+
+    def get_patient(self, patient_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The current patient (the EHR's /patient endpoint), or a patient by id"""
+        return self.read("/patient" if patient_id is None else f"/Patient/{patient_id}")
+
+    def refresh_patient(self, patient_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return self.refresh("/patient" if patient_id is None else f"/Patient/{patient_id}")
+
+    def get_patient_everything(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """A patient's chart (Patient/$everything), reduced to the resources and fields MedGuide uses"""
+        return self.read(f"/Patient/{patient_id}/$everything")
+
+    def search(self, path: str, params: Optional[Dict[str, Any]] = None, on_entry: Optional[Callable[[Dict[str, Any]], None]] = None) -> int:
+        """
+        Run a FHIR search and pass every entry of every result page to on_entry.
+
+        Pages are streamed and follow the Bundle's next links; entries are
+        not kept, so callers fold them into their own store. Search results
+        are not cached. Returns the number of entries read; request errors
+        are raised to the caller.
+        """
+        count = 0
+
+        def collect(entry):
+            nonlocal count
+            count += 1
+            if on_entry is not None:
+                on_entry(entry)
+            return None
+
+        url = path
+        while url:
+            with self.http.get(url, params=params, headers={"Accept": "application/fhir+json"}, stream=True) as response:
+                response.raise_for_status()
+                bundle = read_fhir_json(response.iter_content(BUNDLE_CHUNK_SIZE), entry_filter=collect)
+            # Next links already carry the query
+            params = None
+            url = next((link.get("url") for link in bundle.get("link") or [] if link.get("relation") == "next"), None)
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache hits, 304 revalidations, updates and errors"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "not_modified": self.not_modified,
+                "updated": self.updated,
+                "errors": self.errors,
+                "cached": len(self._entries)
+            }
+
+
+_client_instance: Optional[FhirClient] = None
+_client_lock = threading.Lock()
+
+
+def get_fhir_client() -> FhirClient:
+    """Return the process-wide FHIR client, so every session shares the cached patient"""
+    global _client_instance
+    with _client_lock:
+        if _client_instance is None:
+            _client_instance = FhirClient()
+        return _client_instance
\ No newline at end of file
@@ -0,0 +1,173 @@
+# =====================================
+# utils/http_client.py
+# =====================================
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# Connection pool and timeout settings shared by every API client
+HTTP_POOL_SIZE = int(os.environ.get("MEDGUIDE_HTTP_POOL_SIZE", 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("MEDGUIDE_HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.environ.get("MEDGUIDE_HTTP_READ_TIMEOUT", 60))
+HTTP_MAX_RETRIES = int(os.environ.get("MEDGUIDE_HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 8.0
+
+# Responses that mean the server did not process the request (overloaded,
+# rate limited or unreachable behind a gateway), so sending it again is safe
+RETRY_STATUSES = frozenset({429, 502, 503, 504, 529})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# Rate limited or overloaded: the rate limiter backs off on these
+THROTTLE_STATUSES = frozenset({429, 529})
+
+
+
+def _release_on_close(response: requests.Response, rate_limiter: Any) -> None:
+    """Release a streamed response's rate limiter slot when the response is closed, once"""
+    close = response.close
+    released = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if released.acquire(blocking=False):
+                rate_limiter.release()
+
+    response.close = close_and_release
+
+
+class PooledHttpClient:
+    """
+    Keep-alive HTTP client for one API host.
+
+    A single requests.Session with a bounded connection pool is shared by
+    every caller, so repeated queries reuse an open TLS connection instead
+    of handshaking again. Every request gets a (connect, read) timeout.
+
+    Failed requests are retried with full-jitter exponential backoff when
+    sending them again is safe: connection failures (the request never
+    reached the server), responses in RETRY_STATUSES, and read timeouts on
+    idempotent methods. Retry-After headers are honoured up to HTTP_BACKOFF_MAX.
+
+    Callers can pass a rate_limiter (see utils/rate_limiter.py) with the
+    estimated tokens of the request; every attempt, retries included, then
+    waits for capacity first and reports throttled responses back to it.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = HTTP_POOL_SIZE,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        max_retries: int = HTTP_MAX_RETRIES,
+        backoff_base: float = HTTP_BACKOFF_BASE,
+        backoff_max: float = HTTP_BACKOFF_MAX
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Full-jitter delay before retry number attempt (0-based)"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        timeout: Optional[Any] = None,
+        rate_limiter: Optional[Any] = None,
+        tokens: int = 0,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Send a request to base_url + path and return the final response.
+
+        Connection errors are raised once retries are exhausted; HTTP error
+        statuses are returned for the caller to raise_for_status(). With
+        stream=True a successful response keeps its rate_limiter slot until
+        it is closed, so the limit covers the whole body being streamed;
+        close it (e.g. use it in a with block) once done reading.
+        """
+        method = method.upper()
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire(tokens)
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if rate_limiter is not None:
+                    rate_limiter.release(success=False)
+                # A read timeout on a POST may have been processed; only retry it when idempotent
+                safe = idempotent or not isinstance(e, requests.ReadTimeout)
+                if not safe or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if rate_limiter is not None:
+                    if kwargs.get("stream") and response.status_code < 400:
+                        _release_on_close(response, rate_limiter)
+                        return response
+                    rate_limiter.release(
+                        throttled=response.status_code in THROTTLE_STATUSES,
+                        retry_after=response.headers.get("retry-after"),
+                        success=response.status_code < 500
+                    )
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                response.close()
+
+            with self._lock:
+                self.retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request and retry counters"""
+        with self._lock:
+            return {"requests": self.requests, "retries": self.retries}
+
+    def close(self) -> None:
+        self.session.close()
+
+
+@st.cache_resource(show_spinner=False)
+def get_http_client(base_url: str) -> PooledHttpClient:
+    """Return the process-wide pooled client for an API host"""
+    return PooledHttpClient(base_url)
\ No newline at end of file
@@ -0,0 +1,355 @@
+# =====================================
+# utils/lab_store.py
+# =====================================
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import requests
+
+from .fhir_client import FHIR_MAX_AGE, get_fhir_client
+from .query_orchestrator import get_query_executor
+from .response_cache import SingleFlight
+
+# Most lab trends added to the prompt's patient context
+LAB_TREND_MAX_CODES = int(os.environ.get("MEDGUIDE_LAB_TREND_MAX_CODES", 4))
+# Results listed per trend
+LAB_TREND_LAST_N = int(os.environ.get("MEDGUIDE_LAB_TREND_LAST_N", 3))
+# Patients whose lab history is kept in memory
+LAB_STORE_MAX_PATIENTS = 500
+# Observations requested per search page
+LAB_SEARCH_PAGE_SIZE = 200
+
+# LOINC code -> (threshold, direction) used for "time out of target"; listed codes are trended first, in this order
+TREND_TARGETS = {
+    "4548-4": (7.0, "above"),     # HbA1c, %
+    "13457-7": (100.0, "above"),  # LDL cholesterol (calculated), mg/dL
+    "18262-6": (100.0, "above"),  # LDL cholesterol (direct), mg/dL
+    "8480-6": (130.0, "above"),   # Systolic blood pressure, mm[Hg]
+    "8462-4": (80.0, "above"),    # Diastolic blood pressure, mm[Hg]
+    "33914-3": (60.0, "below"),   # eGFR, mL/min/1.73m2
+}
+
+_TREND_PRIORITY = {code: index for index, code in enumerate(TREND_TARGETS)}
+
+SECONDS_PER_YEAR = 365.25 * 86400
+
+
+def parse_fhir_datetime(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of a FHIR date or dateTime ("2024-03-01", "2024-03-01T08:30:00Z"); naive values are UTC"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            parsed = datetime.strptime(value[:7], "%Y-%m")
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class LabSeries:
+    """
+    Time series of one lab (one LOINC code) for one patient.
+
+    Timestamps and values are array('d') columns kept sorted by time, so a
+    patient's whole history is two flat buffers per code, and numpy reads
+    them without copying for the trend statistics.
+    """
+
+    __slots__ = ("code", "display", "unit", "times", "values", "ids", "_known_ids")
+
+    def __init__(self, code: str, display: str, unit: str = ""):
+        self.code = code
+        self.display = display
+        self.unit = unit
+        self.times = array("d")
+        self.values = array("d")
+        self.ids: List[Optional[str]] = []
+        self._known_ids = set()
+
+    def add(self, timestamp: float, value: float, observation_id: Optional[str] = None) -> bool:
+        """Add a result; a result with an id already held replaces it. Returns True if anything changed"""
+        if observation_id is not None and observation_id in self._known_ids:
+            index = self.ids.index(observation_id)
+            if self.times[index] == timestamp and self.values[index] == value:
+                return False
+            del self.times[index], self.values[index], self.ids[index]
+        elif observation_id is not None:
+            self._known_ids.add(observation_id)
+        index = bisect_right(self.times, timestamp)
+        self.times.insert(index, timestamp)
+        self.values.insert(index, value)
+        self.ids.insert(index, observation_id)
+        return True
+
+    def discard(self, observation_id: str) -> bool:
+        """Remove the result with this id, e.g. one later marked entered-in-error"""
+        if observation_id not in self._known_ids:
+            return False
+        self._known_ids.discard(observation_id)
+        index = self.ids.index(observation_id)
+        del self.times[index], self.values[index], self.ids[index]
+        return True
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def summary(self, last_n: int = LAB_TREND_LAST_N) -> Dict[str, Any]:
+        """Last values, slope per year and (with a target) the share of time out of target"""
+        times = np.frombuffer(self.times, dtype=np.float64)
+        values = np.frombuffer(self.values, dtype=np.float64)
+        summary = {
+            "code": self.code,
+            "display": self.display,
+            "unit": self.unit,
+            "count": len(values),
+            "last": values[-last_n:].tolist(),
+            "first_time": float(times[0]) if len(times) else None,
+            "last_time": float(times[-1]) if len(times) else None,
+            "slope_per_year": None,
+            "time_out_of_target": None
+        }
+        if len(values) >= 2 and times[-1] > times[0]:
+            years = (times - times[0]) / SECONDS_PER_YEAR
+            summary["slope_per_year"] = float(np.polyfit(years, values, 1)[0])
+            target = TREND_TARGETS.get(self.code)
+            if target is not None:
+                # Each result holds until the next one
+                threshold, direction = target
+                durations = np.diff(times)
+                out = values[:-1] > threshold if direction == "above" else values[:-1] < threshold
+                summary["time_out_of_target"] = float(durations[out].sum() / durations.sum())
+        return summary
+
+
+def format_trend(summary: Dict[str, Any]) -> str:
+    """One compact trend line, e.g. "HbA1c 8.9→8.4→8.2 % (Mar 2024–Sep 2025, 7 results), -0.5/yr, above 7 for 80% of the time" """
+    values = "→".join(f"{value:g}" for value in summary["last"])
+    unit = f" {summary['unit']}" if summary["unit"] else ""
+    first = datetime.fromtimestamp(summary["first_time"], timezone.utc).strftime("%b %Y")
+    last = datetime.fromtimestamp(summary["last_time"], timezone.utc).strftime("%b %Y")
+    line = f"{summary['display']} {values}{unit} ({first}–{last}, {summary['count']} results)"
+    if summary["slope_per_year"] is not None:
+        line += f", {summary['slope_per_year']:+.2g}/yr"
+    if summary["time_out_of_target"] is not None:
+        threshold, direction = TREND_TARGETS[summary["code"]]
+        line += f", {direction} {threshold:g} for {summary['time_out_of_target']:.0%} of the time"
+    return line
+
+
+class PatientLabs:
+    """A patient's lab series by LOINC code and the sync watermark"""
+
+    def __init__(self):
+        self.series: Dict[str, LabSeries] = {}
+        # Highest meta.lastUpdated seen; the next sync asks only for results updated at or after it
+        self.last_updated: Optional[str] = None
+        self.synced_at: Optional[float] = None
+        self.revision = 0
+        self._trend_lines: Optional[List[str]] = None
+        self._trend_revision = -1
+        # Arrays can't be resized while numpy views of them are alive
+        self._lock = threading.Lock()
+
+    def add_observation(self, resource: Dict[str, Any], since: Optional[str] = None) -> int:
+        """
+        Fold a FHIR Observation into the series; returns the number of results
+        added or changed. since is the watermark the sync searched from:
+        results updated exactly then may already be held, so one without an
+        id (which can't be matched to the copy held) is skipped.
+        """
+        updated = (resource.get("meta") or {}).get("lastUpdated")
+        if updated and (self.last_updated is None or updated > self.last_updated):
+            self.last_updated = updated
+        if resource.get("resourceType") != "Observation":
+            return 0
+        if since is not None and not resource.get("id") and (updated is None or updated <= since):
+            return 0
+        if resource.get("status") in ("entered-in-error", "cancelled"):
+            return self._retract(resource.get("id"))
+        timestamp = parse_fhir_datetime(resource.get("effectiveDateTime") or resource.get("issued"))
+        if timestamp is None:
+            return 0
+        # Panels such as blood pressure carry their results as components
+        parts = resource.get("component") or [resource]
+        with self._lock:
+            return self._add_parts(resource, parts, timestamp)
+
+    def _add_parts(self, resource: Dict[str, Any], parts: List[Dict[str, Any]], timestamp: float) -> int:
+        changed = 0
+        for part in parts:
+            quantity = part.get("valueQuantity") or {}
+            if not isinstance(quantity.get("value"), (int, float)):
+                continue
+            concept = part.get("code") or {}
+            coding = (concept.get("coding") or [{}])[0]
+            code = coding.get("code") or concept.get("text")
+            if not code:
+                continue
+            series = self.series.get(code)
+            if series is None:
+                display = concept.get("text") or coding.get("display") or code
+                series = self.series[code] = LabSeries(code, display, quantity.get("unit", ""))
+            observation_id = resource.get("id")
+            if observation_id and part is not resource:
+                observation_id = f"{observation_id}/{code}"
+            changed += series.add(timestamp, float(quantity["value"]), observation_id)
+        if changed:
+            self.revision += 1
+        return changed
+
+    def _retract(self, observation_id: Optional[str]) -> int:
+        if not observation_id:
+            return 0
+        with self._lock:
+            removed = sum(
+                series.discard(observation_id) + series.discard(f"{observation_id}/{series.code}")
+                for series in self.series.values()
+            )
+            if removed:
+                self.revision += 1
+            return removed
+
+    def trend_lines(self, max_codes: int = LAB_TREND_MAX_CODES) -> List[str]:
+        """Trend lines of the labs with at least two results, targeted labs first; cached per revision"""
+        with self._lock:
+            if self._trend_revision == self.revision:
+                return self._trend_lines
+            trended = [series for series in self.series.values() if len(series) >= 2]
+            trended.sort(key=lambda series: (_TREND_PRIORITY.get(series.code, len(_TREND_PRIORITY)), -len(series)))
+            self._trend_lines = [format_trend(series.summary()) for series in trended[:max_codes]]
+            self._trend_revision = self.revision
+            return self._trend_lines
+
+
+class LabStore:
+    """
+    In-memory lab history per patient, kept current with delta syncs.
+
+    The first sync for a patient pages through all of their Observations;
+    later syncs ask the FHIR server only for Observations with
+    _lastUpdated at or after the newest one already held (results sharing
+    that instant are deduplicated by id), so staying current costs one
+    small search. Concurrent syncs for a patient share one request, and a
+    patient synced within max_age is not synced again unless forced.
+    sync_in_background runs the sync on the shared query executor so a
+    page render never waits for it. Least recently used patients are
+    dropped past max_patients.
+    """
+
+    def __init__(self, fhir_client=None, max_age: float = FHIR_MAX_AGE, max_patients: int = LAB_STORE_MAX_PATIENTS):
+        self.fhir_client = fhir_client or get_fhir_client()
+        self.max_age = max_age
+        self.max_patients = max_patients
+        self.syncs = 0
+        self.results_read = 0
+        self.errors = 0
+        self._patients: "OrderedDict[str, PatientLabs]" = OrderedDict()
+        self._flights = SingleFlight()
+        self._background = set()
+        self._lock = threading.Lock()
+
+    def _labs(self, patient_id: str) -> PatientLabs:
+        with self._lock:
+            labs = self._patients.get(patient_id)
+            if labs is None:
+                labs = self._patients[patient_id] = PatientLabs()
+                while len(self._patients) > self.max_patients:
+                    self._patients.popitem(last=False)
+            else:
+                self._patients.move_to_end(patient_id)
+            return labs
+
+    def _fresh(self, labs: PatientLabs) -> bool:
+        return labs.synced_at is not None and time.monotonic() - labs.synced_at < self.max_age
+
+    def sync(self, patient_id: str, force: bool = False) -> int:
+        """Fetch Observations updated since the last sync; returns the results read (0 if skipped or failed)"""
+        labs = self._labs(patient_id)
+        if not force and self._fresh(labs):
+            return 0
+        return self._flights.do(patient_id, lambda: self._sync(patient_id, labs))
+
+    def sync_in_background(self, patient_id: str) -> None:
+        """Start a sync on the shared query executor if the history is stale; returns at once"""
+        if self._fresh(self._labs(patient_id)):
+            return
+        with self._lock:
+            if patient_id in self._background:
+                return
+            self._background.add(patient_id)
+        get_query_executor().submit(self._sync_in_background, patient_id)
+
+    def _sync_in_background(self, patient_id: str) -> None:
+        try:
+            self.sync(patient_id)
+        finally:
+            with self._lock:
+                self._background.discard(patient_id)
+
+    def _sync(self, patient_id: str, labs: PatientLabs) -> int:
+        params = {"patient": patient_id, "_sort": "_lastUpdated", "_count": LAB_SEARCH_PAGE_SIZE}
+        since = labs.last_updated
+        if since:
+            # ge rather than gt: results filed in the same instant as the watermark may not have been read yet
+            params["_lastUpdated"] = f"ge{since}"
+        try:
+            # Entries are folded into the series as they stream in
+            read = self.fhir_client.search(
+                "/Observation",
+                params,
+                on_entry=lambda entry: labs.add_observation(entry.get("resource") or {}, since=since)
+            )
+        except (requests.RequestException, ValueError) as e:
+            # Back off for max_age too, so a server without Observation search isn't asked every rerun
+            labs.synced_at = time.monotonic()
+            with self._lock:
+                self.errors += 1
+            print(f"Lab sync error for patient {patient_id}: {e}")
+            return 0
+        labs.synced_at = time.monotonic()
+        with self._lock:
+            self.syncs += 1
+            self.results_read += read
+        return read
+
+    def trend_lines(self, patient_id: str, sync: bool = True) -> List[str]:
+        """Compact lab trend lines for the patient's prompt context, syncing first if the history is stale"""
+        if sync:
+            self.sync(patient_id)
+        return self._labs(patient_id).trend_lines()
+
+    def series(self, patient_id: str, code: str) -> Optional[LabSeries]:
+        return self._labs(patient_id).series.get(code)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return patients held, series and results stored, syncs and results read"""
+        with self._lock:
+            patients = list(self._patients.values())
+            stats = {"patients": len(patients), "syncs": self.syncs, "results_read": self.results_read, "errors": self.errors}
+        stats["series"] = sum(len(labs.series) for labs in patients)
+        stats["results"] = sum(len(series) for labs in patients for series in labs.series.values())
+        return stats
+
+
+_store_instance: Optional[LabStore] = None
+_store_lock = threading.Lock()
+
+
+def get_lab_store() -> LabStore:
+    """Return the process-wide lab history store"""
+    global _store_instance
+    with _store_lock:
+        if _store_instance is None:
+            _store_instance = LabStore()
+        return _store_instance
\ No newline at end of file
@@ -0,0 +1,324 @@
+# =====================================
+# utils/patient_model.py
+# =====================================
+import html
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, List, Any, Optional
+from .response_cache import make_cache_key
+
+# Projected patients kept for reuse; one per resource version is all the app needs
+PROJECTION_CACHE_SIZE = 256
+
+_TAG_RE = re.compile(r'</?[^>]+/?>', re.IGNORECASE)
+_ENTITY_RE = re.compile(r'&[a-zA-Z0-9#]+;')
+
+# Mapping key -> slot; name, age, diagnosis and recentLabs are always present
+_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "age": "age",
+    "gender": "gender",
+    "diagnosis": "diagnosis",
+    "recentLabs": "recent_labs",
+    "vitals": "vitals",
+    "conditions": "conditions",
+    "medications": "medications",
+    "labTrends": "lab_trends"
+}
+_ALWAYS_PRESENT = ("name", "age", "diagnosis", "recentLabs")
+
+# LOINC codes of the vital signs _format_patient_context shows, by patient vitals key
+VITAL_SIGN_CODES = {
+    "8867-4": "heartRate",
+    "8302-2": "height",
+    "29463-7": "weight",
+    "39156-5": "bmi"
+}
+BLOOD_PRESSURE_CODES = ("85354-9", "55284-4")
+SYSTOLIC_CODE = "8480-6"
+DIASTOLIC_CODE = "8462-4"
+
+
+def sanitize_text(text: Any) -> str:
+    """Remove HTML tags and entities from a value and escape what is left"""
+    if text is None:
+        return ""
+    stripped = _ENTITY_RE.sub('', _TAG_RE.sub('', str(text))).strip()
+    return html.escape(stripped)
+
+
+class Patient:
+    """
+    Patient as the UI and prompts use it, projected once from its source.
+
+    Every text field is sanitized when the patient is built, so rendering it
+    needs no further escaping. Reads work like the plain patient dicts used
+    elsewhere (patient['name'], patient.get('recentLabs', {}), 'vitals' in
+    patient), and derived text such as the labs summary and the formatted
+    prompt context is computed on first use and kept on the instance.
+    Treat instances as read-only: they are shared by every session showing
+    the same resource version.
+    """
+
+    __slots__ = (
+        "id", "version_id", "name", "age", "gender", "diagnosis", "recent_labs",
+        "vitals", "conditions", "medications", "lab_trends", "extra", "_labs_text", "prompt_context"
+    )
+
+    def __init__(
+        self,
+        name: str = "Unknown Patient",
+        age: str = "Unknown",
+        diagnosis: str = "",
+        recent_labs: Optional[Dict[str, str]] = None,
+        gender: Optional[str] = None,
+        id: Optional[str] = None,
+        version_id: Optional[str] = None,
+        vitals: Optional[Dict[str, Any]] = None,
+        conditions: Optional[List[str]] = None,
+        medications: Optional[List[str]] = None,
+        lab_trends: Optional[List[str]] = None,
+        extra: Optional[Dict[str, Any]] = None
+    ):
+        self.id = id
+        self.version_id = version_id
+        self.name = name
+        self.age = age
+        self.gender = gender
+        self.diagnosis = diagnosis
+        self.recent_labs = recent_labs or {}
+        self.vitals = vitals or {}
+        self.conditions = conditions or []
+        self.medications = medications or []
+        # Compact trend lines from utils/lab_store.py
+        self.lab_trends = lab_trends or []
+        self.extra = extra or {}
+        self._labs_text: Optional[str] = None
+        # Set by ClaudeAPI._format_patient_context the first time it formats this patient
+        self.prompt_context: Optional[str] = None
+
+    @classmethod
+    def from_fhir(cls, resource: Dict[str, Any]) -> "Patient":
+        """Project a FHIR Patient resource; use patient_from_fhir to share the result per version"""
+        return cls(
+            id=resource.get("id"),
+            version_id=(resource.get("meta") or {}).get("versionId"),
+            name=_fhir_name(resource),
+            age=sanitize_text(_fhir_age(resource)),
+            gender=sanitize_text(resource.get("gender")) or None,
+            diagnosis=_fhir_diagnosis(resource),
+            recent_labs=_fhir_labs(resource)
+        )
+
+    @classmethod
+    def from_bundle(cls, bundle: Dict[str, Any]) -> "Patient":
+        """
+        Project a patient Bundle (e.g. as reduced by utils/fhir_bundle.py):
+        the Patient entry plus vital signs and labs from its observations and
+        the active conditions and medication requests.
+        """
+        resources = [entry.get("resource") or {} for entry in bundle.get("entry") or []]
+        patient_resource = next((r for r in resources if r.get("resourceType") == "Patient"), {})
+        patient = cls.from_fhir(patient_resource)
+        if not patient.version_id:
+            patient.version_id = (bundle.get("meta") or {}).get("versionId")
+
+        for resource in resources:
+            resource_type = resource.get("resourceType")
+            if resource_type == "Observation":
+                code, label = _concept_code(resource.get("code"))
+                if code in BLOOD_PRESSURE_CODES:
+                    components = {_concept_code(c.get("code"))[0]: _observation_value(c) for c in resource.get("component") or []}
+                    systolic, diastolic = components.get(SYSTOLIC_CODE), components.get(DIASTOLIC_CODE)
+                    if systolic and diastolic:
+                        patient.vitals["bloodPressure"] = sanitize_text(f"{systolic.split()[0]}/{diastolic.split()[0]}")
+                elif code in VITAL_SIGN_CODES:
+                    value = _observation_value(resource)
+                    if value:
+                        patient.vitals[VITAL_SIGN_CODES[code]] = sanitize_text(value.split()[0])
+                elif label:
+                    patient.recent_labs.setdefault(sanitize_text(label), sanitize_text(_observation_value(resource)))
+            elif resource_type == "Condition":
+                condition = sanitize_text(_concept_code(resource.get("code"))[1])
+                if condition:
+                    patient.conditions.append(condition)
+            elif resource_type == "MedicationRequest":
+                medication = _concept_code(resource.get("medicationCodeableConcept"))[1]
+                dosage = (resource.get("dosageInstruction") or [{}])[0].get("text")
+                if medication:
+                    patient.medications.append(sanitize_text(f"{medication} - {dosage}" if dosage else medication))
+
+        if not patient.diagnosis and patient.conditions:
+            patient.diagnosis = patient.conditions[0]
+        return patient
+
+    @classmethod
+    def from_dict(cls, patient: Dict[str, Any]) -> "Patient":
+        """Project a plain patient dict (e.g. a sample patient), sanitizing its text fields"""
+        return cls(
+            id=patient.get("id"),
+            name=sanitize_text(patient.get("name", "Unknown")),
+            age=sanitize_text(patient.get("age", "")),
+            gender=sanitize_text(patient.get("gender")) or None,
+            diagnosis=sanitize_text(patient.get("diagnosis", "")),
+            recent_labs={sanitize_text(k): sanitize_text(v) for k, v in (patient.get("recentLabs") or {}).items()},
+            vitals=patient.get("vitals"),
+            conditions=patient.get("conditions"),
+            medications=patient.get("medications"),
+            lab_trends=patient.get("labTrends"),
+            extra={k: v for k, v in patient.items() if k not in _FIELDS}
+        )
+
+    @property
+    def labs_text(self) -> str:
+        """Recent labs as "HbA1c: 8.2%, BP: 142/88" for the banners"""
+        if self._labs_text is None:
+            self._labs_text = ", ".join(f"{key}: {value}" for key, value in self.recent_labs.items())
+        return self._labs_text
+
+    def keys(self) -> List[str]:
+        present = [key for key, slot in _FIELDS.items() if key in _ALWAYS_PRESENT or getattr(self, slot)]
+        return present + list(self.extra)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys()
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELDS and key in self:
+            return getattr(self, _FIELDS[key])
+        return self.extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict of the patient, e.g. for JSON or cache keys"""
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"Patient({self.to_dict()!r})"
+
+
+def _concept_code(concept: Optional[Dict[str, Any]]):
+    """(first code, readable label) of a CodeableConcept"""
+    concept = concept or {}
+    coding = (concept.get("coding") or [{}])[0]
+    return coding.get("code"), concept.get("text") or coding.get("display") or coding.get("code")
+
+
+def _observation_value(resource: Dict[str, Any]) -> str:
+    """An observation's (or component's) value as display text, e.g. "8.2 %" or "142 mm[Hg]" """
+    if "valueQuantity" in resource:
+        quantity = resource["valueQuantity"]
+        value = quantity.get("value")
+        value = f"{value:g}" if isinstance(value, float) else str(value)
+        return f"{value} {quantity['unit']}" if quantity.get("unit") else value
+    if "valueString" in resource:
+        return str(resource["valueString"])
+    if "valueCodeableConcept" in resource:
+        return _concept_code(resource["valueCodeableConcept"])[1] or ""
+    return ""
+
+
+def _fhir_name(resource: Dict[str, Any]) -> str:
+    names = resource.get("name")
+    if not names:
+        return "Unknown Patient"
+    name = names[0] if isinstance(names, list) else names
+    if isinstance(name, str):
+        return sanitize_text(name) or "Unknown Patient"
+    if not isinstance(name, dict):
+        return "Unknown Patient"
+    if name.get("text"):
+        return sanitize_text(name["text"])
+    given = name.get("given") or []
+    if not isinstance(given, list):
+        given = [given]
+    full_name = " ".join([*(sanitize_text(g) for g in given), sanitize_text(name.get("family"))]).strip()
+    return full_name or "Unknown Patient"
+
+
+def _fhir_age(resource: Dict[str, Any]) -> str:
+    try:
+        birth_date = datetime.strptime(resource["birthDate"], "%Y-%m-%d")
+    except (KeyError, TypeError, ValueError):
+        return "Unknown"
+    today = date.today()
+    return str(today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day)))
+
+
+def _fhir_diagnosis(resource: Dict[str, Any]) -> str:
+    for ext in resource.get("extension") or []:
+        if "diagnosis" in ext.get("url", ""):
+            return sanitize_text(ext.get("valueString"))
+    return ""
+
+
+def _fhir_labs(resource: Dict[str, Any]) -> Dict[str, str]:
+    for ext in resource.get("extension") or []:
+        if "recentLabs" in ext.get("url", ""):
+            labs = {
+                sanitize_text(lab_ext["valueCoding"].get("display")): sanitize_text(lab_ext["valueCoding"].get("code"))
+                for lab_ext in ext.get("extension") or [] if "valueCoding" in lab_ext
+            }
+            if labs:
+                return labs
+    return {}
+
+
+_projections: "OrderedDict[Any, Patient]" = OrderedDict()
+_projections_lock = threading.Lock()
+
+
+def fhir_patient_id(resource: Dict[str, Any]) -> Optional[str]:
+    """Id of a FHIR Patient, or of the Patient entry in a patient Bundle"""
+    if resource.get("resourceType") == "Bundle":
+        for entry in resource.get("entry") or []:
+            if (entry.get("resource") or {}).get("resourceType") == "Patient":
+                return entry["resource"].get("id")
+        return None
+    return resource.get("id")
+
+
+def patient_from_fhir(resource: Dict[str, Any], lab_trends: Optional[List[str]] = None) -> Patient:
+    """
+    The Patient for a FHIR Patient or patient Bundle, projected once per
+    resource version.
+
+    Keyed on id and meta.versionId (or a hash of the resource when it has
+    no version), plus today's date since the age is derived from it and the
+    lab trend lines; every session and rerun showing that version gets the
+    same instance.
+    """
+    version_id = (resource.get("meta") or {}).get("versionId")
+    project = Patient.from_bundle if resource.get("resourceType") == "Bundle" else Patient.from_fhir
+    identity = (resource.get("id"), version_id) if version_id else make_cache_key("patient", resource)
+    key = (identity, date.today().isoformat(), tuple(lab_trends or ()))
+    with _projections_lock:
+        patient = _projections.get(key)
+        if patient is not None:
+            _projections.move_to_end(key)
+            return patient
+    patient = project(resource)
+    patient.lab_trends = [sanitize_text(trend) for trend in lab_trends or ()]
+    with _projections_lock:
+        patient = _projections.setdefault(key, patient)
+        while len(_projections) > PROJECTION_CACHE_SIZE:
+            _projections.popitem(last=False)
+    return patient
+
+
+def as_patient(patient: Any) -> Optional[Patient]:
+    """A Patient for a Patient or a plain patient dict, or None"""
+    if patient is None or isinstance(patient, Patient):
+        return patient
+    return Patient.from_dict(patient)
\ No newline at end of file
@@ -0,0 +1,189 @@
+# =====================================
+# utils/pdf_cache.py
+# =====================================
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+
+# Cache location and size can be overridden from the environment
+DEFAULT_CACHE_DIR = os.environ.get(
+    "MEDGUIDE_PDF_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "medguide", "pdf_text")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("MEDGUIDE_PDF_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+def hash_pdf_bytes(pdf_bytes: bytes) -> str:
+    """Return the content hash used to address a PDF in the cache"""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class PdfTextCache:
+    """
+    Disk-persisted cache of extracted PDF text, addressed by a hash of the PDF bytes.
+
+    Each entry is a JSON file holding the per-page text and the document metadata.
+    The total size on disk is bounded; when it is exceeded the least recently
+    used entries (oldest modification time, refreshed on every hit) are evicted.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._scan_entries())
+
+    def _entry_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _scan_entries(self):
+        """Yield (path, mtime, size) for every entry currently on disk"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield path, stat.st_mtime, stat.st_size
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached extraction by content hash.
+
+        Returns a dictionary with "text_by_page" (int page number -> text) and
+        "metadata", or None on a miss.
+        """
+        path = self._entry_path(digest)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Touch the entry so that it counts as recently used
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return {
+            "text_by_page": {int(page): text for page, text in entry.get("text_by_page", {}).items()},
+            "metadata": entry.get("metadata", {})
+        }
+
+    def put(self, digest: str, text_by_page: Dict[int, str], metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Store an extraction result, evicting old entries if the cache is over budget"""
+        payload = json.dumps({
+            "text_by_page": {str(page): text for page, text in text_by_page.items()},
+            "metadata": {key: str(value) for key, value in (metadata or {}).items()}
+        }).encode("utf-8")
+
+        if len(payload) > self.max_bytes:
+            return
+
+        path = self._entry_path(digest)
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+
+        # Write atomically so a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing PDF cache entry: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self.writes += 1
+            self._total_bytes += len(payload) - previous_size
+            over_budget = self._total_bytes > self.max_bytes
+
+        if over_budget:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits its budget"""
+        with self._lock:
+            entries = sorted(self._scan_entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+            self._total_bytes = total
+
+    def invalidate(self, digest: str) -> None:
+        """Drop a single entry from the cache"""
+        path = self._entry_path(digest)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._total_bytes -= size
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters"""
+        with self._lock:
+            for path, _, _ in list(self._scan_entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
+            self.hits = self.misses = self.writes = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current disk usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+_cache_instance: Optional[PdfTextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> PdfTextCache:
+    """Return the process-wide PDF text cache"""
+    global _cache_instance
+    with _cache_lock:
+        if _cache_instance is None:
+            _cache_instance = PdfTextCache()
+        return _cache_instance
\ No newline at end of file
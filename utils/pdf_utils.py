@@ -5,34 +5,430 @@ import PyPDF2
 import io
 import os
 import base64
-from typing import Dict, List, Any, Optional, Tuple
+import hashlib
+import mmap
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Union, Callable
 import streamlit as st
+from .pdf_cache import get_pdf_cache, hash_pdf_bytes
 
-def extract_text_from_pdf(pdf_file: io.BytesIO) -> Tuple[str, Dict[int, str]]:
+# Documents with fewer pages than this are extracted serially; below it the
+# cost of starting worker processes outweighs the parallel speed-up
+PARALLEL_PAGE_THRESHOLD = int(os.environ.get("MEDGUIDE_PDF_PARALLEL_THRESHOLD", 64))
+# Number of worker processes used for parallel extraction
+PDF_EXTRACT_WORKERS = int(os.environ.get("MEDGUIDE_PDF_EXTRACT_WORKERS", min(os.cpu_count() or 1, 8)))
+
+# Directory served by Streamlit at app/static/ (server.enableStaticServing)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+STATIC_PDF_DIR = os.path.join(STATIC_DIR, "pdf")
+STATIC_PDF_URL = os.environ.get("MEDGUIDE_STATIC_PDF_URL", "app/static/pdf")
+# Published PDFs beyond this total size are pruned, oldest first
+STATIC_PDF_MAX_BYTES = int(os.environ.get("MEDGUIDE_STATIC_PDF_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Uploads larger than this are spooled to disk in chunks and read through mmap
+# instead of being copied into memory
+UPLOAD_MEMORY_CEILING = int(os.environ.get("MEDGUIDE_UPLOAD_MEMORY_CEILING", 16 * 1024 * 1024))
+UPLOAD_SPOOL_DIR = os.environ.get("MEDGUIDE_UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "medguide_uploads"))
+# Spooled uploads beyond this total size are pruned, oldest first
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get("MEDGUIDE_UPLOAD_SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+SPOOL_CHUNK_SIZE = 1024 * 1024
+# Content hashes remembered per Streamlit upload (file_id)
+UPLOAD_DIGEST_CACHE_SIZE = 1024
+
+# Reader opened once per worker process by _init_extract_worker
+_worker_reader = None
+
+_upload_digests: "OrderedDict[str, str]" = OrderedDict()
+_upload_digests_lock = threading.Lock()
+
+def _read_pdf_bytes(pdf_file: io.BytesIO) -> bytes:
+    """Read the raw bytes of a PDF file object and rewind it"""
+    pdf_file.seek(0)
+    pdf_bytes = pdf_file.read()
+    pdf_file.seek(0)
+    return pdf_bytes
+
+def _metadata_to_dict(metadata) -> Dict[str, Any]:
+    """Convert PyPDF2 document info into a plain dictionary"""
+    if not metadata:
+        return {}
+    return {
+        "title": metadata.get("/Title", ""),
+        "author": metadata.get("/Author", ""),
+        "subject": metadata.get("/Subject", ""),
+        "creator": metadata.get("/Creator", ""),
+        "producer": metadata.get("/Producer", ""),
+        "creation_date": metadata.get("/CreationDate", ""),
+        "modification_date": metadata.get("/ModDate", "")
+    }
+
+def _join_pages(text_by_page: Dict[int, str]) -> str:
+    """Build the full document text from per-page text"""
+    return "".join(text_by_page[page] + "\n\n" for page in sorted(text_by_page))
+
+def _file_size(pdf_file: io.BytesIO) -> int:
+    """Size in bytes of a file object, leaving it rewound"""
+    pdf_file.seek(0, os.SEEK_END)
+    size = pdf_file.tell()
+    pdf_file.seek(0)
+    return size
+
+def _open_mmap(path: str) -> mmap.mmap:
+    """Map a file read-only into memory"""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def spool_pdf_to_disk(pdf_file: io.BytesIO) -> Tuple[str, str]:
+    """
+    Copy a PDF file object to the upload spool directory in fixed-size chunks.
+    Returns (content hash, path); a file already spooled is not written again.
+    """
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    hasher = hashlib.sha256()
+    pdf_file.seek(0)
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_SPOOL_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = pdf_file.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                f.write(chunk)
+        digest = hasher.hexdigest()
+        path = os.path.join(UPLOAD_SPOOL_DIR, f"{digest}.pdf")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Mark it recently used so pruning takes older uploads first
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+            _prune_pdf_dir(UPLOAD_SPOOL_DIR, UPLOAD_SPOOL_MAX_BYTES, keep=path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        pdf_file.seek(0)
+    return digest, path
+
+def _open_source(source: Union[bytes, str]):
+    """Return a seekable stream over in-memory bytes or a memory-mapped file path"""
+    if isinstance(source, str):
+        return _open_mmap(source)
+    return io.BytesIO(source)
+
+def _init_extract_worker(source: Union[bytes, str]) -> None:
+    """Open a PDF reader once in each worker process of the extraction pool"""
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(_open_source(source))
+
+def _extract_page_range(start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract text for pages [start, end) using the worker's reader"""
+    return [(i + 1, _worker_reader.pages[i].extract_text()) for i in range(start, end)]
+
+def _extract_pages_parallel(source: Union[bytes, str], page_count: int, max_workers: int) -> Dict[int, str]:
+    """Split the page range across a process pool and extract each chunk in parallel"""
+    # Use a few chunks per worker so slow pages don't leave other workers idle
+    chunk_count = min(page_count, max_workers * 4)
+    chunk_size = -(-page_count // chunk_count)
+    ranges = [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+    text_by_page = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_extract_worker, initargs=(source,)) as executor:
+        futures = [executor.submit(_extract_page_range, start, end) for start, end in ranges]
+        for future in futures:
+            text_by_page.update(future.result())
+    return text_by_page
+
+class PdfDocument:
+    """
+    A PDF parsed at most once, with lazily computed page count, metadata and text.
+
+    The source is either the PDF bytes or the path of a spooled file, which is
+    read through a read-only mmap so large uploads never live on the heap.
+    The PdfReader is only built when something actually needs it, so a
+    document whose text is already in the on-disk PDF text cache can report
+    its pages and metadata without being parsed at all. Page text is held in a
+    single dictionary; the full text is joined on demand. Instances are shared
+    between sessions, so extraction is guarded by a lock.
+    """
+
+    def __init__(self, source: Union[bytes, str], use_cache: bool = True, digest: Optional[str] = None):
+        self.source = source
+        self.path = source if isinstance(source, str) else None
+        self._stream = _open_source(source)
+        self.digest = digest or hash_pdf_bytes(self._stream if self.path else source)
+        self.use_cache = use_cache
+        self._reader = None
+        self._cached = None
+        self._text_by_page = None
+        self._partial_text = {}
+        self._metadata = None
+        self._lock = threading.RLock()
+
+        if use_cache:
+            self._cached = get_pdf_cache().get(self.digest)
+            if self._cached is not None:
+                self._text_by_page = self._cached["text_by_page"]
+
+    @classmethod
+    def from_file(cls, pdf_file: io.BytesIO, use_cache: bool = True) -> "PdfDocument":
+        """Build a document from a file-like object"""
+        return cls(_read_pdf_bytes(pdf_file), use_cache=use_cache)
+
+    @property
+    def reader(self) -> PyPDF2.PdfReader:
+        """The underlying PyPDF2 reader, parsed on first use"""
+        with self._lock:
+            if self._reader is None:
+                self._reader = PyPDF2.PdfReader(self._stream)
+            return self._reader
+
+    @property
+    def size(self) -> int:
+        """Size of the PDF in bytes"""
+        return len(self._stream) if self.path else len(self.source)
+
+    def save_to(self, path: str) -> None:
+        """Write the PDF to path, hard-linking the spooled file when possible"""
+        if self.path:
+            try:
+                os.link(self.path, path)
+            except OSError:
+                shutil.copyfile(self.path, path)
+        else:
+            with open(path, "wb") as f:
+                f.write(self.source)
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages in the document"""
+        if self._text_by_page is not None:
+            return len(self._text_by_page)
+        return len(self.reader.pages)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Document information dictionary (title, author, dates, ...)"""
+        if self._metadata is None:
+            if self._cached is not None and self._cached["metadata"]:
+                self._metadata = self._cached["metadata"]
+            else:
+                self._metadata = _metadata_to_dict(self.reader.metadata)
+        return self._metadata
+
+    def text_by_page(self, parallel: Optional[bool] = None, max_workers: Optional[int] = None) -> Dict[int, str]:
+        """
+        Text for every page keyed by 1-based page number.
+
+        When parallel is None, documents with at least PARALLEL_PAGE_THRESHOLD
+        pages are split across a pool of max_workers processes (default
+        PDF_EXTRACT_WORKERS); pass True or False to force either path.
+        """
+        with self._lock:
+            if self._text_by_page is None:
+                self._text_by_page = self._extract_text_by_page(parallel, max_workers)
+                self._partial_text = {}
+            return self._text_by_page
+
+    def _extract_text_by_page(self, parallel: Optional[bool], max_workers: Optional[int]) -> Dict[int, str]:
+        page_count = len(self.reader.pages)
+        max_workers = max_workers or PDF_EXTRACT_WORKERS
+        if parallel is None:
+            parallel = page_count >= PARALLEL_PAGE_THRESHOLD and max_workers > 1
+
+        text_by_page = {}
+        if parallel:
+            try:
+                text_by_page = _extract_pages_parallel(self.source, page_count, max_workers)
+            except Exception as e:
+                print(f"Parallel PDF extraction failed, falling back to serial: {e}")
+                text_by_page = {}
+
+        if not text_by_page:
+            for i, page in enumerate(self.reader.pages):
+                text_by_page[i+1] = page.extract_text()
+
+        if self.use_cache:
+            get_pdf_cache().put(self.digest, text_by_page, self.metadata)
+
+        return text_by_page
+
+    def page_text(self, page_num: int) -> str:
+        """Text of a single 1-based page"""
+        if self._text_by_page is not None:
+            return self._text_by_page.get(page_num, "")
+        if page_num in self._partial_text:
+            return self._partial_text[page_num]
+        if not 1 <= page_num <= self.page_count:
+            return ""
+        with self._lock:
+            return self.reader.pages[page_num - 1].extract_text()
+
+    def iter_pages(self, start_page: int = 1, end_page: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page_number, text) as each page is decoded.
+
+        Pages after the last one consumed are never extracted, so callers can
+        stop early. A complete pass from the first page also fills
+        text_by_page and the on-disk PDF text cache.
+        """
+        page_count = self.page_count
+        end_page = min(end_page or page_count, page_count)
+
+        if self._text_by_page is not None:
+            for page_num in range(start_page, end_page + 1):
+                yield page_num, self._text_by_page.get(page_num, "")
+            return
+
+        # Pages land in the shared partial dictionary so page_text can serve
+        # them while the rest of the document is still streaming
+        for page_num in range(start_page, end_page + 1):
+            with self._lock:
+                page_text = self._partial_text.get(page_num)
+                if page_text is None:
+                    page_text = self.reader.pages[page_num - 1].extract_text()
+                    self._partial_text[page_num] = page_text
+            yield page_num, page_text
+
+        with self._lock:
+            if self._text_by_page is None and len(self._partial_text) == page_count:
+                self._text_by_page = self._partial_text
+                self._partial_text = {}
+                if self.use_cache:
+                    get_pdf_cache().put(self.digest, self._text_by_page, self.metadata)
+
+    @property
+    def full_text(self) -> str:
+        """Text of the whole document, pages separated by blank lines"""
+        return _join_pages(self.text_by_page())
+
+    def extract_page(self, page_num: int) -> bytes:
+        """Return a standalone single-page PDF for a 1-based page number"""
+        if not 1 <= page_num <= self.page_count:
+            raise IndexError(f"Page number {page_num} is out of range. The PDF has {self.page_count} pages.")
+        with self._lock:
+            pdf_writer = PyPDF2.PdfWriter()
+            pdf_writer.add_page(self.reader.pages[page_num - 1])
+            output = io.BytesIO()
+            pdf_writer.write(output)
+        return output.getvalue()
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _load_pdf_document(digest: str, _source: Union[bytes, str, Callable[[], Union[bytes, str]]]) -> PdfDocument:
+    """
+    Cached PdfDocument per content hash, shared across Streamlit reruns.
+    _source may be a callable, which is only called when the document isn't cached.
+    """
+    return PdfDocument(_source() if callable(_source) else _source, digest=digest)
+
+def _pdf_source(pdf_file: io.BytesIO) -> Tuple[str, Union[bytes, str]]:
+    """(content hash, bytes) of a PDF file object, or (content hash, spooled path) above UPLOAD_MEMORY_CEILING"""
+    if _file_size(pdf_file) > UPLOAD_MEMORY_CEILING:
+        return spool_pdf_to_disk(pdf_file)
+    pdf_bytes = _read_pdf_bytes(pdf_file)
+    return hash_pdf_bytes(pdf_bytes), pdf_bytes
+
+def _known_pdf_source(pdf_file: io.BytesIO, digest: str) -> Union[bytes, str]:
+    """Source of a PDF file object whose content hash is already known, without hashing it again"""
+    path = os.path.join(UPLOAD_SPOOL_DIR, f"{digest}.pdf")
+    if os.path.exists(path):
+        return path
+    if _file_size(pdf_file) > UPLOAD_MEMORY_CEILING:
+        return spool_pdf_to_disk(pdf_file)[1]
+    return _read_pdf_bytes(pdf_file)
+
+def _remembered_digest(pdf_file: io.BytesIO) -> Optional[str]:
+    file_id = getattr(pdf_file, "file_id", None)
+    if file_id is None:
+        return getattr(pdf_file, "_medguide_digest", None)
+    with _upload_digests_lock:
+        digest = _upload_digests.get(file_id)
+        if digest is not None:
+            _upload_digests.move_to_end(file_id)
+        return digest
+
+def _remember_digest(pdf_file: io.BytesIO, digest: str) -> None:
+    file_id = getattr(pdf_file, "file_id", None)
+    if file_id is None:
+        try:
+            pdf_file._medguide_digest = digest
+        except AttributeError:
+            pass
+        return
+    with _upload_digests_lock:
+        _upload_digests[file_id] = digest
+        while len(_upload_digests) > UPLOAD_DIGEST_CACHE_SIZE:
+            _upload_digests.popitem(last=False)
+
+def get_pdf_document(pdf_file: io.BytesIO) -> PdfDocument:
+    """
+    Return the shared PdfDocument for a PDF file object.
+
+    Files larger than UPLOAD_MEMORY_CEILING are spooled to disk and memory
+    mapped rather than read into memory in one piece.
+
+    The content hash is remembered per Streamlit upload (file_id), which
+    survives reruns, or on the file object itself, so later calls for the
+    same file neither copy nor hash it again unless the document has been
+    evicted. File objects are assumed not to change once read.
+    """
+    digest = _remembered_digest(pdf_file)
+    if digest is not None:
+        return _load_pdf_document(digest, lambda: _known_pdf_source(pdf_file, digest))
+    digest, source = _pdf_source(pdf_file)
+    _remember_digest(pdf_file, digest)
+    return _load_pdf_document(digest, source)
+
+def open_pdf_document(digest: str) -> Optional[PdfDocument]:
+    """
+    Return the shared PdfDocument for a previously spooled or published PDF.
+    Returns None if the file is no longer on disk.
+    """
+    for directory in (UPLOAD_SPOOL_DIR, STATIC_PDF_DIR):
+        path = os.path.join(directory, f"{digest}.pdf")
+        if os.path.exists(path):
+            return _load_pdf_document(digest, path)
+    return None
+
+def extract_text_from_pdf(
+    pdf_file: io.BytesIO,
+    use_cache: bool = True,
+    parallel: Optional[bool] = None,
+    max_workers: Optional[int] = None
+) -> Tuple[str, Dict[int, str]]:
     """
     Extract text from a PDF file
     Returns both full text and text by page
+
+    Results are kept in the on-disk PDF text cache, keyed by a hash of the
+    PDF bytes, so the same document is only parsed once across sessions.
+    See PdfDocument.text_by_page for the parallel and max_workers options.
     """
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        full_text = ""
-        text_by_page = {}
-        
-        for i, page in enumerate(pdf_reader.pages):
-            page_text = page.extract_text()
-            full_text += page_text + "\n\n"
-            text_by_page[i+1] = page_text
-            
-        return full_text, text_by_page
+        document = get_pdf_document(pdf_file) if use_cache else PdfDocument.from_file(pdf_file, use_cache=False)
+        text_by_page = document.text_by_page(parallel=parallel, max_workers=max_workers)
+        return _join_pages(text_by_page), text_by_page
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
         return "", {}
 
+def iter_pdf_pages(pdf_file: io.BytesIO, start_page: int = 1, end_page: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Stream (page_number, text) pairs from a PDF file as each page is decoded.
+    Stop iterating at any point to skip the remaining pages.
+    """
+    return get_pdf_document(pdf_file).iter_pages(start_page, end_page)
+
 def get_pdf_page_count(pdf_file: io.BytesIO) -> int:
     """Get the number of pages in a PDF file"""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        return len(pdf_reader.pages)
+        return get_pdf_document(pdf_file).page_count
     except Exception as e:
         print(f"Error getting PDF page count: {e}")
         return 0
@@ -40,19 +436,7 @@ def get_pdf_page_count(pdf_file: io.BytesIO) -> int:
 def extract_pdf_metadata(pdf_file: io.BytesIO) -> Dict[str, Any]:
     """Extract metadata from a PDF file"""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        metadata = pdf_reader.metadata
-        if metadata:
-            return {
-                "title": metadata.get("/Title", ""),
-                "author": metadata.get("/Author", ""),
-                "subject": metadata.get("/Subject", ""),
-                "creator": metadata.get("/Creator", ""),
-                "producer": metadata.get("/Producer", ""),
-                "creation_date": metadata.get("/CreationDate", ""),
-                "modification_date": metadata.get("/ModDate", "")
-            }
-        return {}
+        return get_pdf_document(pdf_file).metadata
     except Exception as e:
         print(f"Error extracting PDF metadata: {e}")
         return {}
@@ -62,31 +446,112 @@ def pdf_to_base64(pdf_file: io.BytesIO) -> str:
     pdf_file.seek(0)
     return base64.b64encode(pdf_file.read()).decode('utf-8')
 
+def _static_pdf_url(filename: str) -> str:
+    return f"{STATIC_PDF_URL}/{filename}"
+
+def _publish_static_pdf(filename: str, pdf_bytes: bytes) -> None:
+    """Write a file into the static PDF directory unless it is already there"""
+    path = os.path.join(STATIC_PDF_DIR, filename)
+    if os.path.exists(path):
+        return
+    os.makedirs(STATIC_PDF_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=STATIC_PDF_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    _prune_pdf_dir(STATIC_PDF_DIR, STATIC_PDF_MAX_BYTES, keep=path)
+
+def _prune_pdf_dir(directory: str, max_bytes: int, keep: Optional[str] = None) -> None:
+    """
+    Remove the oldest PDFs once a directory exceeds max_bytes, never the
+    keep path (the file just written). Files still mapped by an open
+    PdfDocument stay readable until it is dropped.
+    """
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(".pdf") or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def publish_pdf(pdf_file: Union[io.BytesIO, PdfDocument]) -> str:
+    """
+    Write a PDF to the static directory under its content hash and return its URL.
+    The file is only written the first time a given document is published.
+    Pass the PdfDocument when you already have it to avoid reading the file again.
+    """
+    document = pdf_file if isinstance(pdf_file, PdfDocument) else get_pdf_document(pdf_file)
+    return _publish_document(document)
+
+def _publish_document(document: PdfDocument) -> str:
+    filename = f"{document.digest}.pdf"
+    path = os.path.join(STATIC_PDF_DIR, filename)
+    if not os.path.exists(path):
+        os.makedirs(STATIC_PDF_DIR, exist_ok=True)
+        document.save_to(path)
+        _prune_pdf_dir(STATIC_PDF_DIR, STATIC_PDF_MAX_BYTES, keep=path)
+    return _static_pdf_url(filename)
+
+def publish_pdf_page(pdf_file: io.BytesIO, page_num: int) -> str:
+    """
+    Publish a single page of a PDF and return its URL.
+    Each page is split out with PdfWriter only once; later calls reuse the file.
+    """
+    return _publish_document_page(get_pdf_document(pdf_file), page_num)
+
+def _publish_document_page(document: PdfDocument, page_num: int) -> str:
+    filename = f"{document.digest}_p{page_num}.pdf"
+    if not os.path.exists(os.path.join(STATIC_PDF_DIR, filename)):
+        _publish_static_pdf(filename, document.extract_page(page_num))
+    return _static_pdf_url(filename)
+
+def published_page_url(digest: str, page_num: int) -> Optional[str]:
+    """
+    URL of one page of a previously published PDF, splitting it out on first use.
+    Returns None if the document is no longer in the static directory.
+    """
+    filename = f"{digest}_p{page_num}.pdf"
+    if os.path.exists(os.path.join(STATIC_PDF_DIR, filename)):
+        return _static_pdf_url(filename)
+    document = open_pdf_document(digest)
+    if document is None:
+        return None
+    return _publish_document_page(document, page_num)
+
+def _pdf_iframe(url: str, width: int, height: int) -> str:
+    return f'<iframe src="{url}" width="{width}" height="{height}" type="application/pdf"></iframe>'
+
 def display_pdf(pdf_file: io.BytesIO, width: int = 700, height: int = 800) -> None:
     """Display a PDF file in Streamlit"""
-    base64_pdf = pdf_to_base64(pdf_file)
-    pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="{width}" height="{height}" type="application/pdf"></iframe>'
-    st.markdown(pdf_display, unsafe_allow_html=True)
+    try:
+        st.markdown(_pdf_iframe(publish_pdf(pdf_file), width, height), unsafe_allow_html=True)
+    except Exception as e:
+        st.error(f"Error displaying PDF: {e}")
 
 def display_pdf_page(pdf_file: io.BytesIO, page_num: int = 1, width: int = 700, height: int = 800) -> None:
     """Display a specific page of a PDF file in Streamlit"""
     try:
-        # Create a new PDF with just the specified page
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        pdf_writer = PyPDF2.PdfWriter()
+        document = get_pdf_document(pdf_file)
         
-        if 1 <= page_num <= len(pdf_reader.pages):
-            pdf_writer.add_page(pdf_reader.pages[page_num - 1])
-            
-            output = io.BytesIO()
-            pdf_writer.write(output)
-            output.seek(0)
-            
+        if 1 <= page_num <= document.page_count:
             # Display the single page
-            base64_pdf = base64.b64encode(output.read()).decode('utf-8')
-            pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="{width}" height="{height}" type="application/pdf"></iframe>'
-            st.markdown(pdf_display, unsafe_allow_html=True)
+            st.markdown(_pdf_iframe(_publish_document_page(document, page_num), width, height), unsafe_allow_html=True)
         else:
-            st.error(f"Page number {page_num} is out of range. The PDF has {len(pdf_reader.pages)} pages.")
+            st.error(f"Page number {page_num} is out of range. The PDF has {document.page_count} pages.")
     except Exception as e:
         st.error(f"Error displaying PDF page: {e}")
\ No newline at end of file
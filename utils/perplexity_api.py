@@ -6,6 +6,30 @@ import json
 import os
 from typing import Dict, List, Any, Optional
 import time
+import streamlit as st
+from .http_client import get_http_client
+from .response_cache import ResponseCache, SingleFlight, make_cache_key
+
+# How long web search results are reused for an identical search
+WEB_SEARCH_CACHE_TTL = float(os.environ.get("MEDGUIDE_WEB_SEARCH_CACHE_TTL", 900))
+WEB_SEARCH_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Shared by every PerplexityAPI instance so sessions benefit from each other's searches
+_search_cache = ResponseCache(ttl=WEB_SEARCH_CACHE_TTL, max_bytes=WEB_SEARCH_CACHE_MAX_BYTES)
+_search_flights = SingleFlight()
+
+
+def get_web_search_stats() -> Dict[str, Any]:
+    """Cache hits, coalesced waits and outbound calls for web searches"""
+    cache_stats = _search_cache.stats()
+    flight_stats = _search_flights.stats()
+    return {
+        "cache_hits": cache_stats["hits"],
+        "cache_misses": cache_stats["misses"],
+        "coalesced": flight_stats["coalesced"],
+        "outbound": flight_stats["executions"],
+        "entries": cache_stats["entries"]
+    }
 
 class PerplexityAPI:
     def __init__(self, api_key: Optional[str] = None):
@@ -15,6 +39,7 @@ class PerplexityAPI:
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        self.http = get_http_client(self.base_url)
     
     def search_web(
         self, 
@@ -24,6 +49,10 @@ class PerplexityAPI:
     ) -> List[Dict[str, Any]]:
         """
         Search the web for relevant medical information using Perplexity
+        
+        Results are cached for WEB_SEARCH_CACHE_TTL seconds, keyed on the final
+        search query, domain filter and max_results, and concurrent identical
+        searches share a single outbound request.
         """
         # For demo purposes, return mock data if using demo key
         if self.api_key == "demo_key":
@@ -43,38 +72,49 @@ class PerplexityAPI:
             "aafp.org", "nejm.org", "jamanetwork.com", "thelancet.com"
         ]
         
-        # Make API call to Perplexity
+        cache_key = make_cache_key("search_web", search_query, sorted(medical_domains), max_results)
+        cached = _search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response = requests.post(
-                f"{self.base_url}/sonar/search",
-                headers=self.headers,
-                json={
-                    "query": search_query,
-                    "source_filter": {"domains": medical_domains},
-                    "highlight": True,
-                    "max_results": max_results
-                },
-                timeout=30
+            return _search_flights.do(
+                cache_key,
+                lambda: self._search(search_query, medical_domains, max_results, cache_key)
             )
-            response.raise_for_status()
-            results = response.json()
-            
-            # Process and return results
-            processed_results = []
-            for result in results:
-                processed_results.append({
-                    "title": result.get("title", ""),
-                    "snippet": result.get("snippet", ""),
-                    "url": result.get("url", ""),
-                    "source": self._extract_domain(result.get("url", ""))
-                })
-            
-            return processed_results
-                
         except requests.RequestException as e:
             print(f"API request error: {e}")
             return []
     
+    def _search(self, search_query: str, medical_domains: List[str], max_results: int, cache_key: str) -> List[Dict[str, Any]]:
+        """Make the outbound search request and cache its results"""
+        # Make API call to Perplexity
+        response = self.http.post(
+            "/sonar/search",
+            headers=self.headers,
+            json={
+                "query": search_query,
+                "source_filter": {"domains": medical_domains},
+                "highlight": True,
+                "max_results": max_results
+            }
+        )
+        response.raise_for_status()
+        results = response.json()
+        
+        # Process and return results
+        processed_results = []
+        for result in results:
+            processed_results.append({
+                "title": result.get("title", ""),
+                "snippet": result.get("snippet", ""),
+                "url": result.get("url", ""),
+                "source": self._extract_domain(result.get("url", ""))
+            })
+        
+        _search_cache.put(cache_key, processed_results)
+        return processed_results
+    
     def _extract_domain(self, url: str) -> str:
         """Extract domain name from URL"""
         try:
@@ -132,4 +172,10 @@ class PerplexityAPI:
                     "url": "https://example.com/guidelines",
                     "source": "example.com"
                 }
-            ]
\ No newline at end of file
+            ]
+
+
+@st.cache_resource(show_spinner=False)
+def get_perplexity_api(api_key: Optional[str] = None) -> PerplexityAPI:
+    """Return a PerplexityAPI client shared across reruns and sessions for this API key"""
+    return PerplexityAPI(api_key)
\ No newline at end of file
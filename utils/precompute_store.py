@@ -0,0 +1,151 @@
+# =====================================
+# utils/precompute_store.py
+# =====================================
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from .patient_model import as_patient
+from .response_cache import make_cache_key
+
+# Where the pre-visit job writes its results and how long they stay usable
+PRECOMPUTE_DIR = os.environ.get(
+    "MEDGUIDE_PRECOMPUTE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "medguide", "precomputed")
+)
+PRECOMPUTE_TTL = float(os.environ.get("MEDGUIDE_PRECOMPUTE_TTL", 36 * 3600))
+
+# The question the document viewer asks when a guideline is first opened
+INITIAL_RECOMMENDATION_QUERY = "best medication regimen and relevant recommendations for this patient"
+
+
+def patient_identity(patient: Any) -> Any:
+    """
+    What precomputed entries are keyed on: the FHIR id and versionId of an
+    EHR patient, so the job and the app match whatever they projected from
+    the same resource version, or the projected Patient for patients
+    without them (e.g. sample patients), so any change to those misses.
+    """
+    patient = as_patient(patient)
+    if patient.id and patient.version_id:
+        return ("fhir", patient.id, patient.version_id)
+    return patient
+
+
+def recommendation_key(patient: Any, guideline_id: str) -> str:
+    """Key of the initial recommendations for a patient and guideline"""
+    return make_cache_key("initial_recommendations", str(guideline_id), patient_identity(patient))
+
+
+def note_key(patient: Any, condition: str) -> str:
+    """Key of the draft clinical note for a patient and condition"""
+    return make_cache_key("clinical_note", (condition or "").strip().lower(), patient_identity(patient))
+
+
+class PrecomputeStore:
+    """
+    Disk store of answers computed ahead of a visit.
+
+    The pre-visit batch job (jobs/precompute.py) writes the initial guideline
+    recommendations and draft note for each scheduled patient here, one JSON
+    file per entry, and the app reads them instead of calling Claude while the
+    clinician waits. Entries are keyed on the patient's FHIR id and version
+    (see patient_identity), so a chart updated since the job ran simply
+    misses, and expire after ttl seconds.
+    """
+
+    def __init__(self, store_dir: str = PRECOMPUTE_DIR, ttl: float = PRECOMPUTE_TTL):
+        self.store_dir = store_dir
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.store_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the stored value, or None if missing or expired"""
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and entry.get("expires", 0) <= time.time():
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry["value"]
+
+    def put(self, key: str, value: Any, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Write an entry atomically so readers never see a partial file"""
+        now = time.time()
+        entry = {"created": now, "expires": now + self.ttl, "meta": meta or {}, "value": value}
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            print(f"Error writing precomputed entry: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def get_recommendations(self, patient: Dict[str, Any], guideline_id: str) -> Optional[Dict[str, Any]]:
+        return self.get(recommendation_key(patient, guideline_id))
+
+    def put_recommendations(self, patient: Dict[str, Any], guideline_id: str, recommendations: Dict[str, Any]) -> None:
+        self.put(recommendation_key(patient, guideline_id), recommendations, {"kind": "recommendations", "guideline_id": guideline_id})
+
+    def get_note(self, patient: Dict[str, Any], condition: str) -> Optional[Dict[str, Any]]:
+        return self.get(note_key(patient, condition))
+
+    def put_note(self, patient: Dict[str, Any], condition: str, note: Dict[str, Any]) -> None:
+        self.put(note_key(patient, condition), note, {"kind": "note", "condition": condition})
+
+    def purge_expired(self) -> int:
+        """Delete expired entries; returns the number removed"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.store_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.store_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    expired = json.load(f).get("expires", 0) <= now
+            except (OSError, ValueError):
+                expired = True
+            if expired:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_store_instance: Optional[PrecomputeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_precompute_store() -> PrecomputeStore:
+    """Return the process-wide store of precomputed answers"""
+    global _store_instance
+    with _store_lock:
+        if _store_instance is None:
+            _store_instance = PrecomputeStore()
+        return _store_instance
\ No newline at end of file
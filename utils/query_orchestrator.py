@@ -0,0 +1,92 @@
+# =====================================
+# utils/query_orchestrator.py
+# =====================================
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Callable, Iterator, Optional
+
+# Threads shared by every session for background API calls
+ORCHESTRATOR_WORKERS = int(os.environ.get("MEDGUIDE_ORCHESTRATOR_WORKERS", 8))
+# Seconds to wait for background calls once the foreground answer is done
+ORCHESTRATOR_TIMEOUT = float(os.environ.get("MEDGUIDE_ORCHESTRATOR_TIMEOUT", 60))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_query_executor() -> ThreadPoolExecutor:
+    """Return the process-wide thread pool used for fan-out calls"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ORCHESTRATOR_WORKERS, thread_name_prefix="medguide-query")
+        return _executor
+
+
+class QueryOutcome:
+    """Result of one fanned-out call: its name, value or error, and how long it took"""
+    __slots__ = ("name", "result", "error", "elapsed")
+
+    def __init__(self, name: str, result: Any = None, error: Optional[Exception] = None, elapsed: float = 0.0):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class QueryOrchestrator:
+    """
+    Run the independent calls behind one clinician question concurrently.
+
+    Calls are submitted to the shared thread pool by name and collected with
+    as_completed() in the order they finish, so the total latency is that of
+    the slowest call rather than the sum. Work that has to happen on the
+    Streamlit script thread (e.g. consuming a stream into a placeholder) can
+    run in the foreground meanwhile.
+
+        orchestrator = QueryOrchestrator()
+        orchestrator.submit("web", perplexity_api.search_web, question, patient)
+        ...stream the guideline answer...
+        for outcome in orchestrator.as_completed():
+            ...
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None):
+        self.executor = executor or get_query_executor()
+        self.started = time.perf_counter()
+        self._futures: Dict[Future, str] = {}
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> None:
+        """Start fn(*args, **kwargs) in the background under the given name"""
+        def timed():
+            started = time.perf_counter()
+            try:
+                return QueryOutcome(name, result=fn(*args, **kwargs), elapsed=time.perf_counter() - started)
+            except Exception as e:
+                print(f"Error in {name} lookup: {e}")
+                return QueryOutcome(name, error=e, elapsed=time.perf_counter() - started)
+
+        self._futures[self.executor.submit(timed)] = name
+
+    def as_completed(self, timeout: Optional[float] = ORCHESTRATOR_TIMEOUT) -> Iterator[QueryOutcome]:
+        """Yield outcomes as their calls finish; calls still running after timeout are reported as errors"""
+        pending = dict(self._futures)
+        try:
+            for future in as_completed(list(pending), timeout=timeout):
+                pending.pop(future)
+                yield future.result()
+        except FutureTimeoutError:
+            for future, name in pending.items():
+                future.cancel()
+                yield QueryOutcome(name, error=TimeoutError(f"{name} lookup timed out"), elapsed=time.perf_counter() - self.started)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
\ No newline at end of file
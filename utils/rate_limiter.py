@@ -0,0 +1,189 @@
+# =====================================
+# utils/rate_limiter.py
+# =====================================
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# Limits of the Anthropic organisation this deployment runs under
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("MEDGUIDE_LLM_REQUESTS_PER_MINUTE", 50))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("MEDGUIDE_LLM_TOKENS_PER_MINUTE", 40000))
+# Upper bound on concurrent Claude requests; the limiter lowers it while throttled
+LLM_MAX_CONCURRENCY = int(os.environ.get("MEDGUIDE_LLM_MAX_CONCURRENCY", 8))
+# Longest a request may queue for capacity before it fails
+LLM_MAX_QUEUE_WAIT = float(os.environ.get("MEDGUIDE_LLM_MAX_QUEUE_WAIT", 30))
+
+# Pause after a throttled response without a retry-after header
+DEFAULT_THROTTLE_PAUSE = 1.0
+
+
+class RateLimitExceeded(Exception):
+    """A request could not get capacity within the queue wait bound"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a retry-after header, or None if absent or not a number"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Capacity refilled continuously over per_seconds; callers hold the limiter's lock"""
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide limiter in front of every Claude request.
+
+    A request needs one unit from the requests-per-minute bucket, its
+    estimated input tokens from the tokens-per-minute bucket and a free
+    concurrency slot. Requests that can't go yet queue for at most max_wait
+    seconds and then fail with RateLimitExceeded, rather than every session
+    hammering the API and failing on its own.
+
+    Concurrency adapts to throttling (AIMD): a 429/529 halves the
+    concurrency limit and pauses all requests for the retry-after period,
+    and each run of successful responses as long as the current limit raises
+    it by one again, up to max_concurrency.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_wait: float = LLM_MAX_QUEUE_WAIT
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.paused_until = 0.0
+        self.acquired = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """
+        Block until a request of tokens estimated input tokens may be sent.
+
+        Returns the seconds spent queued. Raises RateLimitExceeded as soon as
+        it is clear the request can't start within max_wait seconds. Every
+        successful acquire must be paired with release().
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        started = time.monotonic()
+        deadline = started + max_wait
+        with self._cond:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = max(
+                        self.paused_until - now,
+                        self.request_bucket.wait_time(1, now),
+                        self.token_bucket.wait_time(tokens, now)
+                    )
+                    if delay <= 0 and self.in_flight < self.concurrency_limit:
+                        break
+                    if now + delay > deadline:
+                        self.rejected += 1
+                        raise RateLimitExceeded(
+                            f"Claude is rate limited; request could not start within {max_wait:.0f}s"
+                        )
+                    # Woken early by release() when a slot frees up or the limits change
+                    self._cond.wait(delay if delay > 0 else deadline - now)
+
+                self.request_bucket.take(1)
+                self.token_bucket.take(tokens)
+                self.in_flight += 1
+                self.acquired += 1
+                waited = now - started
+                self.total_wait += waited
+                self.max_observed_wait = max(self.max_observed_wait, waited)
+                return waited
+            finally:
+                self.queue_depth -= 1
+
+    def release(self, throttled: bool = False, retry_after: Optional[str] = None, success: bool = True) -> None:
+        """
+        Return a slot once the response (or error) for an acquired request arrives.
+
+        throttled marks a 429/529 response; its retry-after header pauses every
+        queued request. success=False (e.g. a connection error) frees the slot
+        without counting towards raising the concurrency limit.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self._successes = 0
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                pause = parse_retry_after(retry_after)
+                pause = DEFAULT_THROTTLE_PAUSE if pause is None else pause
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            elif success:
+                self._successes += 1
+                if self.concurrency_limit < self.max_concurrency and self._successes >= self.concurrency_limit:
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, wait times, throttling and the current concurrency limit"""
+        with self._cond:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "concurrency_limit": self.concurrency_limit,
+                "acquired": self.acquired,
+                "rejected": self.rejected,
+                "throttled": self.throttled,
+                "mean_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "max_wait": self.max_observed_wait,
+                "paused_for": max(0.0, self.paused_until - time.monotonic())
+            }
+
+
+_limiter_instance: Optional[AdaptiveRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_rate_limiter() -> AdaptiveRateLimiter:
+    """Return the process-wide limiter shared by every Claude call"""
+    global _limiter_instance
+    with _limiter_lock:
+        if _limiter_instance is None:
+            _limiter_instance = AdaptiveRateLimiter()
+        return _limiter_instance
\ No newline at end of file
@@ -0,0 +1,140 @@
+# =====================================
+# utils/recommendation_stream.py
+# =====================================
+import json
+import re
+from typing import Dict, List, Any, Optional
+
+# Output format requested in the guideline prompt
+RECOMMENDATION_FORMAT = """Respond with only a JSON object, no other text, in exactly this form:
+{"recommendations": [{"text": "<the recommendation, quoted from the guideline>", "explanation": "<how it applies to this patient>", "source": "<guideline and section it comes from>", "page": "<page number, or N/A>"}]}
+List the most relevant recommendations first."""
+
+# Start of the assistant turn, prefilled so the answer is always the JSON object
+RECOMMENDATION_PREFILL = '{"recommendations": ['
+
+_ARRAY_START_RE = re.compile(r'"recommendations"\s*:\s*\[')
+# A string field of a recommendation, possibly still open at the end of the buffer
+_PARTIAL_FIELD_RE = re.compile(r'"(text|explanation|source|page)"\s*:\s*"((?:[^"\\]|\\.)*)')
+# Characters allowed between the objects of the recommendations array
+_ARRAY_SEPARATORS = " \t\n\r,"
+
+
+def _decode_partial_string(raw: str) -> str:
+    """Decode the body of a JSON string that may be cut off mid-escape"""
+    while raw:
+        try:
+            return json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            # Drop the incomplete escape (e.g. a \u00 still streaming) and retry
+            cut = raw.rfind("\\")
+            raw = raw[:cut] if cut >= 0 else ""
+    return ""
+
+
+def normalize_recommendation(value: Any) -> Optional[Dict[str, str]]:
+    """Coerce a parsed recommendation to the text/explanation/source/page strings the UI expects"""
+    if not isinstance(value, dict):
+        return None
+    recommendation = {
+        "text": str(value.get("text") or "").strip(),
+        "explanation": str(value.get("explanation") or "").strip(),
+        "source": str(value.get("source") or "").strip() or "Clinical Guidelines",
+        "page": str(value.get("page") or "").strip() or "N/A"
+    }
+    if not recommendation["text"] and not recommendation["explanation"]:
+        return None
+    return recommendation
+
+
+class RecommendationStreamParser:
+    """
+    Incremental parser for a streamed {"recommendations": [...]} answer.
+
+    feed() takes text deltas as they arrive and returns the recommendation
+    objects completed by that delta, so each one can be rendered as soon as
+    its closing brace streams in rather than when the whole answer is done.
+    Only the new text is scanned on each call; string and nesting state
+    carry over between deltas. partial() gives the fields of the object
+    still being written, and free_text is set if the answer turns out not to
+    be JSON at all, so callers can show the raw text instead.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.recommendations: List[Dict[str, str]] = []
+        self.started = False
+        self.complete = False
+        self.free_text = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Dict[str, str]]:
+        self.buffer += text
+        if self.complete:
+            return []
+        if not self.started:
+            match = _ARRAY_START_RE.search(self.buffer)
+            if match is None:
+                return []
+            self.started = True
+            self._pos = match.end()
+
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif self._depth == 0 and c not in _ARRAY_SEPARATORS and c not in "{}]":
+                # Prose where the next recommendation object should be
+                self.free_text = True
+                self.complete = True
+                break
+            elif c == "{" or c == "[":
+                if self._depth == 0 and c == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif c == "}" or c == "]":
+                if self._depth == 0:
+                    # End of the recommendations array
+                    self.complete = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        recommendation = normalize_recommendation(json.loads(buffer[self._object_start:i + 1]))
+                    except ValueError:
+                        recommendation = None
+                    self._object_start = None
+                    if recommendation is not None:
+                        completed.append(recommendation)
+        self._pos = len(buffer)
+        self.recommendations.extend(completed)
+        return completed
+
+    def partial(self) -> Optional[Dict[str, str]]:
+        """String fields written so far of the recommendation still streaming, or None between objects"""
+        if self._object_start is None or self.complete:
+            return None
+        fields = {}
+        for match in _PARTIAL_FIELD_RE.finditer(self.buffer, self._object_start):
+            fields[match.group(1)] = _decode_partial_string(match.group(2))
+        return fields or None
+
+
+def parse_recommendations(text: str) -> Optional[List[Dict[str, str]]]:
+    """Recommendations from a complete JSON answer, or None if it has none (e.g. a free-text answer)"""
+    parser = RecommendationStreamParser()
+    parser.feed(text)
+    return parser.recommendations or None
\ No newline at end of file
@@ -0,0 +1,220 @@
+# =====================================
+# utils/retrieval.py
+# =====================================
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+from .token_budget import estimate_tokens
+
+# Target size of a guideline chunk and the overlap carried into the next one
+CHUNK_CHARS = int(os.environ.get("MEDGUIDE_CHUNK_CHARS", 1200))
+CHUNK_OVERLAP_CHARS = int(os.environ.get("MEDGUIDE_CHUNK_OVERLAP_CHARS", 200))
+# Default number of tokens of guideline text packed into a prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("MEDGUIDE_CONTEXT_TOKEN_BUDGET", 4000))
+# Number of document indexes kept in memory
+INDEX_CACHE_SIZE = 32
+# Placed between labelled guideline sections in prompts
+DOCUMENT_SEPARATOR = "\n\n---\n\n"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does for from has have how i if in into is it its
+me my of on or our should than that the their them then there these this those to was
+what when where which who why will with would you your patient patients
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class Chunk:
+    """A piece of guideline text with the page it came from"""
+    __slots__ = ("text", "page", "index")
+
+    def __init__(self, text: str, page: Optional[int], index: int):
+        self.text = text
+        self.page = page
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f"Chunk(page={self.page}, index={self.index}, chars={len(self.text)})"
+
+
+def _split_text(text: str, chunk_chars: int, overlap_chars: int) -> List[str]:
+    """Split text into roughly chunk_chars pieces on paragraph boundaries"""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    pieces = []
+    current = ""
+    for paragraph in paragraphs:
+        # Very long paragraphs are cut on whitespace
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(" ", 0, chunk_chars)
+            if cut <= overlap_chars:
+                cut = chunk_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut - overlap_chars:]
+        if current and len(current) + len(paragraph) + 2 > chunk_chars:
+            pieces.append(current)
+            tail = current[-overlap_chars:] if overlap_chars else ""
+            current = f"{tail}\n\n{paragraph}" if tail else paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_document(
+    document_text: Optional[str] = None,
+    text_by_page: Optional[Dict[int, str]] = None,
+    chunk_chars: int = CHUNK_CHARS,
+    overlap_chars: int = CHUNK_OVERLAP_CHARS
+) -> List[Chunk]:
+    """
+    Split a guideline into chunks that remember their page number.
+    Per-page text is preferred; plain document text produces chunks without pages.
+    """
+    chunks = []
+    if text_by_page:
+        for page in sorted(text_by_page):
+            for piece in _split_text(text_by_page[page] or "", chunk_chars, overlap_chars):
+                chunks.append(Chunk(piece, page, len(chunks)))
+    elif document_text:
+        for piece in _split_text(document_text, chunk_chars, overlap_chars):
+            chunks.append(Chunk(piece, None, len(chunks)))
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 ranking over a list of chunks, built entirely in memory"""
+
+    def __init__(self, chunks: List[Chunk], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+
+        for chunk in chunks:
+            terms = Counter(tokenize(chunk.text))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((chunk.index, frequency))
+
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        count = len(chunks)
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[Chunk, float]]:
+        """Return up to top_k (chunk, score) pairs, best first"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.chunks[index], score) for index, score in ranked]
+
+
+_index_cache: "OrderedDict[str, BM25Index]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def document_fingerprint(document_text: Optional[str], text_by_page: Optional[Dict[int, str]]) -> str:
+    """Content hash of a document's text, used to key its index and any answers derived from it"""
+    hasher = hashlib.sha1()
+    if text_by_page:
+        for page in sorted(text_by_page):
+            hasher.update(f"\x00{page}\x00".encode("utf-8"))
+            hasher.update((text_by_page[page] or "").encode("utf-8"))
+    else:
+        hasher.update((document_text or "").encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def get_document_index(document_text: Optional[str] = None, text_by_page: Optional[Dict[int, str]] = None) -> BM25Index:
+    """Return the BM25 index for a document, building it on first use"""
+    key = document_fingerprint(document_text, text_by_page)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    index = BM25Index(chunk_document(document_text, text_by_page))
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def pack_context(
+    query: str,
+    document_text: Optional[str] = None,
+    text_by_page: Optional[Dict[int, str]] = None,
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> Dict[str, Any]:
+    """
+    Select the guideline chunks most relevant to a query within a token budget.
+
+    Chunks are ranked with BM25 and added best first until the budget is
+    spent, then emitted in document order with their page numbers so the
+    model can cite them. If nothing matches the query, the start of the
+    document is used instead.
+
+    Returns a dictionary with the packed "context" text, the selected
+    "chunks" and the estimated "tokens" used.
+    """
+    index = get_document_index(document_text, text_by_page)
+    ranked = [chunk for chunk, _ in index.search(query, top_k=len(index.chunks))]
+    if not ranked:
+        ranked = list(index.chunks)
+
+    selected = []
+    used = 0
+    for chunk in ranked:
+        cost = estimate_tokens(chunk.text) + 8
+        if used + cost > token_budget:
+            continue
+        selected.append(chunk)
+        used += cost
+
+    selected.sort(key=lambda chunk: chunk.index)
+    sections = []
+    for chunk in selected:
+        label = f"[Page {chunk.page}]" if chunk.page is not None else f"[Excerpt {chunk.index + 1}]"
+        sections.append(f"{label}\n{chunk.text}")
+
+    return {
+        "context": DOCUMENT_SEPARATOR.join(sections),
+        "chunks": selected,
+        "tokens": used
+    }
+
+
+def format_document(document_text: Optional[str] = None, text_by_page: Optional[Dict[int, str]] = None) -> str:
+    """The whole document in page order, labelled like pack_context excerpts"""
+    if text_by_page:
+        return DOCUMENT_SEPARATOR.join(
+            f"[Page {page}]\n{text_by_page[page].strip()}"
+            for page in sorted(text_by_page)
+            if text_by_page[page] and text_by_page[page].strip()
+        )
+    return (document_text or "").strip()
\ No newline at end of file
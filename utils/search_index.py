@@ -0,0 +1,299 @@
+# =====================================
+# utils/search_index.py
+# =====================================
+import bisect
+import html
+import math
+import re
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+from .retrieval import TOKEN_RE
+
+# Same tokens as retrieval, matched on the original text so offsets line up
+_WORD_RE = re.compile(TOKEN_RE.pattern, re.IGNORECASE)
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+SNIPPET_CHARS = 240
+# Share of removed pages at which the index is compacted
+COMPACT_DELETED_SHARE = 0.25
+
+
+def _tokens_with_offsets(text: str) -> List[Tuple[str, int, int]]:
+    return [(match.group(0).lower(), match.start(), match.end()) for match in _WORD_RE.finditer(text)]
+
+
+class GuidelineSearchIndex:
+    """
+    Positional inverted index over guideline pages.
+
+    Every (document, page) pair is indexed separately so results can jump
+    straight to a page. Queries are a conjunction of clauses:
+
+    - plain terms:            metformin egfr
+    - quoted phrases:         "blood pressure target"
+    - prefix terms:           statin*
+
+    Results are ranked with a BM25-style score and carry a snippet with
+    highlight offsets. Page text is referenced, not copied, and only
+    re-tokenized when a snippet is built. Removed pages are only marked
+    deleted; once they make up COMPACT_DELETED_SHARE of the index it is
+    compacted, so re-uploading documents doesn't grow it without bound.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.pages: List[Tuple[str, int]] = []
+        self.page_text: List[str] = []
+        self.page_lengths: List[int] = []
+        self.deleted = set()
+        self.postings: Dict[str, Dict[int, List[int]]] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.documents
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages) - len(self.deleted)
+
+    def add_document(self, doc_id: str, pages: Dict[int, str], info: Optional[Dict[str, Any]] = None, replace: bool = False) -> None:
+        """
+        Index a document's pages under doc_id.
+        info is stored with the document and returned with every result (title, source, ...).
+        """
+        with self._lock:
+            if doc_id in self.documents:
+                if not replace:
+                    return
+                self.remove_document(doc_id)
+            self.documents[doc_id] = {"info": dict(info or {}, id=doc_id), "keys": self._index_pages(doc_id, pages)}
+
+    def add_pages(self, doc_id: str, pages: Dict[int, str], info: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Index more pages of a document, adding the document if it isn't indexed yet.
+        Used to make an upload searchable while it is still being read.
+        """
+        with self._lock:
+            if doc_id not in self.documents:
+                self.add_document(doc_id, pages, info)
+                return
+            self.documents[doc_id]["keys"].extend(self._index_pages(doc_id, pages))
+
+    def _index_pages(self, doc_id: str, pages: Dict[int, str]) -> List[int]:
+        keys = []
+        for page_num in sorted(pages):
+            text = pages[page_num] or ""
+            key = len(self.pages)
+            self.pages.append((doc_id, page_num))
+            self.page_text.append(text)
+            tokens = _tokens_with_offsets(text)
+            for position, (token, _, _) in enumerate(tokens):
+                self.postings.setdefault(token, {}).setdefault(key, []).append(position)
+            length = len(tokens)
+            self.page_lengths.append(length)
+            self._total_length += length
+            keys.append(key)
+        self._vocabulary_dirty = True
+        return keys
+
+    def remove_document(self, doc_id: str) -> None:
+        """Drop a document from search results"""
+        with self._lock:
+            document = self.documents.pop(doc_id, None)
+            if document is None:
+                return
+            for key in document["keys"]:
+                self.deleted.add(key)
+                self._total_length -= self.page_lengths[key]
+                self.page_text[key] = ""
+            if len(self.deleted) >= len(self.pages) * COMPACT_DELETED_SHARE:
+                self.compact()
+
+    def compact(self) -> None:
+        """Drop deleted pages from every posting list and renumber the live pages"""
+        with self._lock:
+            if not self.deleted:
+                return
+            remap: Dict[int, int] = {}
+            pages, page_text, page_lengths = [], [], []
+            for key, page in enumerate(self.pages):
+                if key in self.deleted:
+                    continue
+                remap[key] = len(pages)
+                pages.append(page)
+                page_text.append(self.page_text[key])
+                page_lengths.append(self.page_lengths[key])
+            postings = {}
+            for term, posting in self.postings.items():
+                live = {remap[key]: positions for key, positions in posting.items() if key in remap}
+                if live:
+                    postings[term] = live
+            for document in self.documents.values():
+                document["keys"] = [remap[key] for key in document["keys"]]
+            self.pages, self.page_text, self.page_lengths, self.postings = pages, page_text, page_lengths, postings
+            self.deleted = set()
+            self._vocabulary_dirty = True
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self.postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\uffff")
+        return self._vocabulary[start:end]
+
+    @staticmethod
+    def parse_query(query: str) -> List[Dict[str, Any]]:
+        """Split a query into term, prefix and phrase clauses"""
+        clauses = []
+        for match in _QUERY_RE.finditer(query):
+            phrase, word = match.groups()
+            if phrase is not None:
+                tokens = [token for token, _, _ in _tokens_with_offsets(phrase)]
+                if len(tokens) > 1:
+                    clauses.append({"type": "phrase", "tokens": tokens})
+                elif tokens:
+                    clauses.append({"type": "term", "tokens": tokens})
+            elif word.endswith("*") and len(word) > 1:
+                tokens = [token for token, _, _ in _tokens_with_offsets(word[:-1])]
+                if tokens:
+                    clauses.append({"type": "prefix", "tokens": tokens[-1:]})
+                    clauses.extend({"type": "term", "tokens": [token]} for token in tokens[:-1])
+            else:
+                clauses.extend({"type": "term", "tokens": [token]} for token, _, _ in _tokens_with_offsets(word))
+        return clauses
+
+    def _match_clause(self, clause: Dict[str, Any]) -> Tuple[Dict[int, int], List[str]]:
+        """Return ({page key: occurrence count}, matched terms) for one clause"""
+        if clause["type"] == "term":
+            term = clause["tokens"][0]
+            return {key: len(positions) for key, positions in self.postings.get(term, {}).items()}, [term]
+
+        if clause["type"] == "prefix":
+            counts: Dict[int, int] = {}
+            terms = self._expand_prefix(clause["tokens"][0])
+            for term in terms:
+                for key, positions in self.postings[term].items():
+                    counts[key] = counts.get(key, 0) + len(positions)
+            return counts, terms
+
+        tokens = clause["tokens"]
+        postings = [self.postings.get(token) for token in tokens]
+        if not all(postings):
+            return {}, tokens
+        # Start from the rarest token's pages and check relative positions
+        candidates = set(min(postings, key=len))
+        for posting in postings:
+            candidates &= posting.keys()
+        counts = {}
+        for key in candidates:
+            starts = set(postings[0][key])
+            for offset, posting in enumerate(postings[1:], start=1):
+                starts &= {position - offset for position in posting[key]}
+                if not starts:
+                    break
+            if starts:
+                counts[key] = len(starts)
+        return counts, tokens
+
+    def search(self, query: str, limit: int = 20) -> Dict[str, Any]:
+        """
+        Run a query and return {"results": [...], "total": int, "elapsed_ms": float}.
+
+        Each result has the document info, "page", "score", "snippet" and
+        "highlights" ((start, end) offsets into the snippet).
+        """
+        started = time.perf_counter()
+        clauses = self.parse_query(query)
+        with self._lock:
+            if not clauses or not self.pages:
+                return {"results": [], "total": 0, "elapsed_ms": 0.0}
+
+            matches = [self._match_clause(clause) for clause in clauses]
+            keys = None
+            for counts, _ in sorted(matches, key=lambda match: len(match[0])):
+                keys = set(counts) if keys is None else keys & counts.keys()
+                if not keys:
+                    break
+            keys = (keys or set()) - self.deleted
+
+            live_pages = max(self.page_count, 1)
+            avg_length = self._total_length / live_pages if self._total_length else 1.0
+            # Document frequencies count live pages only, as deleted ones linger until compaction
+            frequencies = [len(counts.keys() - self.deleted) for counts, _ in matches]
+            idfs = [math.log(1 + (live_pages - frequency + 0.5) / (frequency + 0.5)) for frequency in frequencies]
+            scores = {}
+            for key in keys:
+                norm = self.k1 * (1 - self.b + self.b * self.page_lengths[key] / avg_length)
+                score = 0.0
+                for (counts, _), idf in zip(matches, idfs):
+                    frequency = counts[key]
+                    score += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                scores[key] = score
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            results = []
+            for key, score in ranked:
+                doc_id, page_num = self.pages[key]
+                snippet, highlights = self._snippet(self.page_text[key], clauses, matches)
+                result = dict(self.documents[doc_id]["info"])
+                result.update({"page": page_num, "score": round(score, 4), "snippet": snippet, "highlights": highlights})
+                results.append(result)
+
+        return {
+            "results": results,
+            "total": len(scores),
+            "elapsed_ms": (time.perf_counter() - started) * 1000
+        }
+
+    def _snippet(self, text: str, clauses: List[Dict[str, Any]], matches) -> Tuple[str, List[Tuple[int, int]]]:
+        """Cut a window of text around the first match and locate every highlight in it"""
+        tokens = _tokens_with_offsets(text)
+        words = [token for token, _, _ in tokens]
+        spans = []
+        for clause, (_, terms) in zip(clauses, matches):
+            if clause["type"] == "phrase":
+                size = len(terms)
+                for i in range(len(words) - size + 1):
+                    if words[i:i + size] == terms:
+                        spans.append((tokens[i][1], tokens[i + size - 1][2]))
+            else:
+                wanted = set(terms)
+                spans.extend((start, end) for word, start, end in tokens if word in wanted)
+        spans.sort()
+
+        if not spans:
+            return text[:SNIPPET_CHARS].strip(), []
+        window_start = max(0, spans[0][0] - SNIPPET_CHARS // 3)
+        # Start the window on a word boundary
+        if window_start:
+            space = text.find(" ", window_start)
+            window_start = space + 1 if 0 <= space < spans[0][0] else window_start
+        window_end = min(len(text), window_start + SNIPPET_CHARS)
+        snippet = text[window_start:window_end]
+        highlights = [
+            (start - window_start, end - window_start)
+            for start, end in spans
+            if start >= window_start and end <= window_end
+        ]
+        return snippet, highlights
+
+
+def highlight_snippet(snippet: str, highlights: List[Tuple[int, int]]) -> str:
+    """Render a snippet as HTML with highlighted matches"""
+    parts = []
+    cursor = 0
+    for start, end in highlights:
+        if start < cursor:
+            continue
+        parts.append(html.escape(snippet[cursor:start]))
+        parts.append(f"<mark>{html.escape(snippet[start:end])}</mark>")
+        cursor = end
+    parts.append(html.escape(snippet[cursor:]))
+    return "".join(parts).replace("\n", " ")
\ No newline at end of file
@@ -0,0 +1,267 @@
+# =====================================
+# utils/token_budget.py
+# =====================================
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+# Input tokens allowed for a single Claude request (system prompt + messages)
+PROMPT_TOKEN_BUDGET = int(os.environ.get("MEDGUIDE_PROMPT_TOKEN_BUDGET", 12000))
+# Fixed cost Anthropic adds per request and per message for roles and framing
+REQUEST_OVERHEAD_TOKENS = 8
+MESSAGE_OVERHEAD_TOKENS = 4
+# Number of recent requests kept for estimate vs actual comparison
+USAGE_LOG_SIZE = 200
+
+# Letter runs, digit groups of up to three, single symbols and whitespace runs,
+# each with its leading space - roughly how BPE vocabularies split text
+_PIECE_RE = re.compile(r" ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]|\s+")
+_TRUNCATION_MARK = "\n[...]"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens Claude will count for a piece of text.
+
+    Words are charged one token per five letters, numbers one token per
+    three digits and every symbol one token. This tracks the real count
+    much more closely than a flat characters/4 on clinical text, which is
+    dense with numbers, units and punctuation.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        first = piece[0]
+        if first.isspace() and len(piece) > 1:
+            first = piece[1]
+        if first.isalpha():
+            tokens += (len(piece.strip()) + 4) // 5
+        else:
+            tokens += 1
+    return tokens
+
+
+def _content_text(content: Any) -> str:
+    """Text of a string or a list of content blocks"""
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+def estimate_request_tokens(system: Any, messages: List[Dict[str, Any]]) -> int:
+    """Estimate the input tokens of a Messages API request (system may be a string or content blocks)"""
+    tokens = REQUEST_OVERHEAD_TOKENS + estimate_tokens(_content_text(system))
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(_content_text(message.get("content", "")))
+    return tokens
+
+
+class PromptSection:
+    """A named piece of a prompt with a priority for trimming"""
+    __slots__ = ("name", "text", "priority", "required", "min_tokens", "separator", "tokens")
+
+    def __init__(
+        self,
+        name: str,
+        text: str,
+        priority: int = 0,
+        required: bool = False,
+        min_tokens: int = 0,
+        separator: Optional[str] = None
+    ):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.required = required
+        self.min_tokens = min_tokens
+        self.separator = separator
+        self.tokens = estimate_tokens(self.text)
+
+
+class PromptBuilder:
+    """
+    Fit the sections of a prompt into an input token budget.
+
+    Sections are added with a priority; when the total is over budget the
+    lowest-priority sections are trimmed first. A section with a separator
+    loses whole units from its end (e.g. guideline excerpts), other sections
+    are cut at a line or word boundary. Sections are dropped entirely only
+    when they have no min_tokens floor. Required sections are never touched.
+
+        builder = PromptBuilder(budget=8000)
+        builder.add("instructions", instructions, required=True)
+        builder.add("patient", patient_info, priority=2)
+        builder.add("guideline", excerpts, priority=1, separator="\\n\\n---\\n\\n")
+        prompt = builder.build()
+        prompt["sections"]["patient"]
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, overhead: int = REQUEST_OVERHEAD_TOKENS + MESSAGE_OVERHEAD_TOKENS):
+        self.budget = budget
+        self.overhead = overhead
+        self.sections: List[PromptSection] = []
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False, min_tokens: int = 0, separator: Optional[str] = None) -> PromptSection:
+        section = PromptSection(name, text, priority, required, min_tokens, separator)
+        self.sections.append(section)
+        return section
+
+    @property
+    def tokens(self) -> int:
+        return self.overhead + sum(section.tokens for section in self.sections)
+
+    def remaining(self) -> int:
+        """Tokens still available before anything has to be trimmed"""
+        return self.budget - self.tokens
+
+    def build(self) -> Dict[str, Any]:
+        """
+        Trim sections until the prompt fits and return
+        {"sections": {name: text}, "tokens": int, "budget": int, "trimmed": [names], "dropped": [names]}.
+        """
+        trimmed = []
+        dropped = []
+        excess = self.tokens - self.budget
+        for section in sorted((s for s in self.sections if not s.required), key=lambda s: s.priority):
+            if excess <= 0:
+                break
+            target = max(section.min_tokens, section.tokens - excess)
+            if target <= 0:
+                excess -= section.tokens
+                section.text, section.tokens = "", 0
+                dropped.append(section.name)
+                continue
+            if target >= section.tokens:
+                continue
+            before = section.tokens
+            section.text = _trim_text(section.text, target, section.separator)
+            section.tokens = estimate_tokens(section.text)
+            excess -= before - section.tokens
+            trimmed.append(section.name)
+
+        return {
+            "sections": {section.name: section.text for section in self.sections},
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "trimmed": trimmed,
+            "dropped": dropped
+        }
+
+
+def _trim_text(text: str, target_tokens: int, separator: Optional[str]) -> str:
+    """Shorten text to at most target_tokens estimated tokens"""
+    if separator and separator in text:
+        units = text.split(separator)
+        kept = []
+        used = 0
+        cost = estimate_tokens(separator)
+        for unit in units:
+            unit_tokens = estimate_tokens(unit) + (cost if kept else 0)
+            if used + unit_tokens > target_tokens:
+                break
+            kept.append(unit)
+            used += unit_tokens
+        if kept:
+            return separator.join(kept)
+
+    # Binary search on length, then back off to a line or word boundary
+    target_tokens -= estimate_tokens(_TRUNCATION_MARK)
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= target_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text.rfind("\n", 0, low)
+    if cut < low // 2:
+        cut = text.rfind(" ", 0, low)
+    if cut < low // 2:
+        cut = low
+    return text[:cut].rstrip() + _TRUNCATION_MARK if cut > 0 else ""
+
+
+class TokenUsageLog:
+    """
+    Recent estimated vs actual input tokens per Claude call, for tuning budgets.
+
+    Each record holds the call name, the local estimate, the input and output
+    tokens reported in the response "usage" field, the request latency and,
+    for streamed calls, the time to the first token. With prompt caching the
+    API reports uncached input, cache writes and cache reads separately;
+    input_tokens here is their sum, the full prompt size the estimate is for.
+    """
+
+    def __init__(self, size: int = USAGE_LOG_SIZE):
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        call: str,
+        estimated: int,
+        usage: Optional[Dict[str, Any]],
+        latency: float,
+        time_to_first_token: Optional[float] = None
+    ) -> Dict[str, Any]:
+        usage = usage or {}
+        cache_write = usage.get("cache_creation_input_tokens") or 0
+        cache_read = usage.get("cache_read_input_tokens") or 0
+        input_tokens = usage.get("input_tokens")
+        entry = {
+            "call": call,
+            "estimated_input_tokens": estimated,
+            "input_tokens": input_tokens + cache_write + cache_read if input_tokens is not None else None,
+            "cache_write_tokens": cache_write,
+            "cache_read_tokens": cache_read,
+            "output_tokens": usage.get("output_tokens"),
+            "latency": latency,
+            "time_to_first_token": time_to_first_token
+        }
+        with self._lock:
+            self.records.append(entry)
+        actual = entry["input_tokens"]
+        error = f" ({(estimated - actual) / actual:+.1%})" if actual else ""
+        print(
+            f"Claude {call}: estimated {estimated} input tokens, "
+            f"actual {actual if actual is not None else 'unknown'}{error}, "
+            f"{entry['output_tokens'] if entry['output_tokens'] is not None else 'unknown'} output tokens, "
+            + (f"cache write {cache_write} / read {cache_read}, " if cache_write or cache_read else "")
+            + f"{latency:.2f}s"
+            + (f", first token after {time_to_first_token:.2f}s" if time_to_first_token is not None else "")
+        )
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """Mean estimate/actual ratio, latency and time to first token over the recorded calls"""
+        with self._lock:
+            records = list(self.records)
+        measured = [r for r in records if r["input_tokens"]]
+        streamed = [r for r in records if r["time_to_first_token"] is not None]
+        return {
+            "calls": len(records),
+            "estimate_ratio": (
+                sum(r["estimated_input_tokens"] / r["input_tokens"] for r in measured) / len(measured)
+                if measured else None
+            ),
+            "input_tokens": sum(r["input_tokens"] for r in measured),
+            "output_tokens": sum(r["output_tokens"] or 0 for r in measured),
+            "cache_write_tokens": sum(r["cache_write_tokens"] for r in records),
+            "cache_read_tokens": sum(r["cache_read_tokens"] for r in records),
+            "mean_latency": sum(r["latency"] for r in records) / len(records) if records else None,
+            "mean_time_to_first_token": (
+                sum(r["time_to_first_token"] for r in streamed) / len(streamed)
+                if streamed else None
+            )
+        }
+
+
+_usage_log = TokenUsageLog()
+
+
+def get_token_usage_log() -> TokenUsageLog:
+    """Return the process-wide token usage log"""
+    return _usage_log
\ No newline at end of file
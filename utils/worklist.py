@@ -0,0 +1,203 @@
+# =====================================
+# utils/worklist.py
+# =====================================
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable
+
+from .fhir_client import get_fhir_client
+from .lab_store import get_lab_store
+from .patient_model import Patient, patient_from_fhir
+
+# Schedule file (JSON list of patient ids or {"patient_id": ...} objects) or FHIR search giving the worklist
+WORKLIST_FILE = os.environ.get("MEDGUIDE_WORKLIST_FILE")
+WORKLIST_SEARCH = os.environ.get("MEDGUIDE_WORKLIST_SEARCH")
+# Patients prefetched at once
+WORKLIST_WORKERS = int(os.environ.get("MEDGUIDE_WORKLIST_WORKERS", 4))
+
+
+def load_worklist(path: str) -> List[str]:
+    """Patient ids from a schedule file: a JSON list of ids or of objects with "patient_id" (or "id")"""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    patient_ids = []
+    for entry in entries:
+        patient_id = entry if isinstance(entry, str) else entry.get("patient_id") or entry.get("id")
+        if patient_id and patient_id not in patient_ids:
+            patient_ids.append(str(patient_id))
+    return patient_ids
+
+
+def search_worklist(search: str, fhir_client=None) -> List[str]:
+    """
+    Patient ids from a FHIR search such as "Patient?general-practitioner=Practitioner/12"
+    or "Appointment?date=2025-03-04&practitioner=Practitioner/12", in result order.
+    Patient entries give their id; other resources give the patients they reference.
+    """
+    fhir_client = fhir_client or get_fhir_client()
+    patient_ids: List[str] = []
+
+    def add_reference(reference: Optional[str]):
+        if reference and reference.startswith("Patient/"):
+            patient_id = reference.split("/", 1)[1]
+            if patient_id not in patient_ids:
+                patient_ids.append(patient_id)
+
+    def collect(entry: Dict[str, Any]):
+        resource = entry.get("resource") or {}
+        if resource.get("resourceType") == "Patient":
+            add_reference(f"Patient/{resource.get('id')}")
+            return
+        add_reference((resource.get("subject") or {}).get("reference"))
+        for participant in resource.get("participant") or []:
+            add_reference((participant.get("actor") or participant.get("individual") or {}).get("reference"))
+
+    fhir_client.search(f"/{search.lstrip('/')}", on_entry=collect)
+    return patient_ids
+
+
+class WorklistEntry:
+    __slots__ = ("patient_id", "status", "patient", "resource", "error", "seconds", "future")
+
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self.status = "pending"
+        self.patient: Optional[Patient] = None
+        self.resource: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.future: Optional[Future] = None
+
+
+class Worklist:
+    """
+    A clinician's patient panel, prefetched so switching patients is instant.
+
+    prefetch() loads every patient on a bounded thread pool: the FHIR
+    resource (into the shared FhirClient cache), a lab history sync, the
+    Patient projection with its lab trends and, through the warm callback,
+    anything else worth having hot for the patient (e.g. the retrieval
+    indexes of the guidelines for their conditions). switch_to() then only
+    reads those caches. Switching to a patient still being prefetched waits
+    for that fetch instead of starting another.
+    """
+
+    def __init__(
+        self,
+        patient_ids: List[str],
+        fhir_client=None,
+        lab_store=None,
+        warm: Optional[Callable[[Patient], None]] = None,
+        workers: int = WORKLIST_WORKERS
+    ):
+        self.fhir_client = fhir_client or get_fhir_client()
+        self.lab_store = lab_store or get_lab_store()
+        self.warm = warm
+        self.entries: Dict[str, WorklistEntry] = {patient_id: WorklistEntry(patient_id) for patient_id in patient_ids}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="medguide-worklist")
+        self._lock = threading.Lock()
+
+    @property
+    def patient_ids(self) -> List[str]:
+        return list(self.entries)
+
+    def prefetch(self) -> None:
+        """Start loading every patient not yet loaded; returns immediately"""
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+            for entry in self.entries.values():
+                if entry.future is None or entry.status == "failed":
+                    entry.status = "pending"
+                    entry.future = self._executor.submit(self._load, entry)
+
+    def _load(self, entry: WorklistEntry) -> None:
+        started = time.perf_counter()
+        try:
+            resource = self.fhir_client.get_patient(entry.patient_id)
+            if resource is None:
+                raise LookupError(self.fhir_client.last_error or "patient not found")
+            patient = patient_from_fhir(resource, lab_trends=self.lab_store.trend_lines(entry.patient_id))
+            if self.warm is not None:
+                try:
+                    self.warm(patient)
+                except Exception as e:
+                    print(f"Worklist warm-up error for patient {entry.patient_id}: {e}")
+            entry.resource, entry.patient, entry.status = resource, patient, "ready"
+        except Exception as e:
+            entry.error, entry.status = str(e), "failed"
+            print(f"Worklist prefetch error for patient {entry.patient_id}: {e}")
+        entry.seconds = time.perf_counter() - started
+        with self._lock:
+            if all(other.status != "pending" for other in self.entries.values()):
+                self.finished = time.perf_counter()
+
+    def switch_to(self, patient_id: str, timeout: Optional[float] = None):
+        """
+        Return (Patient, FHIR resource) for a worklist patient, or (None, None)
+        if it could not be loaded. Reads the caches filled by prefetch, so
+        a newer version picked up by background revalidation is used.
+        """
+        entry = self.entries.get(patient_id)
+        if entry is None:
+            return None, None
+        if entry.future is None:
+            self.prefetch()
+        entry.future.result(timeout=timeout)
+        if entry.status != "ready":
+            return None, None
+        resource = self.fhir_client.get_patient(patient_id) or entry.resource
+        patient = patient_from_fhir(resource, lab_trends=self.lab_store.trend_lines(patient_id, sync=False))
+        return patient, resource
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Per patient: id, name once loaded, status, load seconds and error"""
+        return [
+            {
+                "patient_id": entry.patient_id,
+                "name": entry.patient.name if entry.patient is not None else entry.patient_id,
+                "status": entry.status,
+                "seconds": entry.seconds,
+                "error": entry.error
+            }
+            for entry in self.entries.values()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return patients ready, failed and pending, and the prefetch wall time once finished"""
+        statuses = [entry.status for entry in self.entries.values()]
+        return {
+            "patients": len(statuses),
+            "ready": statuses.count("ready"),
+            "failed": statuses.count("failed"),
+            "pending": statuses.count("pending"),
+            "prefetch_seconds": self.finished - self.started if self.finished and self.started else None
+        }
+
+
+_worklist_instance: Optional[Worklist] = None
+_worklist_lock = threading.Lock()
+
+
+def get_worklist(warm: Optional[Callable[[Patient], None]] = None) -> Optional[Worklist]:
+    """
+    Return the process-wide worklist from MEDGUIDE_WORKLIST_FILE or
+    MEDGUIDE_WORKLIST_SEARCH, prefetching it on first use; None if neither
+    is set or the worklist can't be read. warm is used when it is created.
+    """
+    global _worklist_instance
+    with _worklist_lock:
+        if _worklist_instance is None and (WORKLIST_FILE or WORKLIST_SEARCH):
+            try:
+                patient_ids = load_worklist(WORKLIST_FILE) if WORKLIST_FILE else search_worklist(WORKLIST_SEARCH)
+            except Exception as e:
+                print(f"Could not load the worklist: {e}")
+                return None
+            _worklist_instance = Worklist(patient_ids, warm=warm)
+            _worklist_instance.prefetch()
+        return _worklist_instance
\ No newline at end of file